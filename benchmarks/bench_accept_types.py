@@ -0,0 +1,68 @@
+"""
+Latency of querying a wide numeric dataset and decoding the result for the JSON and CSV accept
+types, uncompressed and compressed using gzip and lz4, against a stub server running in a separate
+process. Also shows the cost of falling back from an accept type that the server does not support.
+
+lz4 requires the lz4 package. Note that the localhost connection is far faster than a real
+network, which favours uncompressed results.
+
+Run from the repository root: python -m benchmarks.bench_accept_types
+"""
+import json
+import random
+import time
+
+import requests
+
+from qclient import QClient
+from qclient.decoding import lz4_available
+from benchmarks.stub_server import StubProcess, print_percentiles
+
+ROW_COUNT = 2000
+COLUMN_COUNT = 50
+REQUEST_COUNT = 50
+
+
+def durations(client, accept, decode):
+    result = []
+    for _ in range(REQUEST_COUNT):
+        t0 = time.time()
+        query_result = client.get('key', {}, accept=accept)
+        if decode:
+            query_result.decode()
+        result.append(time.time() - t0)
+    return result
+
+
+def received_size(url, accept, accept_encoding):
+    response = requests.get(url + '/qcache/dataset/key', params={'q': '{}'}, stream=True,
+                            headers={'Accept': accept, 'Accept-Encoding': accept_encoding})
+    return len(response.raw.read(decode_content=False))
+
+
+def main():
+    stub = StubProcess(compress=True)
+    rows = [dict(('column{i}'.format(i=i), random.random()) for i in range(COLUMN_COUNT)) for _ in range(ROW_COUNT)]
+    client = QClient([stub.url], trust_env=False)
+    client.post('key', json.dumps(rows), content_type='application/json')
+
+    encodings = [['identity'], ['gzip']] + ([['lz4']] if lz4_available() else [])
+    print('{rows} rows, {columns} float columns'.format(rows=ROW_COUNT, columns=COLUMN_COUNT))
+    for accept in ('application/json', 'text/csv', ['application/x-unsupported', 'application/json']):
+        for accept_encoding in encodings:
+            client = QClient([stub.url], trust_env=False, accept_encoding=accept_encoding)
+            title = '{accept}, {encoding}'.format(accept=accept if isinstance(accept, str) else 'fallback',
+                                                  encoding=accept_encoding[0])
+            # Warm up, the stub encodes the result on the first query
+            client.get('key', {}, accept=accept)
+            print_percentiles(title + ' get', durations(client, accept, decode=False))
+            print_percentiles(title + ' get + decode', durations(client, accept, decode=True))
+            print('{title:<30} {size} bytes received'.format(
+                title='', size=received_size(stub.url, accept if isinstance(accept, str) else accept[-1],
+                                             client.accept_encoding)))
+
+    stub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Latency of executing batches of queries one by one using get, using get_many without pipelining,
+which queries the nodes in parallel, and using get_many with queries to the same node pipelined.
+Runs against three stub servers in separate processes that add a simulated network round trip
+to every request that is not pipelined.
+
+Run from the repository root: python -m benchmarks.bench_get_many
+"""
+import time
+
+from qclient import QClient
+from benchmarks.stub_server import StubProcess, print_percentiles
+
+NODE_COUNT = 3
+RTT = 0.002
+KEY_COUNT = 100
+REPETITIONS = 50
+
+
+def durations(client, queries, fn):
+    result = []
+    for _ in range(REPETITIONS):
+        t0 = time.time()
+        fn(client, queries)
+        result.append(time.time() - t0)
+    return result
+
+
+def one_by_one(client, queries):
+    return [client.get(key, q) for key, q in queries]
+
+
+def main():
+    stubs = [StubProcess(rtt=RTT) for _ in range(NODE_COUNT)]
+    client = QClient([stub.url for stub in stubs], trust_env=False)
+    for i in range(KEY_COUNT):
+        client.post('key{i}'.format(i=i), '[{"foo": 1}]', content_type='application/json')
+
+    print('simulated round trip time {rtt:.1f}ms, {nodes} nodes'.format(rtt=1000 * RTT, nodes=NODE_COUNT))
+    for batch_size in (10, 100):
+        queries = [('key{i}'.format(i=i), {'limit': 1}) for i in range(batch_size)]
+        print('batches of {size} queries'.format(size=batch_size))
+        for title, fn in (('get', one_by_one),
+                          ('get_many, not pipelined', lambda c, qs: c.get_many(qs, pipeline=False)),
+                          ('get_many, pipelined', lambda c, qs: c.get_many(qs))):
+            client = QClient([stub.url for stub in stubs], trust_env=False)
+            fn(client, queries)
+            print_percentiles(title, durations(client, queries, fn))
+            client.close()
+
+    for stub in stubs:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
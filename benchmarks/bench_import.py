@@ -0,0 +1,61 @@
+"""
+Import time of the package, measured using python -X importtime in fresh processes, with and
+without touching the client. Pass --max-import-ms to fail if a plain import of the package
+takes longer than that, eg. in CI to guard against regressions.
+
+Run from the repository root: python -m benchmarks.bench_import [--max-import-ms 5]
+"""
+import argparse
+import subprocess
+import sys
+
+RUN_COUNT = 20
+
+STATEMENTS = (('import qclient', 'import qclient'),
+              ('import qclient, use client', 'import qclient; qclient.QClient'))
+
+
+def import_time(statement):
+    """
+    :return: Total number of seconds spent importing modules not imported during interpreter startup.
+    """
+    output = subprocess.check_output([sys.executable, '-X', 'importtime', '-c', statement],
+                                     stderr=subprocess.STDOUT).decode('utf-8')
+    total = 0
+    startup_done = False
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        _, cumulative, name = line.split('|')
+        if name.startswith('  '):
+            # Nested imports are included in the cumulative time of the top level import
+            continue
+
+        if startup_done:
+            total += int(cumulative)
+        elif name.strip() == 'site':
+            startup_done = True
+
+    return total / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--max-import-ms', type=float, default=None)
+    args = parser.parse_args()
+
+    medians = {}
+    for title, statement in STATEMENTS:
+        durations = sorted(import_time(statement) for _ in range(RUN_COUNT))
+        medians[statement] = durations[len(durations) // 2]
+        print('{title:<30} median {median:.1f}ms, min {min:.1f}ms'.format(
+            title=title, median=1000 * medians[statement], min=1000 * durations[0]))
+
+    if args.max_import_ms is not None and 1000 * medians['import qclient'] > args.max_import_ms:
+        print('Import time above {limit}ms'.format(limit=args.max_import_ms))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
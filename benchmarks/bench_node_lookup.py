@@ -0,0 +1,31 @@
+"""
+Time per key to node lookup in the node ring with and without memoization, for a small set
+of hot keys looked up over and over and for keys that are never repeated.
+
+Run from the repository root: python -m benchmarks.bench_node_lookup
+"""
+import timeit
+
+from qclient.node_ring import NodeRing
+
+NODES = ['http://qcache{i}:9401'.format(i=i) for i in range(5)]
+LOOKUP_COUNT = 100000
+
+
+def per_lookup(ring, keys):
+    ring.get_node('warm up')
+    return min(timeit.repeat(lambda: [ring.get_node(key) for key in keys], number=1, repeat=5)) / len(keys)
+
+
+def main():
+    hot_keys = ['dataset-{i}'.format(i=i % 100) for i in range(LOOKUP_COUNT)]
+    unique_keys = ['dataset-{i}'.format(i=i) for i in range(LOOKUP_COUNT)]
+    for title, keys in (('100 hot keys', hot_keys), ('unique keys', unique_keys)):
+        plain = per_lookup(NodeRing(NODES, memo_size=0), keys)
+        memoized = per_lookup(NodeRing(NODES), keys)
+        print('{title:<15} plain {plain:.2f}us, memoized {memoized:.2f}us per lookup'.format(
+            title=title, plain=1e6 * plain, memoized=1e6 * memoized))
+
+
+if __name__ == '__main__':
+    main()
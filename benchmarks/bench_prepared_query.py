@@ -0,0 +1,82 @@
+"""
+Client side CPU time per request for regular and prepared queries.
+
+The cost of encoding the query is measured in isolation, both on its own, serializing to JSON and
+URL encoding versus binding a prepared query, and including the preparation of the request by
+requests. It is then compared to the CPU time of complete requests against a stub server running
+in a separate process. Note that the client executes the larger queries using POST rather than GET.
+
+Run from the repository root: python -m benchmarks.bench_prepared_query
+"""
+import json
+import time
+
+try:
+    from urllib.parse import urlencode
+except ImportError:
+    from urllib import urlencode
+
+import requests
+
+from qclient import Param, PreparedQuery, QClient
+from benchmarks.stub_server import StubProcess
+
+REQUEST_COUNT = 2000
+
+
+def cpu_per_request(fn):
+    t0 = time.process_time()
+    for i in range(REQUEST_COUNT):
+        fn(i % 10)
+    return (time.process_time() - t0) / REQUEST_COUNT
+
+
+def print_cpu(title, regular, prepared):
+    print('  {title:<18} regular {regular:>7.1f}us, prepared {prepared:>7.1f}us, saved {saved:>7.1f}us'.format(
+        title=title, regular=regular * 1e6, prepared=prepared * 1e6, saved=(regular - prepared) * 1e6))
+
+
+def main():
+    stub = StubProcess()
+    requests.post(stub.url + '/qcache/dataset/key', data='[]', headers={'Content-Type': 'application/json'})
+    client = QClient([stub.url], trust_env=False)
+    url = stub.url + '/qcache/dataset/key'
+
+    for size in (1, 10, 100, 1000):
+        values = ['value{0}'.format(i) for i in range(size)]
+        q = {'select': ['foo', 'bar'], 'where': ['&', ['==', 'foo', 0], ['in', 'bar', values]], 'limit': 10}
+        prepared = PreparedQuery({'select': ['foo', 'bar'],
+                                  'where': ['&', ['==', 'foo', Param('foo')], ['in', 'bar', values]],
+                                  'limit': 10})
+
+        def regular_encode(i):
+            q['where'][1][2] = i
+            urlencode({'q': json.dumps(q)})
+
+        def prepared_encode(i):
+            prepared.bind(foo=i).query_string
+
+        def regular_prepare(i):
+            q['where'][1][2] = i
+            requests.Request('GET', url, params={'q': json.dumps(q)}).prepare()
+
+        def prepared_prepare(i):
+            requests.Request('GET', url, params=prepared.bind(foo=i).query_string).prepare()
+
+        def regular_request(i):
+            q['where'][1][2] = i
+            client.get('key', q)
+
+        def prepared_request(i):
+            client.get('key', prepared.bind(foo=i))
+
+        print('in-list size {size}:'.format(size=size))
+        print_cpu('encoding', cpu_per_request(regular_encode), cpu_per_request(prepared_encode))
+        print_cpu('prepared request', cpu_per_request(regular_prepare), cpu_per_request(prepared_prepare))
+        print_cpu('complete request', cpu_per_request(regular_request), cpu_per_request(prepared_request))
+
+    stub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Latency of queries with growing in-lists executed using GET, POST and automatic method
+selection against a stub server running in a separate process. The stub rejects URLs longer
+than 8 kB, like many servers and proxies do by default.
+
+Run from the repository root: python -m benchmarks.bench_query_method
+"""
+import time
+
+import requests
+
+from qclient import QClient, UnexpectedServerResponse
+from benchmarks.stub_server import StubProcess, print_percentiles
+
+REQUEST_COUNT = 500
+MAX_URL_LENGTH = 8192
+
+
+def durations(client, q, post_query):
+    result = []
+    for _ in range(REQUEST_COUNT):
+        t0 = time.time()
+        try:
+            client.get('key', q, post_query=post_query)
+        except UnexpectedServerResponse:
+            return None
+        result.append(time.time() - t0)
+    return result
+
+
+def main():
+    stub = StubProcess(max_url_length=MAX_URL_LENGTH)
+    requests.post(stub.url + '/qcache/dataset/key', data='[]', headers={'Content-Type': 'application/json'})
+
+    for size in (1, 10, 100, 1000, 10000):
+        q = {'select': ['foo'], 'where': ['in', 'foo', ['value{0}'.format(i) for i in range(size)]], 'limit': 10}
+        print('in-list size {size}, {length} characters'.format(size=size, length=len(str(q))))
+        for title, post_query in (('GET', False), ('POST', True), ('auto', None)):
+            client = QClient([stub.url], trust_env=False)
+            result = durations(client, q, post_query)
+            if result is None:
+                print('{title:<30} rejected as too long'.format(title=title))
+            else:
+                print_percentiles(title, result)
+
+    stub.stop()
+
+
+if __name__ == '__main__':
+    main()
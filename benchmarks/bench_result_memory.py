@@ -0,0 +1,53 @@
+"""
+Memory allocated on the get path and retained per QueryResult for small results, traced using
+tracemalloc, against a stub server running in a separate process.
+
+Run from the repository root: python -m benchmarks.bench_result_memory
+"""
+import gc
+import time
+import tracemalloc
+
+from qclient import QClient
+from benchmarks.stub_server import StubProcess
+
+REQUEST_COUNT = 2000
+TOP_COUNT = 8
+
+
+def main():
+    stub = StubProcess()
+    client = QClient([stub.url], trust_env=False)
+    client.post('key', '[{"foo": 1, "bar": 2.5}]', content_type='application/json')
+    q = {'select': ['foo', 'bar'], 'limit': 1}
+    for _ in range(100):
+        client.get('key', q)
+
+    t0 = time.time()
+    for _ in range(REQUEST_COUNT):
+        client.get('key', q)
+    duration = time.time() - t0
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    results = [client.get('key', q) for _ in range(REQUEST_COUNT)]
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    retained = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    print('{count} gets, {duration:.3f}ms per get'.format(count=REQUEST_COUNT, duration=1000 * duration / REQUEST_COUNT))
+    print('retained {size:.0f} bytes per result, peak traced memory {peak:.0f} kB'.format(
+        size=float(retained) / len(results), peak=peak / 1024.0))
+    print('statistics of first result: {stats}'.format(stats=results[0].statistics))
+
+    print('top retaining lines:')
+    for stat in after.compare_to(before, 'lineno')[:TOP_COUNT]:
+        print('  {stat}'.format(stat=stat))
+
+    stub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Compare tail latencies of hash routing and latency aware routing against three stub nodes
+where one of them is consistently slow. All datasets are stored on all nodes so that any node
+can serve any key.
+
+Run from the repository root: python -m benchmarks.bench_routing
+"""
+import json
+import threading
+
+import requests
+
+from qclient import QClient
+from qclient.latency import clock
+from qclient.routing import HashRouting, LeastLoadedRouting
+from benchmarks.stub_server import StubProcess, print_percentiles
+
+KEY_COUNT = 100
+THREAD_COUNT = 4
+QUERIES_PER_THREAD = 500
+
+
+def run(nodes, policy):
+    client = QClient(nodes, routing_policy=policy, trust_env=False)
+    durations = []
+
+    def worker(thread_index):
+        for i in range(QUERIES_PER_THREAD):
+            key = 'key{0}'.format((thread_index * QUERIES_PER_THREAD + i) % KEY_COUNT)
+            t0 = clock()
+            assert client.get(key, {}) is not None
+            durations.append(clock() - t0)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(THREAD_COUNT)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return durations
+
+
+def main():
+    stubs = [StubProcess(delay=0.001), StubProcess(delay=0.001), StubProcess(delay=0.02)]
+    content = json.dumps([{'foo': i} for i in range(10)])
+    for stub in stubs:
+        for i in range(KEY_COUNT):
+            requests.post('{url}/qcache/dataset/key{i}'.format(url=stub.url, i=i), data=content,
+                          headers={'Content-Type': 'application/json'})
+
+    nodes = [stub.url for stub in stubs]
+    print_percentiles('HashRouting', run(nodes, HashRouting()))
+    print_percentiles('LeastLoadedRouting(2)', run(nodes, LeastLoadedRouting(candidate_count=2)))
+    print_percentiles('LeastLoadedRouting(3)', run(nodes, LeastLoadedRouting(candidate_count=3)))
+
+    for stub in stubs:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
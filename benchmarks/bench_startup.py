@@ -0,0 +1,70 @@
+"""
+Startup cost of short lived processes: import of qclient, client construction and the first
+query against a stub server running in a separate process, with and without a precomputed
+ring snapshot. Also measures constructing many clients with the same nodes in one process,
+eg. one client per tenant.
+
+Run from the repository root: python -m benchmarks.bench_startup
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from qclient import NodeRing, QClient
+from benchmarks.stub_server import StubProcess
+
+PROCESS_COUNT = 20
+CLIENT_COUNT = 1000
+NODE_COUNT = 5
+
+CHILD = """
+import json, sys, time
+t0 = time.time()
+from qclient import QClient
+t1 = time.time()
+snapshot = json.load(open(sys.argv[2])) if len(sys.argv) > 2 else None
+client = QClient(sys.argv[1].split(','), ring_snapshot=snapshot, trust_env=False)
+t2 = time.time()
+client.get('key', {'limit': 1})
+t3 = time.time()
+print(json.dumps([t1 - t0, t2 - t1, t3 - t2]))
+"""
+
+
+def run_children(nodes, snapshot_path=None):
+    args = [sys.executable, '-c', CHILD, ','.join(nodes)] + ([snapshot_path] if snapshot_path else [])
+    timings = [json.loads(subprocess.check_output(args).decode('utf-8')) for _ in range(PROCESS_COUNT)]
+    return [sorted(column)[len(column) // 2] for column in zip(*timings)]
+
+
+def main():
+    stub = StubProcess()
+    nodes = [stub.url + '/{i}'.format(i=i) for i in range(NODE_COUNT)]
+    for node in nodes:
+        requests.post(node + '/qcache/dataset/key', data='[]', headers={'Content-Type': 'application/json'})
+
+    snapshot_path = os.path.join(tempfile.mkdtemp(), 'ring.json')
+    with open(snapshot_path, 'w') as f:
+        json.dump(NodeRing(nodes).snapshot(), f)
+
+    for title, path in (('built ring', None), ('ring snapshot', snapshot_path)):
+        import_time, construct_time, query_time = run_children(nodes, path)
+        print('{title:<15} median import {i:.1f}ms, construct {c:.2f}ms, first query {q:.2f}ms'.format(
+            title=title, i=1000 * import_time, c=1000 * construct_time, q=1000 * query_time))
+
+    t0 = time.time()
+    for _ in range(CLIENT_COUNT):
+        QClient(nodes).node_ring.get_node('key')
+    print('{count} clients with the same nodes: {duration:.3f}ms per client'.format(
+        count=CLIENT_COUNT, duration=1000 * (time.time() - t0) / CLIENT_COUNT))
+
+    stub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,313 @@
+"""
+Minimal in-memory stand in for a QCache server, used for benchmarking the client without
+the cost and noise of a real QCache instance.
+
+Datasets are stored as uploaded. Queries only apply "offset" and "limit" to JSON datasets,
+other query clauses are ignored. Results are converted between JSON and CSV as requested by the
+Accept header. Compression using lz4, if installed, or gzip according to the Accept-Encoding header
+can be enabled.
+"""
+import csv
+import io
+import json
+import random
+import select
+import threading
+import time
+import zlib
+
+try:
+    import lz4.block
+except ImportError:
+    lz4 = None
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlparse
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlparse
+
+DATASET_PREFIX = '/qcache/dataset/'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, code, body=b'', headers=None):
+        self.send_response(code)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def _key(self, path):
+        key = path[len(DATASET_PREFIX):]
+        return key[:-2] if key.endswith('/q') else key
+
+    def _query(self, key, q):
+        dataset = self.server.datasets.get(key)
+        if dataset is None:
+            return self._send(404)
+
+        content_type, content = dataset
+        accept = self.headers.get('Accept', '*/*')
+        if accept == '*/*':
+            accept = content_type
+        if accept not in ('application/json', 'text/csv'):
+            return self._send(406)
+
+        # Encoding large results is far slower than in QCache, reuse them to measure the client
+        result_key = (key, accept, self.headers.get('Accept-Encoding'), json.dumps(q, sort_keys=True))
+        result = self.server.results.get(result_key)
+        if result is None:
+            result = self._result(content_type, content, accept, q)
+            self.server.results[result_key] = result
+
+        self._send(200, *result)
+
+    def _result(self, content_type, content, accept, q):
+        if content_type == 'application/json':
+            rows = json.loads(content.decode('utf-8'))
+            offset = q.get('offset', 0)
+            sliced = rows[offset:offset + q['limit']] if 'limit' in q else rows[offset:]
+            body = json.dumps(sliced).encode('utf-8') if accept == content_type else _to_csv(sliced)
+            length = len(rows)
+        else:
+            body = content if accept == content_type else json.dumps(_from_csv(content)).encode('utf-8')
+            length = content.count(b'\n')
+
+        headers = {'Content-Type': accept,
+                   'X-QCache-unsliced-length': str(length),
+                   'X-QCache-stats': 'query_duration=0.0001'}
+        if self.server.stub.compress:
+            body = self._compress(body, headers)
+
+        return body, headers
+
+    def _compress(self, body, headers):
+        encodings = [encoding.strip() for encoding in self.headers.get('Accept-Encoding', '').split(',')]
+        if 'lz4' in encodings and lz4 is not None:
+            headers['Content-Encoding'] = 'lz4'
+            return lz4.block.compress(body)
+
+        if 'gzip' in encodings:
+            headers['Content-Encoding'] = 'gzip'
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            return compressor.compress(body) + compressor.flush()
+
+        return body
+
+    def _delay(self):
+        self.server.stub.simulate_latency()
+
+    def _fixed_status(self):
+        status = self.server.stub.fixed_status
+        if status is not None:
+            self._read_body()
+            self._send(status)
+        return status is not None
+
+    def do_GET(self):
+        self._delay()
+        url = urlparse(self.path)
+        if url.path == '/qcache/status':
+            return self._send(200, b'OK')
+
+        if self._fixed_status():
+            return
+
+        max_url_length = self.server.stub.max_url_length
+        if max_url_length is not None and len(self.path) > max_url_length:
+            return self._send(414)
+
+        q = json.loads(parse_qs(url.query).get('q', ['{}'])[0])
+        self._query(self._key(url.path), q)
+
+    def do_POST(self):
+        self._delay()
+        if self._fixed_status():
+            return
+
+        path = urlparse(self.path).path
+        body = self._read_body()
+        if path.endswith('/q'):
+            return self._query(self._key(path), json.loads(body.decode('utf-8')))
+
+        self.server.datasets[self._key(path)] = (self.headers.get('Content-Type', 'text/csv'), body)
+        self.server.results.clear()
+        self._send(201, headers={'X-QCache-stats': 'parse_duration=0.0001'})
+
+    def do_DELETE(self):
+        self._delay()
+        self.server.datasets.pop(self._key(urlparse(self.path).path), None)
+        self.server.results.clear()
+        self._send(200)
+
+
+def _to_csv(rows):
+    output = io.StringIO()
+    if rows:
+        writer = csv.DictWriter(output, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    return output.getvalue().encode('utf-8')
+
+
+def _from_csv(content):
+    return list(csv.DictReader(io.StringIO(content.decode('utf-8'))))
+
+
+class _RTTHandler(_Handler):
+    """
+    Handler simulating network round trips. A request pays one round trip unless it had already
+    been sent when the response to the previous request on the connection was written, ie. it
+    was pipelined.
+    """
+    # Unbuffered to be able to tell if the next request is waiting on the socket
+    rbufsize = 0
+
+    def setup(self):
+        _Handler.setup(self)
+        self._pipelined = False
+
+    def handle_one_request(self):
+        _Handler.handle_one_request(self)
+        if not self.close_connection:
+            self._pipelined = bool(select.select([self.connection], [], [], 0)[0])
+
+    def _delay(self):
+        if not self._pipelined:
+            time.sleep(self.server.stub.rtt)
+        _Handler._delay(self)
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def handle_error(self, request, client_address):
+        # Clients giving up on requests, eg. because of timeouts, are expected
+        pass
+
+
+class StubQCache(object):
+    """
+    Stub QCache server running in a background thread.
+
+    :param port: Port to listen to, 0 picks a free port.
+    :param delay: Fixed number of seconds added to each request.
+    :param stall_probability: Probability that a request is stalled an additional stall_time seconds,
+                              used to mimic GC pauses and other hiccups.
+    :param stall_time: Seconds to stall a request.
+    :param max_url_length: Respond with 414 to GETs with URLs longer than this.
+    :param rtt: Simulated network round trip time in seconds, see _RTTHandler.
+    :param compress: If set query results are compressed if the client accepts it.
+    :param fixed_status: If set dataset requests are answered with this status, eg. 503 to mimic an overloaded node.
+    """
+    def __init__(self, port=0, delay=0.0, stall_probability=0.0, stall_time=0.0, max_url_length=None, rtt=0.0,
+                 compress=False, fixed_status=None):
+        self.delay = delay
+        self.stall_probability = stall_probability
+        self.stall_time = stall_time
+        self.max_url_length = max_url_length
+        self.rtt = rtt
+        self.compress = compress
+        self.fixed_status = fixed_status
+        self._server = _Server(('127.0.0.1', port), _RTTHandler if rtt else _Handler)
+        self._server.stub = self
+        self._server.datasets = {}
+        self._server.results = {}
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{port}'.format(port=self._server.server_address[1])
+
+    @property
+    def datasets(self):
+        return self._server.datasets
+
+    def simulate_latency(self):
+        delay = self.delay
+        if self.stall_probability and random.random() < self.stall_probability:
+            delay += self.stall_time
+
+        if delay:
+            time.sleep(delay)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def percentiles(durations, points=(50, 90, 99, 99.9)):
+    ordered = sorted(durations)
+    return [(p, ordered[min(len(ordered) - 1, int(len(ordered) * p / 100.0))]) for p in points]
+
+
+def print_percentiles(title, durations):
+    print('{title:<30} '.format(title=title) +
+          ' '.join('p{p}={value:.2f}ms'.format(p=p, value=1000 * value) for p, value in percentiles(durations)))
+
+
+def _serve(connection, kwargs):
+    stub = StubQCache(**kwargs)
+    connection.send(stub.url)
+    stub._server.serve_forever()
+
+
+class StubProcess(object):
+    """
+    Stub QCache server running in a separate process to avoid competing with the client for the GIL.
+    Accepts the same arguments as StubQCache. Datasets have to be uploaded over HTTP.
+    """
+    def __init__(self, **kwargs):
+        import multiprocessing
+        parent_connection, child_connection = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_serve, args=(child_connection, kwargs))
+        self._process.daemon = True
+        self._process.start()
+        self.url = parent_connection.recv()
+
+    def stop(self):
+        self._process.terminate()
+        self._process.join()
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.stub_server',
+                                     description='Run a stub QCache server, eg. as target for qclient-bench.')
+    parser.add_argument('--port', type=int, default=9401)
+    parser.add_argument('--delay', type=float, default=0.0, help='Seconds added to each request')
+    parser.add_argument('--rtt', type=float, default=0.0, help='Simulated network round trip time in seconds')
+    parser.add_argument('--compress', action='store_true', help='Compress results if accepted by the client')
+    args = parser.parse_args()
+
+    stub = StubQCache(port=args.port, delay=args.delay, rtt=args.rtt, compress=args.compress)
+    print('Serving on {url}'.format(url=stub.url))
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+"""
+Analysis of key placement for capacity planning. Reports how evenly a sample of keys is spread
+over the nodes, how many keys move when nodes are removed or added and what the ring costs in
+memory and lookup time, for plain consistent hashing and bounded load placement.
+
+Run as a script for a quick report:
+
+    python -m qclient.analysis http://host1:9401 http://host2:9401 --weight http://host2:9401=2
+"""
+import argparse
+from collections import defaultdict
+import math
+import sys
+import timeit
+
+from qclient.latency import clock
+from qclient.node_ring import NodeRing, _shared_rings, _shared_rings_lock
+from qclient.routing import BoundedLoadRouting
+
+STRATEGIES = ('ring', 'bounded')
+ADDED_NODE = '<added node>'
+
+
+def sample_keys(count):
+    return ['dataset-{i}'.format(i=i) for i in range(count)]
+
+
+def placement(strategy, nodes, keys, weights=None, virtual_count=None, epsilon=0.25):
+    """
+    :return: dict with the node that each key is placed on by strategy, all keys assumed to be of equal size.
+    """
+    ring = NodeRing(nodes, weights, virtual_count)
+    if strategy == 'ring':
+        return dict((key, ring.get_node(key)) for key in keys)
+
+    if strategy == 'bounded':
+        policy = BoundedLoadRouting(epsilon=epsilon, max_tracked_keys=len(keys))
+        return dict((key, policy.place(ring, key, 1)) for key in keys)
+
+    raise ValueError('Unknown strategy: {strategy}'.format(strategy=strategy))
+
+
+def balance(assignment, nodes, weights=None):
+    """
+    :return: dict with the fraction of keys placed on each node and statistics on the ratio between the
+             number of keys placed on a node and its fair share according to its weight.
+    """
+    weights = weights or {}
+    counts = defaultdict(int)
+    for node in assignment.values():
+        counts[node] += 1
+
+    total_weight = float(sum(weights.get(node, 1) for node in nodes))
+    key_count = float(len(assignment))
+    ratios = [counts[node] / (key_count * weights.get(node, 1) / total_weight) for node in nodes]
+    mean = sum(ratios) / len(ratios)
+    return {'shares': dict((node, counts[node] / key_count) for node in nodes),
+            'max_load_ratio': max(ratios),
+            'min_load_ratio': min(ratios),
+            'load_ratio_stddev': math.sqrt(sum((r - mean) ** 2 for r in ratios) / len(ratios))}
+
+
+def moved_fraction(before, after):
+    """
+    :return: Fraction of keys placed on different nodes in before and after.
+    """
+    return sum(1 for key, node in before.items() if after[key] != node) / float(len(before))
+
+
+def movement(strategy, nodes, keys, weights=None, virtual_count=None, epsilon=0.25):
+    """
+    :return: dict with the fraction of keys moved when each node is removed, and when a node is added,
+             together with the ideal fraction to move, the fair share of the removed or added node.
+    """
+    weights = weights or {}
+    before = placement(strategy, nodes, keys, weights, virtual_count, epsilon)
+    total_weight = float(sum(weights.get(node, 1) for node in nodes))
+    virtual_count = virtual_count or int(math.ceil(1000.0 / len(nodes)))
+
+    removed = {}
+    for node in nodes:
+        if len(nodes) > 1:
+            remaining = [n for n in nodes if n != node]
+            after = placement(strategy, remaining, keys, weights, virtual_count, epsilon)
+            removed[node] = {'moved': moved_fraction(before, after),
+                             'ideal': weights.get(node, 1) / total_weight}
+
+    after = placement(strategy, list(nodes) + [ADDED_NODE], keys, weights, virtual_count, epsilon)
+    added = {'moved': moved_fraction(before, after), 'ideal': 1 / (total_weight + 1)}
+    return {'removed': removed, 'added': added}
+
+
+def ring_cost(nodes, weights=None, virtual_count=None, lookup_count=10000):
+    """
+    :return: dict with the number of virtual nodes, the approximate memory used by the ring in bytes,
+             the time to build it and the mean time of a lookup without memoization, both in seconds.
+    """
+    ring = NodeRing(nodes, weights, virtual_count, memo_size=0)
+    with _shared_rings_lock:
+        # Measure an actual build rather than reuse of an already built ring
+        _shared_rings.pop(ring._config(), None)
+
+    t0 = clock()
+    ring._build()
+    build_time = clock() - t0
+
+    memory = (sys.getsizeof(ring.ring) + sys.getsizeof(ring.sorted_keys) +
+              sum(sys.getsizeof(key) for key in ring.sorted_keys))
+    keys = sample_keys(lookup_count)
+    lookup_time = min(timeit.repeat(lambda: [ring.get_node(key) for key in keys], number=1, repeat=3)) / lookup_count
+    return {'virtual_nodes': len(ring.sorted_keys),
+            'memory_bytes': memory,
+            'build_seconds': build_time,
+            'lookup_seconds': lookup_time}
+
+
+def analyze(nodes, weights=None, virtual_count=None, keys=None, key_count=10000, strategies=STRATEGIES,
+            epsilon=0.25):
+    """
+    Analyze placement of keys on nodes.
+
+    :param nodes: List of nodes.
+    :param weights: Optional dict with node weights.
+    :param virtual_count: Number of virtual nodes per unit of weight, defaults to that of NodeRing.
+    :param keys: Sample of keys to place, defaults to key_count generated keys.
+    :param key_count: Number of keys to generate if no keys are given.
+    :param strategies: Placement strategies to analyze, 'ring' and/or 'bounded'.
+    :param epsilon: Epsilon of the bounded load strategy.
+    :return: dict with the report.
+    """
+    nodes = list(nodes)
+    keys = list(keys) if keys is not None else sample_keys(key_count)
+    report = {'nodes': nodes, 'key_count': len(keys), 'cost': ring_cost(nodes, weights, virtual_count)}
+    for strategy in strategies:
+        assignment = placement(strategy, nodes, keys, weights, virtual_count, epsilon)
+        report[strategy] = {'balance': balance(assignment, nodes, weights),
+                            'movement': movement(strategy, nodes, keys, weights, virtual_count, epsilon)}
+
+    return report
+
+
+def format_report(report):
+    cost = report['cost']
+    lines = ['{count} nodes, {keys} keys'.format(count=len(report['nodes']), keys=report['key_count']),
+             'node ring: {vnodes} virtual nodes, ~{memory:.0f} kB, built in {build:.2f} ms, '
+             '{lookup:.2f} us per lookup'.format(vnodes=cost['virtual_nodes'], memory=cost['memory_bytes'] / 1024.0,
+                                                 build=1000 * cost['build_seconds'],
+                                                 lookup=1e6 * cost['lookup_seconds'])]
+
+    for strategy in STRATEGIES:
+        if strategy not in report:
+            continue
+
+        result = report[strategy]
+        stats = result['balance']
+        lines.append('')
+        lines.append('{strategy}: load / fair share max {max:.3f}, min {min:.3f}, stddev {stddev:.3f}'.format(
+            strategy=strategy, max=stats['max_load_ratio'], min=stats['min_load_ratio'],
+            stddev=stats['load_ratio_stddev']))
+        for node in report['nodes']:
+            removed = result['movement']['removed'].get(node)
+            line = '  {node}: {share:.1%} of keys'.format(node=node, share=stats['shares'][node])
+            if removed:
+                line += ', removal moves {moved:.1%} (ideal {ideal:.1%})'.format(**removed)
+            lines.append(line)
+
+        lines.append('  adding a node moves {moved:.1%} (ideal {ideal:.1%})'.format(**result['movement']['added']))
+
+    return '\n'.join(lines)
+
+
+def _parse_weight(value):
+    node, _, weight = value.rpartition('=')
+    if not node:
+        raise argparse.ArgumentTypeError('Expected NODE=WEIGHT, got {value}'.format(value=value))
+    return node, float(weight)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m qclient.analysis',
+                                     description='Analyze the placement of keys on QCache nodes.')
+    parser.add_argument('nodes', nargs='+', help='Node addresses, eg. http://host1:9401')
+    parser.add_argument('--weight', action='append', type=_parse_weight, default=[], metavar='NODE=WEIGHT',
+                        help='Weight of a node, may be given multiple times')
+    parser.add_argument('--virtual-count', type=int, default=None, help='Virtual nodes per unit of weight')
+    parser.add_argument('--keys', type=int, default=10000, help='Number of keys to generate')
+    parser.add_argument('--key-file', default=None, help='File with one key per line to use instead')
+    parser.add_argument('--epsilon', type=float, default=0.25, help='Epsilon for bounded load placement')
+    parser.add_argument('--strategy', action='append', choices=STRATEGIES, default=None)
+    args = parser.parse_args(argv)
+
+    keys = None
+    if args.key_file:
+        with open(args.key_file) as f:
+            keys = [line.strip() for line in f if line.strip()]
+
+    report = analyze(args.nodes, weights=dict(args.weight), virtual_count=args.virtual_count, keys=keys,
+                     key_count=args.keys, strategies=args.strategy or STRATEGIES, epsilon=args.epsilon)
+    print(format_report(report))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+"""
+Load generator for QCache clusters, driving the cluster through QClient.
+
+Either generates synthetic datasets, uploads them and queries them with a Zipf distributed key
+popularity, or replays a query mix from a file with one JSON object per line:
+
+    {"key": "someKey", "q": {"where": ["==", "foo", 1]}, "accept": "application/json", "weight": 2}
+
+accept and weight are optional. Throughput, latency percentiles and errors are reported in total
+and per node that the keys are owned by. Installed as the qclient-bench command:
+
+    qclient-bench http://host1:9401 http://host2:9401 --threads 16 --duration 30 --zipf 1.1
+    qclient-bench http://host1:9401 --query-file queries.jsonl
+
+Queries recorded using :class:`qclient.recording.Recorder` can be replayed at the recorded rate,
+or a multiple of it, comparing the latencies with those recorded:
+
+    qclient-bench http://host1:9401 --replay recording.jsonl --rate 2
+
+Load is generated by threads, the client is synchronous.
+"""
+import argparse
+import bisect
+from collections import defaultdict
+import json
+import random
+import threading
+
+from qclient.latency import PERCENTILES, clock, percentile
+
+
+class WeightedSampler(object):
+    """
+    Picks items at random with probability proportional to their weights.
+    """
+    def __init__(self, items, weights):
+        self.items = list(items)
+        self._cumulative = []
+        total = 0.0
+        for weight in weights:
+            total += weight
+            self._cumulative.append(total)
+
+    def sample(self, rng):
+        index = bisect.bisect_right(self._cumulative, rng.random() * self._cumulative[-1])
+        return self.items[min(index, len(self.items) - 1)]
+
+
+def zipf_sampler(items, s):
+    """
+    :return: WeightedSampler picking the item at rank k, starting from 1, with probability proportional
+             to 1 / k^s. s=0 gives a uniform distribution, the higher s the more skewed.
+    """
+    return WeightedSampler(items, [1.0 / (rank ** s) for rank in range(1, len(items) + 1)])
+
+
+def synthetic_dataset(rows, columns, seed):
+    """
+    :return: JSON encoded dataset with an integer id column and columns of random floats.
+    """
+    rng = random.Random(seed)
+    data = [dict([('id', i)] + [('c{c}'.format(c=c), rng.random()) for c in range(columns)]) for i in range(rows)]
+    return json.dumps(data).encode('utf-8')
+
+
+def synthetic_query(rng, columns):
+    column = 'c{c}'.format(c=rng.randrange(columns))
+    return {'select': ['id', column], 'where': ['<', column, rng.random()], 'order_by': [column], 'limit': 10}
+
+
+class Results(object):
+    """
+    Latencies and errors of the operations of a load test, per node.
+    """
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def add(self, node, latencies, errors):
+        with self._lock:
+            for latency in latencies:
+                self.latencies[node].append(latency)
+            for error, count in errors.items():
+                self.errors[node][error] += count
+
+    def summary(self, duration):
+        """
+        :return: dict with the number of requests, throughput, latency percentiles in seconds and
+                 error counts in total, 'all', and per node.
+        """
+        def summarize(latencies, errors):
+            ordered = sorted(latencies)
+            count = len(ordered) + sum(errors.values())
+            return {'requests': count,
+                    'throughput': count / duration if duration else 0.0,
+                    'percentiles': [(p, percentile(ordered, p)) for p in PERCENTILES] if ordered else [],
+                    'errors': dict(errors)}
+
+        all_errors = defaultdict(int)
+        for errors in self.errors.values():
+            for error, count in errors.items():
+                all_errors[error] += count
+
+        nodes = sorted(set(self.latencies) | set(self.errors), key=str)
+        summary = dict((node, summarize(self.latencies[node], self.errors[node])) for node in nodes)
+        summary['all'] = summarize([latency for node in nodes for latency in self.latencies[node]], all_errors)
+        return summary
+
+
+def run(client, next_operation, threads=4, duration=10.0, max_operations=None, seed=None):
+    """
+    Run operations from multiple threads until duration seconds have passed or max_operations
+    operations have been run.
+
+    :param client: The QClient, used to find the node owning the key of each operation.
+    :param next_operation: Function taking a random.Random and returning a tuple (key, fn) where fn runs
+                           the operation when called without arguments. An operation returning None, eg. a
+                           query of a missing key, is counted as a "missing" error. Exceptions raised are
+                           counted per exception type.
+    :param threads: Number of concurrent threads.
+    :param duration: Max number of seconds to run.
+    :param max_operations: Max number of operations in total.
+    :param seed: Seed for the random generators of the threads.
+    :return: Tuple (Results, elapsed seconds)
+    """
+    results = Results()
+    end = clock() + duration
+    counter = [0]
+    counter_lock = threading.Lock()
+
+    def next_allowed():
+        if max_operations is None:
+            return True
+
+        with counter_lock:
+            counter[0] += 1
+            return counter[0] <= max_operations
+
+    def worker(index):
+        rng = random.Random(None if seed is None else seed + index)
+        latencies = defaultdict(list)
+        errors = defaultdict(lambda: defaultdict(int))
+        while clock() < end and next_allowed():
+            key, fn = next_operation(rng)
+            node = client.node_ring.get_node(key)
+            t0 = clock()
+            try:
+                if fn() is None:
+                    errors[node]['missing'] += 1
+                else:
+                    latencies[node].append(clock() - t0)
+            except Exception as e:
+                errors[node][type(e).__name__] += 1
+
+        for node in set(latencies) | set(errors):
+            results.add(node, latencies[node], errors[node])
+
+    workers = [threading.Thread(target=worker, args=(i,), name='qclient-bench-{i}'.format(i=i))
+               for i in range(threads)]
+    t0 = clock()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    return results, clock() - t0
+
+
+def format_summary(title, summary):
+    lines = [title]
+    for node in ['all'] + sorted((node for node in summary if node != 'all'), key=str):
+        stats = summary[node]
+        line = '  {node}: {requests} requests, {throughput:.1f}/s'.format(
+            node=node, requests=stats['requests'], throughput=stats['throughput'])
+        if stats['percentiles']:
+            line += ', ' + ' '.join('p{p}={value:.2f}ms'.format(p=p, value=1000 * value)
+                                    for p, value in stats['percentiles'])
+        if stats['errors']:
+            line += ', errors: ' + ', '.join('{error}={count}'.format(error=error, count=count)
+                                             for error, count in sorted(stats['errors'].items()))
+        lines.append(line)
+
+    return '\n'.join(lines)
+
+
+def load_query_file(path):
+    """
+    :return: WeightedSampler over the queries in the file, dicts with key, q and accept.
+    """
+    queries = []
+    weights = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                queries.append({'key': entry['key'], 'q': entry.get('q', {}),
+                                'accept': entry.get('accept', 'application/json')})
+                weights.append(float(entry.get('weight', 1)))
+
+    if not queries:
+        raise ValueError('No queries in {path}'.format(path=path))
+
+    return WeightedSampler(queries, weights)
+
+
+def _upload_synthetic(client, keys, args):
+    pending = iter(keys)
+    lock = threading.Lock()
+
+    def next_upload(rng):
+        with lock:
+            key = next(pending)
+        content = synthetic_dataset(args.rows, args.columns, seed=key)
+        return key, lambda: client.post(key, content, content_type='application/json')
+
+    return run(client, next_upload, threads=min(args.threads, len(keys)), duration=float('inf'),
+               max_operations=len(keys))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='qclient-bench', description='Generate load against a QCache cluster.')
+    parser.add_argument('nodes', nargs='+', help='Node addresses, eg. http://host1:9401')
+    parser.add_argument('--threads', type=int, default=4, help='Number of concurrent threads')
+    parser.add_argument('--duration', type=float, default=10.0, help='Number of seconds to run queries')
+    parser.add_argument('--max-queries', type=int, default=None, help='Stop after this many queries')
+    parser.add_argument('--zipf', type=float, default=1.0,
+                        help='Skew of the popularity of the synthetic datasets, 0 for uniform')
+    parser.add_argument('--query-file', default=None, help='File with the query mix to run, see module docs')
+    parser.add_argument('--datasets', type=int, default=100, help='Number of synthetic datasets')
+    parser.add_argument('--rows', type=int, default=1000, help='Rows per synthetic dataset')
+    parser.add_argument('--columns', type=int, default=10, help='Float columns per synthetic dataset')
+    parser.add_argument('--key-prefix', default='qclient-bench-', help='Key prefix of the synthetic datasets')
+    parser.add_argument('--no-upload', action='store_true',
+                        help='Do not upload synthetic datasets up front, they are loaded on the first query')
+    parser.add_argument('--replay', default=None, help='Recording to replay, see qclient.recording')
+    parser.add_argument('--rate', type=float, default=1.0,
+                        help='Replay speed relative to the recording, 0 for as fast as possible')
+    parser.add_argument('--read-timeout', type=float, default=2.0)
+    parser.add_argument('--seed', type=int, default=None, help='Random seed for reproducible runs')
+    args = parser.parse_args(argv)
+
+    from qclient.client import QClient
+    client = QClient(args.nodes, read_timeout=args.read_timeout, trust_env=False, max_workers=args.threads)
+
+    if args.replay:
+        from qclient import recording
+        replayed = recording.replay(client, recording.read_recording(args.replay), rate=args.rate or None,
+                                    threads=args.threads)
+        print(recording.format_comparison(recording.compare(replayed)))
+        client.close()
+        return
+
+    if args.query_file:
+        sampler = load_query_file(args.query_file)
+
+        def next_operation(rng):
+            query = sampler.sample(rng)
+            return query['key'], lambda: client.get(query['key'], query['q'], accept=query['accept'])
+    else:
+        keys = ['{prefix}{i}'.format(prefix=args.key_prefix, i=i) for i in range(args.datasets)]
+        if not args.no_upload:
+            results, elapsed = _upload_synthetic(client, keys, args)
+            print(format_summary('uploads, {rows} rows x {columns} columns'.format(rows=args.rows, columns=args.columns),
+                                 results.summary(elapsed)))
+
+        sampler = zipf_sampler(keys, args.zipf)
+
+        def next_operation(rng):
+            key = sampler.sample(rng)
+            q = synthetic_query(rng, args.columns)
+            # Datasets evicted by the servers are loaded again, like an application would
+            return key, lambda: client.query(key, q, synthetic_dataset, content_type='application/json',
+                                             load_fn_kwargs={'rows': args.rows, 'columns': args.columns,
+                                                             'seed': key})
+
+    results, elapsed = run(client, next_operation, threads=args.threads, duration=args.duration,
+                           max_operations=args.max_queries, seed=args.seed)
+    print(format_summary('queries, {threads} threads, {elapsed:.1f}s'.format(threads=args.threads, elapsed=elapsed),
+                         results.summary(elapsed)))
+
+    statistics = client.get_statistics()
+    for node in sorted(statistics):
+        counters = ', '.join('{name}={value}'.format(name=name, value=value)
+                             for name, value in sorted(statistics[node].items())
+                             if value and isinstance(value, int))
+        if counters:
+            print('  {node} client statistics: {counters}'.format(node=node, counters=counters))
+
+    for statistics in client.get_key_statistics(top=5, order_by='reload_time'):
+        if statistics['reloads']:
+            print('  {key}: {reloads} reloads, {reload_time:.2f}s reloading, miss rate {miss_rate:.1%}'.format(
+                **statistics))
+
+    client.close()
+
+
+if __name__ == '__main__':
+    main()
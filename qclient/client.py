@@ -0,0 +1,1506 @@
+from contextlib import contextmanager
+import json
+import os
+import socket
+import time
+import requests
+from requests.exceptions import ConnectionError, ConnectTimeout, ReadTimeout, RequestException
+from qclient.exceptions import (QClientException, NoCacheAvailable, TooManyConsecutiveErrors, UnexpectedServerResponse,
+                                MalformedQueryException, UnsupportedAcceptType, DeadlineExceeded, QuorumNotReached,
+                                ConcurrencyLimitExceeded, RetryBudgetExhausted)
+from qclient.latency import TimeoutPolicy, clock
+from qclient.node_ring import NodeRing
+from qclient.parallel import ParallelExecutor
+from qclient import decoding, pipelining
+from qclient.prepared import BoundQuery
+from qclient.refresh import RefreshAhead
+from qclient.rehoming import Rehomer
+from qclient.routing import HashRouting
+from qclient.spill import MappedContent
+from qclient.usage import KeyUsage
+from qclient import partition
+from collections import defaultdict
+import threading
+
+# With adaptive timeouts a node is only dropped after this many read timeouts in a row
+_ADAPTIVE_READ_TIMEOUTS_BEFORE_DROP = 3
+
+
+def _matches_snapshot(snapshot, nodes, ring):
+    return (set(snapshot['nodes']) == set(nodes) and snapshot['virtual_count'] == ring.virtual_count and
+            all(snapshot['weights'].get(node, 1) == ring.weights.get(node, 1) for node in nodes))
+
+
+def _node_statisticts():
+    return dict(connect_timeout=0,
+                connection_error=0,
+                read_timeout=0,
+                unknown_error=0,
+                resurrections=0,
+                retry_error=0,
+                concurrency_rejections=0,
+                retry_budget_exhausted=0,
+                refreshes=0,
+                refresh_duration=0.0,
+                refresh_failures=0,
+                rehomed=0,
+                rehome_failures=0,
+                deletes=0,
+                delete_errors=0,
+                get_too_long=0,
+                spill_hits=0,
+                pipelined_gets=0,
+                pipeline_errors=0)
+
+
+class QueryResult(object):
+    """
+    Returned upon successful query response.
+
+    :param content: A byte string containing the body received from the server.
+    :param unsliced_result_len: contains the complete result length. If no slicing/pagination is applied this will equal the number of records returned.
+    :param encoding: Content-Encoding as set by the server
+    :param content_type: Content-Type as set by the server
+    :param statistics: dict with query statistics reported by the server, parsed on first access.
+    """
+    # Services doing many small queries hold lots of results, keep them small
+    __slots__ = ('content', 'unsliced_result_len', 'encoding', 'content_type', '_statistics', '_stats_header')
+
+    def __init__(self, response):
+        headers = response.headers
+        self.content = response.content
+        self.unsliced_result_len = int(headers['X-QCache-unsliced-length'])
+        self.encoding = headers.get('Content-Encoding')
+        self.content_type = headers.get('Content-Type')
+        self._stats_header = headers.get('X-QCache-stats')
+        self._statistics = None
+
+    @classmethod
+    def from_content(cls, content, unsliced_result_len, encoding=None, statistics=None,
+                     content_type='application/json'):
+        result = cls.__new__(cls)
+        result.content = content
+        result.unsliced_result_len = unsliced_result_len
+        result.encoding = encoding
+        result.content_type = content_type
+        result._stats_header = None
+        result._statistics = statistics or {}
+        return result
+
+    @property
+    def statistics(self):
+        if self._statistics is None:
+            self._statistics = _parse_statistics(self._stats_header, 'get_')
+            self._stats_header = None
+        return self._statistics
+
+    @statistics.setter
+    def statistics(self, statistics):
+        self._statistics = statistics
+        self._stats_header = None
+
+    @property
+    def buffer(self):
+        """
+        Read only memoryview of the content, for passing it on to eg. numpy.frombuffer or a socket without copying it.
+        """
+        return memoryview(self.content)
+
+    def decompress(self):
+        """
+        :return: The content, decompressed if the server compressed it using lz4. Content compressed
+                 using gzip or deflate is decompressed when received.
+        :raises UnsupportedEncoding:
+        """
+        return decoding.decompress(self.content, self.encoding)
+
+    def decode(self):
+        """
+        :return: The decompressed content decoded according to its content type, a list of dicts for
+                 JSON and CSV. See :func:`qclient.decoding.register_decoder` for other content types.
+        :raises UnsupportedEncoding:
+        """
+        return decoding.decode(self.decompress(), self.content_type)
+
+    def add_stats(self, stats):
+        self.statistics.update(stats)
+
+    def __getstate__(self):
+        # Slotted objects cannot be pickled using protocols older than 2 without this
+        return self.content, self.unsliced_result_len, self.encoding, self.content_type, self.statistics
+
+    def __setstate__(self, state):
+        self.content, self.unsliced_result_len, self.encoding, self.content_type, self._statistics = state
+        self._stats_header = None
+
+    def __repr__(self):
+        return "{class_name}(content={content}, unsliced_result_len={unsliced_result_len}, encoding={encoding})".format(
+            class_name=self.__class__.__name__,
+            content=self.content,
+            unsliced_result_len=self.unsliced_result_len,
+            encoding=self.encoding)
+
+    __str__ = __repr__
+
+
+def _deadline(timeout):
+    return clock() + timeout if timeout is not None else None
+
+
+def _encode(content):
+    # Encode text once up front rather than once per replica in the requests library
+    if not isinstance(content, bytes) and hasattr(content, 'encode'):
+        return content.encode('utf-8')
+    return content
+
+
+def _create_session(cert, verify, auth, timeout, trust_env):
+    session = requests.session()
+    session.cert = cert
+    session.verify = verify
+    session.auth = auth
+    session.timeout = timeout
+    session.trust_env = trust_env
+    return session
+
+
+def _accept_types(accept):
+    if isinstance(accept, (list, tuple)):
+        return list(accept)
+    return [accept]
+
+
+def _check_deadline(deadline):
+    if deadline is not None and clock() >= deadline:
+        raise DeadlineExceeded('Deadline exceeded')
+
+
+def _parse_statistics(stats_header, prefix):
+    statistics = {}
+    if stats_header:
+        for item in stats_header.split(','):
+            name, _, value = item.partition('=')
+            statistics[prefix + name.strip()] = float(value)
+
+    return statistics
+
+
+def get_request_statistics(response, prefix="get_"):
+    return _parse_statistics(response.headers.get('X-QCache-stats'), prefix)
+
+
+class QClient(object):
+    """
+    Main client class.
+
+    Basic example:
+
+    >>> client = QClient(node_list=('http://host1:9401', 'http://host2:9401', 'http://host3:9401'))
+    >>> result = client.get('someKey', {'select': ['col1', 'col2', 'col3'], 'where': ['<', 'col', 1]})
+
+    :param node_list: List or other iterables with addresses to qcache servers.
+                      Eg. ['http://host1:9401', 'http://host2:9401']
+    :param connect_timeout: Number of seconds to wait until connection timeout occurs.
+    :param read_timeout: Number of seconds to wait until read timeout occurs. Posts are allowed
+                         ten times longer since uploads generally take longer than queries.
+    :param verify: If https is used controls if the host certificate should be verified.
+    :param auth: Tuple (username, password), used for basic auth.
+    :param consecutive_error_count_limit: Number of times to retry operations before giving up.
+    :param trust_env: Whether to pick up proxies etc. from environment variables etc. Setting this
+                      to False will cut request latency by 5-6ms because of less processing required in
+                      the requests library.
+    :param max_workers: Max number of concurrent requests issued by operations that fan out to
+                        multiple nodes, eg. queries against partitioned datasets.
+    :param adaptive_timeouts: If set read timeouts are derived from the latencies observed per node and
+                              operation instead of using read_timeout. Upload timeouts are scaled with
+                              the payload size. The effective timeouts are included in the statistics.
+                              Since adaptive timeouts may be tight a read timeout is retried without
+                              dropping the node, the node is dropped after three read timeouts in a row.
+    :param min_read_timeout: Lower bound for adaptive read timeouts, defaults to half of read_timeout.
+    :param max_read_timeout: Upper bound for adaptive read timeouts, defaults to ten times read_timeout.
+    :param routing_policy: Policy for selecting which node(s) to send requests for a key to. Defaults to
+                           :class:`~qclient.routing.HashRouting`, use :class:`~qclient.routing.LeastLoadedRouting`
+                           to route requests away from slow nodes or :class:`~qclient.routing.BoundedLoadRouting`
+                           to cap the amount of data uploaded to each node.
+    :param concurrency_limiter: Optional :class:`~qclient.overload.AIMDLimiter` limiting the number of concurrent
+                                requests per node. The current limit is included in the statistics.
+    :param retry_budget: Optional :class:`~qclient.overload.RetryBudget` limiting the number of retries and
+                         reloads of data to a fraction of the number of requests.
+    :param rehome_on_resurrection: If set datasets posted to other nodes while their home node was down are
+                                   copied back to the home node in the background when it comes back. Until
+                                   the copy has completed queries are sent to the node holding the data.
+    :param replication_factor: Number of nodes to upload each dataset to, the owner of the key and its successors
+                               on the node ring. Uploads to the nodes are done in parallel. Combine with
+                               LeastLoadedRouting(candidate_count=replication_factor) to spread queries over
+                               the replicas.
+    :param write_quorum: Number of nodes that must acknowledge an upload for it to succeed. Defaults to 1,
+                         uploads succeed as long as one replica is stored. Note that a majority of two
+                         replicas is two, requiring both nodes to be up for uploads to succeed. Replicas
+                         rejecting the upload count as not acknowledging it, the error is raised if the
+                         quorum cannot be reached.
+    :param post_query_threshold: Queries whose JSON serialization is at least this many characters long are
+                                 executed using POST rather than GET unless post_query is given explicitly.
+                                 Nodes rejecting shorter GETs as too long are remembered and queried using
+                                 POST from that length on.
+    :param spill_cache: Optional :class:`~qclient.spill.SpillCache` storing the output of load functions passed to
+                        :meth:`query` on local disk. Datasets evicted from QCache are re-uploaded from there
+                        rather than loaded again.
+    :param shared_health: Optional :class:`~qclient.shared_health.SharedNodeHealth` sharing dropped and
+                          resurrected nodes with other processes on the host.
+    :param ring_snapshot: Optional node ring snapshot taken using :meth:`NodeRing.snapshot`, saves
+                          computing the ring on startup. Ignored if the nodes, their weights or the number
+                          of virtual nodes differ from those of the client.
+    :param weights: Optional dict with the relative capacity of nodes, eg. {'http://host1:9401': 1.5}. Nodes not
+                    included get weight 1. Fractional weights are supported. See :meth:`set_node_weight`.
+    :param accept_encoding: Optional list of content encodings that query results may be compressed with, in
+                            order of preference, eg. ['lz4', 'gzip']. lz4 requires the lz4 package and is left
+                            out if it's not installed. Defaults to the gzip and deflate encodings offered by
+                            requests. See :meth:`QueryResult.decompress`.
+    :param recorder: Optional :class:`~qclient.recording.Recorder` recording a sample of the queries and uploads,
+                     including those made by :meth:`query`, for replay using :func:`qclient.recording.replay`.
+    :param key_statistics_capacity: Max number of keys to keep usage statistics for, the keys that the most time
+                                    is spent querying, loading and uploading. 0 disables the statistics. See
+                                    :meth:`get_key_statistics`.
+
+    The client can be created before forking, eg. in the master process of a pre-fork server. Forks are
+    detected and the connection pool, thread pool and locks are then recreated in the child process.
+    Background refreshes registered using :meth:`register_refresh` are only run by the parent.
+    """
+
+    def __init__(self,
+                 node_list,
+                 connect_timeout=1.0,
+                 read_timeout=2.0,
+                 verify=True,
+                 cert=None,
+                 auth=None,
+                 consecutive_error_count_limit=10,
+                 trust_env=True,
+                 max_workers=8,
+                 adaptive_timeouts=False,
+                 min_read_timeout=None,
+                 max_read_timeout=None,
+                 routing_policy=None,
+                 concurrency_limiter=None,
+                 retry_budget=None,
+                 rehome_on_resurrection=False,
+                 replication_factor=1,
+                 write_quorum=None,
+                 post_query_threshold=1024,
+                 spill_cache=None,
+                 shared_health=None,
+                 ring_snapshot=None,
+                 weights=None,
+                 accept_encoding=None,
+                 recorder=None,
+                 key_statistics_capacity=1000):
+        self.node_list = list(node_list)
+        self.weights = dict(weights or {})
+        # The ring is built on first use, the snapshot replaces it if taken with the same configuration
+        self.node_ring = NodeRing(self.node_list, self.weights)
+        if ring_snapshot and _matches_snapshot(ring_snapshot, self.node_list, self.node_ring):
+            self.node_ring = NodeRing.from_snapshot(ring_snapshot)
+
+        self.session = _create_session(cert, verify, auth, (connect_timeout, read_timeout), trust_env)
+        if min_read_timeout is None:
+            min_read_timeout = read_timeout / 2.0
+        self.timeout_policy = TimeoutPolicy(connect_timeout, read_timeout, adaptive=adaptive_timeouts,
+                                            min_read_timeout=min_read_timeout, max_read_timeout=max_read_timeout)
+
+        self.failing_nodes = set()
+        self._read_timeouts = {}
+        # Guards the node ring, failing_nodes and the error counters against concurrent
+        # updates from the threads of operations that fan out
+        self._health_lock = threading.RLock()
+        # Dropped nodes currently being probed, probes are done without holding the lock
+        self._probing = set()
+        self._probes_done = threading.Condition(self._health_lock)
+        self.check_interval = 10
+        self.check_attempt_count = 0
+        self.consecutive_error_count = 0
+        self.consecutive_error_count_limit = consecutive_error_count_limit
+        self.statistics = None
+        self._clear_statistics()
+        self._executor = ParallelExecutor(max_workers)
+        self.routing_policy = routing_policy or HashRouting()
+        self._in_flight = defaultdict(int)
+        self._in_flight_lock = threading.Lock()
+        self.concurrency_limiter = concurrency_limiter
+        self.retry_budget = retry_budget
+        self._refresh_ahead = None
+        self._rehomer = Rehomer(self, node_list, weights=self.weights) if rehome_on_resurrection else None
+        self.replication_factor = replication_factor
+        self.write_quorum = write_quorum or 1
+        self.post_query_threshold = post_query_threshold
+        self._get_length_limits = {}
+        self.spill_cache = spill_cache
+        self.shared_health = shared_health
+        self._shared_health_version = None
+        self._pipelines = defaultdict(list)
+        self._pipelines_lock = threading.Lock()
+        self._pipelining_unsupported = set()
+        self.accept_encoding = decoding.accept_encoding(accept_encoding) if accept_encoding else None
+        self._unsupported_accept_types = set()
+        self.recorder = recorder
+        self.key_usage = KeyUsage(key_statistics_capacity) if key_statistics_capacity else None
+        self._pid = os.getpid()
+
+    def _check_fork(self):
+        if os.getpid() != self._pid:
+            self._after_fork()
+
+    def _after_fork(self):
+        # Connections, threads and locks inherited from the parent must not be used by the child
+        self._pid = os.getpid()
+        session = self.session
+        self.session = _create_session(session.cert, session.verify, session.auth, session.timeout, session.trust_env)
+        self._executor._after_fork()
+        self._in_flight = defaultdict(int)
+        self._in_flight_lock = threading.Lock()
+        self._health_lock = threading.RLock()
+        self._probing = set()
+        self._probes_done = threading.Condition(self._health_lock)
+        self._pipelines = defaultdict(list)
+        self._pipelines_lock = threading.Lock()
+        self.timeout_policy.tracker._after_fork()
+        for component in (self.concurrency_limiter, self.retry_budget, self._rehomer, self.spill_cache,
+                          self.shared_health, self.recorder, self.key_usage):
+            if component is not None:
+                component._after_fork()
+
+        self._refresh_ahead = None
+        self._clear_statistics()
+
+    def _clear_statistics(self):
+        self.statistics = defaultdict(_node_statisticts)
+
+    def _node_score(self, node):
+        estimate = self.timeout_policy.tracker.estimate(node, 'get')
+        latency = estimate.mean if estimate else 0.0
+        return latency * (self._in_flight[node] + 1)
+
+    def _nodes_for_key(self, key, deadline=None):
+        if self._rehomer:
+            node = self._rehomer.route(key)
+            if node and node not in self.failing_nodes:
+                return [node]
+
+        nodes = self.routing_policy.select(self.node_ring, key, self._node_score)
+        if not nodes:
+            # Check all caches in unreachable nodes, if none exist. Fail!
+            self._test_dropped_nodes(deadline, wait=True)
+            nodes = self.routing_policy.select(self.node_ring, key, self._node_score)
+            if not nodes:
+                _check_deadline(deadline)
+                raise NoCacheAvailable('No QCaches reachable')
+
+        return nodes
+
+    def _upload_node(self, key, content, deadline=None):
+        node = self._nodes_for_key(key, deadline)[0]
+        place = getattr(self.routing_policy, 'place', None)
+        if place is None:
+            return node
+
+        # Routing policies that track the load on the nodes place uploads themselves
+        return place(self.node_ring, key, len(content)) or node
+
+    def _forget_key(self, key):
+        forget = getattr(self.routing_policy, 'forget', None)
+        if forget is not None:
+            forget(key)
+
+    def _replica_nodes(self, key, deadline=None):
+        nodes = self.node_ring.get_nodes(key, self.replication_factor)
+        if not nodes:
+            self._test_dropped_nodes(deadline, wait=True)
+            nodes = self.node_ring.get_nodes(key, self.replication_factor)
+            if not nodes:
+                _check_deadline(deadline)
+                raise NoCacheAvailable('No QCaches reachable')
+
+        return nodes
+
+    def _delete_nodes(self, key, deadline=None):
+        nodes = self._nodes_for_key(key, deadline)
+        if self.replication_factor > 1:
+            nodes = nodes + [node for node in self.node_ring.get_nodes(key, self.replication_factor) if node not in nodes]
+
+        return nodes
+
+    def _test_dropped_nodes(self, deadline=None, wait=False):
+        # Test all nodes that are currently on the fail list. Any node that responds
+        # gets reinserted into the node ring. A more selective strategy may be required
+        # in the future but keep it simple for now.
+        # Each node is probed by one thread at a time, without holding the lock during the probe.
+        # With wait set nodes being probed by other threads are waited for rather than skipped.
+        with self._health_lock:
+            nodes = [node for node in self.failing_nodes if node not in self._probing]
+            others = [node for node in self.failing_nodes if node in self._probing]
+            self._probing.update(nodes)
+
+        try:
+            for node in nodes:
+                timeout = self.session.timeout
+                if deadline is not None:
+                    remaining = deadline - clock()
+                    if remaining <= 0:
+                        # Leave the remaining nodes to be probed by later operations
+                        return
+                    timeout = min(timeout[0], remaining), min(timeout[1], remaining)
+
+                if self.shared_health and not self.shared_health.claim_probe(node):
+                    # Recently probed by another process
+                    continue
+
+                status_url = self._status_url(node)
+                try:
+                    response = self.session.get(status_url, timeout=timeout)
+                    if response.status_code == 200:
+                        self._resurrect_node(node)
+                        if self.shared_health:
+                            self.shared_health.mark_up(node)
+                except RequestException:
+                    self.statistics[node]['retry_error'] += 1
+        finally:
+            with self._health_lock:
+                self._probing.difference_update(nodes)
+                self._probes_done.notify_all()
+
+        if wait and others:
+            with self._health_lock:
+                while self._probing.intersection(others):
+                    if deadline is None:
+                        self._probes_done.wait()
+                    elif deadline - clock() > 0:
+                        self._probes_done.wait(deadline - clock())
+                    else:
+                        return
+
+    def _resurrect_node(self, node):
+        with self._health_lock:
+            if node not in self.failing_nodes:
+                # Resurrected by another thread
+                return
+
+            if self._rehomer:
+                self._rehomer.node_resurrected(node)
+            self.node_ring.add_node(node, weight=self.weights.get(node))
+            self.failing_nodes.remove(node)
+            self.statistics[node]['resurrections'] += 1
+
+    def _drop_node(self, node, mark_down=True):
+        with self._health_lock:
+            if node in self.failing_nodes:
+                # Dropped by another thread
+                return
+
+            self.node_ring.remove_node(node)
+            self.failing_nodes.add(node)
+            if mark_down and self.shared_health:
+                self.shared_health.mark_down(node)
+
+    def _sync_shared_health(self):
+        version = self.shared_health.version()
+        if version == self._shared_health_version:
+            return
+
+        with self._health_lock:
+            self._shared_health_version = version
+            down_nodes = self.shared_health.down_nodes()
+            for node in self.node_list:
+                if node in down_nodes and node not in self.failing_nodes:
+                    self._drop_node(node, mark_down=False)
+                elif node not in down_nodes and node in self.failing_nodes:
+                    self._resurrect_node(node)
+
+    def _check_dropped_nodes(self, deadline=None):
+        self._check_fork()
+        if self.shared_health:
+            self._sync_shared_health()
+
+        with self._health_lock:
+            check = self.check_attempt_count % self.check_interval == 0
+            self.check_attempt_count += 1
+
+        if check:
+            self._test_dropped_nodes(deadline)
+
+    def _count_consecutive_error(self):
+        """
+        :return: True if the limit of consecutive errors was reached, the count is then reset.
+        """
+        with self._health_lock:
+            self.consecutive_error_count += 1
+            if self.consecutive_error_count < self.consecutive_error_count_limit:
+                return False
+
+            self.consecutive_error_count = 0
+            return True
+
+    def _drop_on_read_timeout(self, node):
+        if not self.timeout_policy.adaptive:
+            return True
+
+        # A single slow response to a request with a tight adaptive timeout does not mean that the
+        # node is down, dropping it would move its load, and reloads of its datasets, to other nodes
+        with self._health_lock:
+            count = self._read_timeouts[node] = self._read_timeouts.get(node, 0) + 1
+            if count < _ADAPTIVE_READ_TIMEOUTS_BEFORE_DROP:
+                return False
+
+            del self._read_timeouts[node]
+            return True
+
+    @contextmanager
+    def _connection_error_manager(self, node):
+        drop = True
+        try:
+            yield
+            self.consecutive_error_count = 0
+            if node in self._read_timeouts:
+                self._read_timeouts.pop(node, None)
+            return
+        except ConnectTimeout:
+            self.statistics[node]['connect_timeout'] += 1
+        except ConnectionError:
+            self.statistics[node]['connection_error'] += 1
+        except ReadTimeout:
+            self.statistics[node]['read_timeout'] += 1
+            drop = self._drop_on_read_timeout(node)
+
+        if drop:
+            self._drop_node(node)
+        if self._count_consecutive_error():
+            raise TooManyConsecutiveErrors('Too many errors occurred while trying operation: {stat}'.format(
+                stat=dict(self.statistics)))
+
+    def _acquire_slot(self, node, deadline=None):
+        timeout = deadline - clock() if deadline is not None else None
+        if self.concurrency_limiter and not self.concurrency_limiter.acquire(node, timeout):
+            # The wait for a slot is cut short by the deadline
+            _check_deadline(deadline)
+            self.statistics[node]['concurrency_rejections'] += 1
+            raise ConcurrencyLimitExceeded('Too many concurrent requests to {node}'.format(node=node))
+
+    def _release_slot(self, node, overloaded):
+        if self.concurrency_limiter:
+            self.concurrency_limiter.release(node, overloaded)
+            self.statistics[node].update(self.concurrency_limiter.state(node))
+
+    def _consume_retry(self, node):
+        if self.retry_budget and not self.retry_budget.try_withdraw():
+            if node:
+                self.statistics[node]['retry_budget_exhausted'] += 1
+            raise RetryBudgetExhausted('Retry budget exhausted')
+
+    def _capped_timeout(self, node, operation, timeout, deadline):
+        if deadline is None:
+            return timeout, False
+
+        remaining = deadline - clock()
+        estimate = self.timeout_policy.tracker.estimate(node, operation)
+        if remaining <= (estimate.mean if estimate and operation != 'post' else 0.0):
+            # Not likely to finish in time, don't bother trying
+            raise DeadlineExceeded('Deadline exceeded before {operation} against {node}'.format(
+                operation=operation, node=node))
+
+        capped = min(timeout[0], remaining), min(timeout[1], remaining)
+        return capped, capped != timeout
+
+    def _request(self, node, operation, method, url, size=None, deadline=None, **kwargs):
+        timeout = self.timeout_policy.timeout_for(node, operation, size)
+        capped_timeout, capped = self._capped_timeout(node, operation, timeout, deadline)
+        self._acquire_slot(node, deadline)
+        if deadline is not None and self.concurrency_limiter:
+            # Time may have been spent waiting for a slot
+            try:
+                capped_timeout, capped = self._capped_timeout(node, operation, timeout, deadline)
+            except DeadlineExceeded:
+                self._release_slot(node, False)
+                raise
+
+        timeout = capped_timeout
+        self.statistics[node]['effective_{operation}_read_timeout'.format(operation=operation)] = timeout[1]
+        with self._in_flight_lock:
+            self._in_flight[node] += 1
+
+        overloaded = True
+        t0 = clock()
+        try:
+            response = method(url, timeout=timeout, **kwargs)
+            overloaded = response.status_code in (429, 503)
+        except (ConnectTimeout, ReadTimeout) as e:
+            if capped:
+                # The timeout was shortened to fit the deadline, this says nothing about the node
+                overloaded = False
+                raise DeadlineExceeded('Deadline exceeded during {operation} against {node}: {error}'.format(
+                    operation=operation, node=node, error=e))
+
+            if isinstance(e, ReadTimeout):
+                self.timeout_policy.record(node, operation, timeout[1], size)
+            raise
+        finally:
+            with self._in_flight_lock:
+                self._in_flight[node] -= 1
+            self._release_slot(node, overloaded)
+
+        self.timeout_policy.record(node, operation, clock() - t0, size)
+        if self.retry_budget and not overloaded:
+            self.retry_budget.deposit()
+
+        return response
+
+    @staticmethod
+    def _status_url(node):
+        new_node = node if node.endswith('/') else node + '/'
+        return new_node + 'qcache/status'
+
+    @staticmethod
+    def _key_url(node, key):
+        new_node = node if node.endswith('/') else node + '/'
+        return new_node + 'qcache/dataset/' + key
+
+    def set_node_weight(self, node, weight):
+        """
+        Change the weight of node. Only the keys needed to reflect the new weight move to or from the node.
+
+        :param node: Node to change weight for.
+        :param weight: New weight, relative to the weight of the other nodes.
+        :return: None
+        """
+        with self._health_lock:
+            self.weights[node] = weight
+            if node not in self.failing_nodes:
+                self.node_ring.set_weight(node, weight)
+        if self._rehomer:
+            self._rehomer.set_weight(node, weight)
+
+    def update_weights_from_status(self, capacity_fn):
+        """
+        Derive node weights from the capacity reported by each live node on its status endpoint.
+        Weights are set relative to the mean capacity of the responding nodes. Nodes that fail to
+        respond, or for which no capacity could be determined, keep their current weight.
+
+        :param capacity_fn: Function taking the status response and returning the capacity of the node,
+                            eg. the amount of memory available to the cache, or None.
+                            Eg. lambda response: response.json()['max_cache_size']
+        :return: dict with the new weight per node.
+        """
+        self._check_fork()
+        nodes = [node for node in self.node_list if node not in self.failing_nodes]
+
+        def capacity(node):
+            try:
+                response = self.session.get(self._status_url(node), timeout=self.session.timeout)
+                return capacity_fn(response) if response.status_code == 200 else None
+            except Exception:
+                # Includes anything raised by capacity_fn, the node keeps its weight
+                return None
+
+        capacities = dict((node, c) for node, c in zip(nodes, self._executor.map(capacity, nodes)) if c)
+        if not capacities:
+            return {}
+
+        mean = float(sum(capacities.values())) / len(capacities)
+        weights = dict((node, c / mean) for node, c in capacities.items())
+        for node, weight in weights.items():
+            self.set_node_weight(node, weight)
+
+        return weights
+
+    def get_statistics(self):
+        statistics = self.statistics
+        self._clear_statistics()
+        return statistics
+
+    def get_key_statistics(self, top=10, order_by='cost'):
+        """
+        Usage statistics for the keys that the most time is spent on, for tuning the cache size of the
+        servers and finding datasets that are evicted and reloaded frequently. Times are in seconds.
+
+        Each entry is a dict with the key, the number of queries, misses (queries of keys not available
+        in the cache), miss_rate, query_time, the number of reloads done by :meth:`query`, load_time spent
+        in load functions, the number of uploads, upload_bytes, upload_time and reload_time, the sum of
+        load_time and upload_time. cost is the total time spent on the key and error an upper bound for
+        the cost before the key was tracked, see :class:`~qclient.usage.KeyUsage`.
+
+        :param top: Number of keys to return.
+        :param order_by: Statistic to order the keys by, eg. 'reload_time' for the most expensive reloads.
+        :return: List of dicts, in descending order_by order. Empty if key statistics are disabled.
+        """
+        if self.key_usage is None:
+            return []
+
+        return self.key_usage.top(top, order_by)
+
+    def get(self, key, q, accept='application/json', post_query=None, query_headers=None, timeout=None):
+        """
+        Execute query and return result.
+
+        :param key: Key for the table to query.
+        :param q: Dict with the query as described in the QCache documentation or a query bound
+                  using :meth:`PreparedQuery.bind`.
+        :param accept: Response type, application/json and text/csv are supported. May also be a list of types
+                       in order of preference. Types rejected by a node are remembered and the next type in the
+                       list is used for that node instead.
+        :param post_query: If True the query will be executed using a POST rather than GET, if False using GET.
+                           Defaults to selecting the method based on the size of the query, see post_query_threshold.
+        :param query_headers: dict with additional headers to include when issuing query.
+                              Key - header name
+                              Value - header value
+        :param timeout: Max number of seconds for the complete operation, including retries.
+        :returns QueryResult: Contains the result of the query.
+        :raises MalformedQueryException:
+        :raises UnsupportedAcceptType:
+        :raises UnexpectedServerResponse:
+        :raises TooManyConsecutiveErrors:
+        :raises NoCacheAvailable:
+        :raises ConcurrencyLimitExceeded:
+        :raises RetryBudgetExhausted:
+        :raises DeadlineExceeded:
+        """
+        return self._get(key, q, accept, post_query, query_headers, _deadline(timeout))
+
+    def _use_post_query(self, node, json_q, post_query):
+        if post_query is not None:
+            return post_query
+
+        threshold = min(self.post_query_threshold, self._get_length_limits.get(node, self.post_query_threshold))
+        return len(json_q) >= threshold
+
+    def _query_node(self, node, key, q, json_q, use_post, headers, deadline):
+        bound = isinstance(q, BoundQuery)
+        key_url = self._key_url(node, key)
+        if use_post:
+            headers = dict(headers, **{'Content-Type': 'application/json'})
+            return self._request(node, 'get', self.session.post, key_url + '/q', deadline=deadline,
+                                 data=q.body if bound else json_q, headers=headers)
+
+        if bound:
+            # Use the cached, already encoded, query string
+            return self._request(node, 'get', self.session.get, key_url, deadline=deadline,
+                                 params=q.query_string, headers=headers)
+
+        return self._request(node, 'get', self.session.get, key_url, deadline=deadline,
+                             params={'q': json_q}, headers=headers)
+
+    def _query_headers(self, query_headers):
+        headers = {}
+        if self.accept_encoding:
+            headers['Accept-Encoding'] = self.accept_encoding
+        if query_headers:
+            headers.update(query_headers)
+        return headers
+
+    def _acceptable_types(self, node, accept_types):
+        # Skip types rejected by the node before, unless it has rejected all of them
+        types = [accept_type for accept_type in accept_types if (node, accept_type) not in self._unsupported_accept_types]
+        return types or accept_types[-1:]
+
+    def _get(self, key, q, accept, post_query, query_headers, deadline):
+        recorder = self.recorder
+        if recorder is not None and not recorder.sample():
+            recorder = None
+        if recorder is None and self.key_usage is None:
+            return self._execute_get(key, q, accept, post_query, query_headers, deadline)
+
+        started_at, t0 = time.time(), clock()
+        try:
+            result = self._execute_get(key, q, accept, post_query, query_headers, deadline)
+        except Exception as e:
+            if recorder is not None:
+                recorder.record_get(started_at, key, q, accept, query_headers, clock() - t0, error=e)
+            raise
+
+        latency = clock() - t0
+        if recorder is not None:
+            recorder.record_get(started_at, key, q, accept, query_headers, latency, result=result)
+        if self.key_usage is not None:
+            self.key_usage.record_query(key, latency, found=result is not None)
+        return result
+
+    def _execute_get(self, key, q, accept, post_query, query_headers, deadline):
+        self._check_dropped_nodes(deadline)
+        json_q = q.json if isinstance(q, BoundQuery) else json.dumps(q)
+        accept_types = _accept_types(accept)
+        headers = self._query_headers(query_headers)
+
+        while True:
+            for node in self._nodes_for_key(key, deadline):
+                use_post = self._use_post_query(node, json_q, post_query)
+                with self._connection_error_manager(node):
+                    for accept_type in self._acceptable_types(node, accept_types):
+                        response = None
+                        headers['Accept'] = accept_type
+                        response = self._query_node(node, key, q, json_q, use_post, headers, deadline)
+                        if response.status_code in (414, 431) and post_query is None and not use_post:
+                            # Query too long for the node, or a proxy in front of it. Remember
+                            # that and use POST for queries this long from now on.
+                            with self._health_lock:
+                                self._get_length_limits[node] = min(len(json_q),
+                                                                    self._get_length_limits.get(node, len(json_q)))
+                            self.statistics[node]['get_too_long'] += 1
+                            use_post = True
+                            response = self._query_node(node, key, q, json_q, True, headers, deadline)
+
+                        if response.status_code != 406:
+                            break
+
+                        # Remember that the node cannot produce the type and fall back to the next one
+                        self._unsupported_accept_types.add((node, accept_type))
+
+                if response is None:
+                    # Node dropped or timed out, retry against the, possibly new, candidates
+                    self._consume_retry(node)
+                    break
+
+                if response.status_code == 404:
+                    # The data may be stored on one of the other candidates
+                    continue
+
+                return self._query_result(response, json_q, accept)
+            else:
+                return None
+
+    def get_many(self, queries, accept='application/json', query_headers=None, timeout=None, pipeline=True):
+        """
+        Execute multiple queries and return the results. Queries for keys owned by the same node are
+        pipelined over a dedicated connection to the node, costing about one network round trip for
+        all of them instead of one per query. Queries to different nodes are executed in parallel.
+
+        Queries that are executed using POST, see post_query_threshold, queries to nodes using https or
+        reached through a proxy and queries to nodes that fail to handle pipelined requests are executed
+        one by one like :meth:`get` does.
+
+        >>> results = client.get_many([('key1', {'limit': 10}), ('key2', {'where': ['==', 'foo', 1]})])
+
+        :param queries: List of (key, q) tuples, see :meth:`get`.
+        :param accept: Response type or list of response types, see :meth:`get`.
+        :param query_headers: dict with additional headers to include when issuing queries.
+        :param timeout: Max number of seconds for the complete operation, including retries.
+        :param pipeline: Set to False to execute queries to the same node one by one.
+        :return: List with a QueryResult, or None if the key is not in QCache, per query in the same order
+                 as the queries.
+        :raises MalformedQueryException:
+        :raises UnsupportedAcceptType:
+        :raises UnexpectedServerResponse:
+        :raises TooManyConsecutiveErrors:
+        :raises NoCacheAvailable:
+        :raises ConcurrencyLimitExceeded:
+        :raises RetryBudgetExhausted:
+        :raises DeadlineExceeded:
+        """
+        deadline = _deadline(timeout)
+        self._check_dropped_nodes(deadline)
+        accept_types = _accept_types(accept)
+        headers = self._query_headers(query_headers)
+
+        groups = defaultdict(list)
+        for index, (key, q) in enumerate(queries):
+            json_q = q.json if isinstance(q, BoundQuery) else json.dumps(q)
+            nodes = self._nodes_for_key(key, deadline)
+            groups[nodes[0]].append((index, key, q, json_q, len(nodes) > 1))
+
+        def get_from_node(group):
+            node, items = group
+            if pipeline and len(items) > 1 and self._can_pipeline(node):
+                sequential = [item for item in items if self._use_post_query(node, item[3], None)]
+                pipelined = [item for item in items if not self._use_post_query(node, item[3], None)]
+            else:
+                sequential, pipelined = items, []
+
+            results = [(index, self._get(key, q, accept, None, query_headers, deadline))
+                       for index, key, q, _, _ in sequential]
+            if len(pipelined) > 1:
+                node_headers = dict(headers, Accept=self._acceptable_types(node, accept_types)[0])
+                results.extend(self._get_pipelined(node, pipelined, node_headers, accept, query_headers, deadline))
+            else:
+                results.extend((index, self._get(key, q, accept, None, query_headers, deadline))
+                               for index, key, q, _, _ in pipelined)
+            return results
+
+        results = [None] * len(queries)
+        for node_results in self._executor.map(get_from_node, list(groups.items())):
+            for index, result in node_results:
+                results[index] = result
+
+        return results
+
+    def _can_pipeline(self, node):
+        if node in self._pipelining_unsupported or not pipelining.supports_node(node):
+            return False
+
+        auth = self.session.auth
+        if auth is not None and not isinstance(auth, tuple):
+            # Custom authentication is left to requests
+            return False
+
+        # Nodes reached through a proxy are left to requests
+        session = self.session
+        return not (session.proxies or (session.trust_env and requests.utils.get_environ_proxies(node)))
+
+    def _checkout_pipeline(self, node):
+        # Connections are taken out of the pool while in use, concurrent batches to a node use separate connections
+        with self._pipelines_lock:
+            connections = self._pipelines[node]
+            if connections:
+                return connections.pop()
+
+        return pipelining.PipelinedConnection(node)
+
+    def _checkin_pipeline(self, node, connection):
+        with self._pipelines_lock:
+            self._pipelines[node].append(connection)
+
+    def _pipeline_requests(self, node, items, headers, deadline):
+        # Same default headers as requests, eg. Accept-Encoding
+        headers = dict(self.session.headers, **headers)
+        if self.session.auth is not None:
+            headers['Authorization'] = pipelining.basic_auth_header(*self.session.auth)
+
+        queries = [(key, q.query_string if isinstance(q, BoundQuery) else BoundQuery(json_q).query_string)
+                   for _, key, q, json_q, _ in items]
+        timeout = self.timeout_policy.timeout_for(node, 'get')
+        timeout, _ = self._capped_timeout(node, 'get', timeout, deadline)
+        self._acquire_slot(node, deadline)
+        with self._in_flight_lock:
+            self._in_flight[node] += len(items)
+
+        overloaded = True
+        connection = self._checkout_pipeline(node)
+        try:
+            responses = connection.get_all(queries, headers, timeout)
+            overloaded = any(response.status_code in (429, 503) for response in responses)
+        finally:
+            with self._in_flight_lock:
+                self._in_flight[node] -= len(items)
+            self._release_slot(node, overloaded)
+
+        self._checkin_pipeline(node, connection)
+        self.statistics[node]['pipelined_gets'] += len(items)
+        return responses
+
+    def _get_pipelined(self, node, items, headers, accept, query_headers, deadline):
+        started_at, t0 = time.time(), clock()
+        try:
+            responses = self._pipeline_requests(node, items, headers, deadline)
+        except pipelining.ERRORS as e:
+            # Fall back to querying one by one, which also takes care of dropping the node if it's down
+            self.statistics[node]['pipeline_errors'] += 1
+            if not isinstance(e, socket.error):
+                # Garbled responses, pipelined requests are not handled by the node or a proxy in front of it
+                self._pipelining_unsupported.add(node)
+            responses = [None] * len(items)
+
+        # The queries share the round trip, each is recorded with the latency of the batch
+        latency = clock() - t0
+        results = []
+        for (index, key, q, json_q, has_alternatives), response in zip(items, responses):
+            if response is not None and response.status_code == 406:
+                self._unsupported_accept_types.add((node, headers['Accept']))
+
+            fallback = response is None or response.status_code in (406, 414, 431)
+            if fallback or (response.status_code == 404 and has_alternatives):
+                # Let get deal with retries, other accept types, too long queries and data stored on other candidates
+                results.append((index, self._get(key, q, accept, None, query_headers, deadline)))
+            else:
+                try:
+                    result = None if response.status_code == 404 else self._query_result(response, json_q, accept)
+                except Exception as e:
+                    self._record_pipelined_get(started_at, key, q, accept, query_headers, latency, error=e)
+                    raise
+
+                self._record_pipelined_get(started_at, key, q, accept, query_headers, latency, result=result)
+                results.append((index, result))
+
+        return results
+
+    def _record_pipelined_get(self, started_at, key, q, accept, query_headers, latency, result=None, error=None):
+        recorder = self.recorder
+        if recorder is not None and recorder.sample():
+            recorder.record_get(started_at, key, q, accept, query_headers, latency, result=result, error=error)
+        if self.key_usage is not None and error is None:
+            self.key_usage.record_query(key, latency, found=result is not None)
+
+    def _query_result(self, response, json_q, accept):
+        if response.status_code == 200:
+            return QueryResult(response)
+
+        if response.status_code == 400:
+            raise MalformedQueryException('Malformed query "{json_q}", server response "{server_response}"'.format(
+                json_q=json_q, server_response=response.content))
+        elif response.status_code == 406:
+            raise UnsupportedAcceptType('Accept type "{accept}" is not supported'.format(
+                accept='", "'.join(_accept_types(accept))))
+        else:
+            raise UnexpectedServerResponse('Unable to query dataset, status code {status_code}, content "{content}'.format(
+                status_code=response.status_code, content=response.content))
+
+    def post(self, key, content, content_type='text/csv', post_headers=None, timeout=None):
+        """
+        Post table data to QCache for key.
+
+        :param key: Key to store the table under
+        :param content: Byte string with content encoded either as CSV or JSON.
+        :param content_type: application/json or text/csv depending on uploaded content
+        :param post_headers: dict with additional headers to include.
+                             Key - header name
+                             Value - header value
+        :param timeout: Max number of seconds for the complete operation, including retries.
+        :return: None
+        :raises MalformedQueryException:
+        :raises UnsupportedAcceptType:
+        :raises UnexpectedServerResponse:
+        :raises TooManyConsecutiveErrors:
+        :raises NoCacheAvailable:
+        :raises ConcurrencyLimitExceeded:
+        :raises RetryBudgetExhausted:
+        :raises DeadlineExceeded:
+        :raises QuorumNotReached:
+        """
+        return self._post(key, content, content_type, post_headers, _deadline(timeout))
+
+    def _post(self, key, content, content_type, post_headers, deadline):
+        recorder = self.recorder
+        if recorder is not None and not recorder.sample():
+            recorder = None
+        if recorder is None and self.key_usage is None:
+            return self._execute_post(key, content, content_type, post_headers, deadline)
+
+        started_at, t0 = time.time(), clock()
+        try:
+            stats = self._execute_post(key, content, content_type, post_headers, deadline)
+        except Exception as e:
+            if recorder is not None:
+                recorder.record_post(started_at, key, content_type, len(content), clock() - t0, error=e)
+            raise
+
+        latency = clock() - t0
+        if recorder is not None:
+            recorder.record_post(started_at, key, content_type, len(content), latency, stats=stats)
+        if self.key_usage is not None:
+            self.key_usage.record_upload(key, len(content), latency)
+        return stats
+
+    def _execute_post(self, key, content, content_type, post_headers, deadline):
+        self._check_dropped_nodes(deadline)
+        if self._rehomer:
+            # Upload to the home node rather than to the node that the dataset is being copied from
+            self._rehomer.cancel(key)
+
+        headers = {'Content-type': content_type}
+        if post_headers:
+            headers.update(post_headers)
+
+        if self.replication_factor > 1:
+            return self._post_replicated(key, _encode(content), content_type, post_headers, headers, deadline)
+
+        while True:
+            node = self._upload_node(key, content, deadline)
+            response = self._post_to_node(node, key, content, headers, deadline)
+            if response is not None:
+                if self._rehomer and self.failing_nodes:
+                    self._rehomer.track(key, node, content_type, post_headers)
+                return get_request_statistics(response, prefix="insert_")
+
+            # Node dropped or timed out, retry against the, possibly new, node
+            self._consume_retry(node)
+
+    def _post_replicated(self, key, content, content_type, post_headers, headers, deadline):
+        acknowledged = []
+        rejected = []
+        while True:
+            attempted = set(node for node, _ in acknowledged + rejected)
+            nodes = [node for node in self._replica_nodes(key, deadline) if node not in attempted]
+            outcomes = list(self._executor.map(
+                lambda node: self._post_to_replica(node, key, content, headers, deadline), nodes))
+            acknowledged.extend((node, response) for node, (response, _) in zip(nodes, outcomes) if response is not None)
+            rejected.extend((node, error) for node, (_, error) in zip(nodes, outcomes) if error is not None)
+            if len(acknowledged) >= self.write_quorum:
+                if self._rehomer and self.failing_nodes:
+                    for node, _ in acknowledged:
+                        self._rehomer.track(key, node, content_type, post_headers)
+                return get_request_statistics(acknowledged[0][1], prefix="insert_")
+
+            dropped = [node for node, (response, error) in zip(nodes, outcomes) if response is None and error is None]
+            if not dropped:
+                # No other replicas to try
+                if rejected:
+                    raise rejected[0][1]
+                raise QuorumNotReached('Dataset stored on {count} nodes, {quorum} required'.format(
+                    count=len(acknowledged), quorum=self.write_quorum))
+
+            # Nodes dropped, retry against the replicas that have not acknowledged the upload
+            self._consume_retry(dropped[0])
+
+    def _post_to_replica(self, node, key, content, headers, deadline):
+        """
+        :return: Tuple (response, error) where error is the exception raised if the node rejected the
+                 upload. Both are None if the node was dropped.
+        """
+        try:
+            return self._post_to_node(node, key, content, headers, deadline), None
+        except (UnexpectedServerResponse, ConcurrencyLimitExceeded) as e:
+            return None, e
+
+    def _post_to_node(self, node, key, content, headers, deadline):
+        """
+        :return: The response on success, None on connection problems or timeouts, the node is then
+                 usually dropped.
+        """
+        with self._connection_error_manager(node):
+            data = content.open() if isinstance(content, MappedContent) else content
+            response = self._request(node, 'post', self.session.post, self._key_url(node, key), size=len(content),
+                                     deadline=deadline, headers=headers, data=data)
+            if response.status_code == 201:
+                return response
+
+            self.statistics[node]['unknown_error'] += 1
+            raise UnexpectedServerResponse('Unable to create dataset, status code {status_code}, content "{content}"'.format(
+                status_code=response.status_code, content=response.content))
+
+        return None
+
+    def _load(self, key, load_fn, kwargs):
+        if self.spill_cache is None:
+            return load_fn(**kwargs)
+
+        content = self.spill_cache.get(key, kwargs)
+        if content is not None:
+            self.statistics[self.node_ring.get_node(key)]['spill_hits'] += 1
+            return content
+
+        content = load_fn(**kwargs)
+        self.spill_cache.put(key, kwargs, content)
+        return content
+
+    def query(self, key, q, load_fn, load_fn_kwargs=None, content_type='text/csv', accept='application/json',
+              post_headers=None, post_query=None, query_headers=None, timeout=None):
+        """
+        Convenience method to query for data. If the requested key is not available in the QCache a call will
+        be made to :load_fn: providing :load_fn_kwargs: as key value args. :load_fn: should return the data to
+        insert into QCache. Once the data has been pushed to QCache the query in executed again against the newly
+        created table.
+
+        :param key: Key for the table to query.
+        :param q: Dict with the query as described in the QCache documentation
+        :param load_fn: Function called to fetch data if not present in QCache.
+        :param load_fn_kwargs: Key-value arguments to load_fn
+        :param content_type: application/json or text/csv depending on uploaded content
+        :param accept: Response type or list of response types, see :meth:`get`.
+        :param post_headers: dict with additional headers to include when pushing data to the caches.
+                             Key - header name
+                             Value - header value
+        :param post_query: If True the query will be executed using a POST rather than GET, if False using GET.
+                           Defaults to selecting the method based on the size of the query, see post_query_threshold.
+        :param query_headers: dict with additional headers to include when issuing query.
+                              Key - header name
+                              Value - header value
+        :param timeout: Max number of seconds for the complete operation, including retries and reloads.
+                        Note that an ongoing call to :load_fn: is not interrupted.
+        :return: QueryResult: Contains the result of the query.
+        :raises MalformedQueryException:
+        :raises UnsupportedAcceptType:
+        :raises UnexpectedServerResponse:
+        :raises TooManyConsecutiveErrors:
+        :raises NoCacheAvailable:
+        :raises ConcurrencyLimitExceeded:
+        :raises RetryBudgetExhausted:
+        :raises DeadlineExceeded:
+        :raises QuorumNotReached:
+        """
+        deadline = _deadline(timeout)
+        content = None
+        try_count = 0
+        post_stats = {}
+        while True:
+            result = self._get(key, q, accept, post_query, query_headers, deadline)
+            if result is not None:
+                result.add_stats(post_stats)
+                return result
+
+            try_count += 1
+            if try_count > self.consecutive_error_count_limit:
+                raise TooManyConsecutiveErrors(
+                    'Unable to query dataset after {try_count} tries, this is probably a sign of problems'.format(try_count=try_count))
+
+            if try_count > 1:
+                # The data was lost again after being posted, reloading it is a retry
+                self._consume_retry(self.node_ring.get_node(key))
+
+            if content is None:
+                _check_deadline(deadline)
+                t0 = clock()
+                content = self._load(key, load_fn, load_fn_kwargs or {})
+                if self.key_usage is not None:
+                    self.key_usage.record_load(key, clock() - t0)
+
+            post_stats = self._post(key, content, content_type, post_headers, deadline)
+
+    def delete(self, key, timeout=None, everywhere=False):
+        """
+        Delete table stored under key from QCache.
+
+        NOTE: If more than one QCache node is used there is no guarantee that the table is completely removed
+              since it may be stored in multiple location depending events.
+
+              Example:
+              A small installation with two Qaches, qc1 and qc2. Table t1 is stored on qc1. qc1 disappears for unknown
+              reason. t1 is then stored and read from t2 instead. Later t1 comes back. Data is now read from qc1
+              instead. A delete would in this case be issued against qc1, after the delete qc2 would still hold a
+              copy of t1.
+
+              The delete is issued against all candidate nodes for the key according to the routing policy.
+              Use :everywhere: to remove any stale copies as well.
+
+        :param key: Key for the table to delete
+        :param timeout: Max number of seconds for the complete operation, including retries.
+        :param everywhere: If set the delete is sent to all live nodes in parallel. Failing deletes are not
+                           retried and do not cause nodes to be dropped.
+        :raises UnexpectedServerResponse:
+        :raises TooManyConsecutiveErrors:
+        :raises NoCacheAvailable:
+        :raises ConcurrencyLimitExceeded:
+        :raises RetryBudgetExhausted:
+        :raises DeadlineExceeded:
+        :return: None, or if :everywhere: is set a dict with the HTTP status code of the delete per node.
+                 The status code is None if the delete failed.
+        """
+        if everywhere:
+            return self.delete_many([key], timeout=timeout, everywhere=True)[key]
+
+        self._check_fork()
+        deadline = _deadline(timeout)
+        while True:
+            for node in self._delete_nodes(key, deadline):
+                deleted = False
+                with self._connection_error_manager(node):
+                    self._request(node, 'delete', self.session.delete, self._key_url(node, key), deadline=deadline)
+                    deleted = True
+
+                if not deleted:
+                    # Node dropped, retry against new candidates
+                    self._consume_retry(node)
+                    break
+            else:
+                self._forget_key(key)
+                return
+
+    def delete_many(self, keys, timeout=None, everywhere=False):
+        """
+        Delete multiple tables from QCache. All deletes are issued in parallel and on a best effort basis,
+        failing deletes are not retried and do not cause nodes to be dropped.
+
+        :param keys: Keys for the tables to delete
+        :param timeout: Max number of seconds for the complete operation.
+        :param everywhere: If set the deletes are sent to all live nodes, otherwise to the candidate nodes for
+                           each key according to the routing policy.
+        :raises NoCacheAvailable:
+        :return: dict with one entry per key containing a dict with the HTTP status code of the delete per node.
+                 The status code is None if the delete failed.
+        """
+        self._check_fork()
+        deadline = _deadline(timeout)
+        if everywhere:
+            live_nodes = [node for node in self.node_list if node not in self.failing_nodes]
+            targets = [(key, node) for key in keys for node in live_nodes]
+        else:
+            targets = [(key, node) for key in keys for node in self._delete_nodes(key, deadline)]
+
+        def delete_on_node(target):
+            key, node = target
+            try:
+                response = self._request(node, 'delete', self.session.delete, self._key_url(node, key), deadline=deadline)
+                self.statistics[node]['deletes'] += 1
+                return response.status_code
+            except (RequestException, QClientException):
+                self.statistics[node]['delete_errors'] += 1
+                return None
+
+        outcomes = dict((key, {}) for key in keys)
+        for (key, node), status_code in zip(targets, self._executor.map(delete_on_node, targets)):
+            outcomes[key][node] = status_code
+
+        for key in keys:
+            self._forget_key(key)
+
+        return outcomes
+
+    def register_refresh(self, key, load_fn, refresh_interval, load_fn_kwargs=None, check_interval=None,
+                         content_type='text/csv', post_headers=None):
+        """
+        Keep the dataset stored under key loaded in QCache by refreshing it in the background. This keeps
+        the expensive reload of data off the critical path of :meth:`query` for hot datasets.
+
+        The data is fetched using :load_fn: and posted immediately and then every :refresh_interval: seconds.
+        Set :refresh_interval: lower than the max age of the dataset in QCache to have it replaced before
+        it expires. If :check_interval: is set the presence of the dataset is also checked that often and
+        the dataset is reloaded right away if it has been evicted.
+
+        Refresh counts, durations and failures are included in the statistics.
+
+        :param key: Key to store the table under.
+        :param load_fn: Function called to fetch the data.
+        :param refresh_interval: Number of seconds between refreshes.
+        :param load_fn_kwargs: Key-value arguments to load_fn
+        :param check_interval: Number of seconds between checks for evicted datasets. None disables checks.
+        :param content_type: application/json or text/csv depending on uploaded content
+        :param post_headers: dict with additional headers to include when pushing data to the caches.
+        :return: None
+        """
+        self._check_fork()
+        if self._refresh_ahead is None:
+            self._refresh_ahead = RefreshAhead(self)
+
+        self._refresh_ahead.register(key, load_fn, refresh_interval, load_fn_kwargs=load_fn_kwargs,
+                                     check_interval=check_interval, content_type=content_type,
+                                     post_headers=post_headers)
+
+    def unregister_refresh(self, key):
+        """
+        Stop refreshing the dataset stored under key. The dataset is not removed from QCache.
+
+        :param key: Key previously registered using :meth:`register_refresh`
+        :return: None
+        """
+        if self._refresh_ahead is not None:
+            self._refresh_ahead.unregister(key)
+
+    def close(self):
+        """
+        Stop background refreshes and release threads and connections held by the client.
+
+        :return: None
+        """
+        self._check_fork()
+        if self._refresh_ahead is not None:
+            self._refresh_ahead.stop()
+
+        self._executor.close()
+        self.session.close()
+        with self._pipelines_lock:
+            for connections in self._pipelines.values():
+                for connection in connections:
+                    connection.close()
+            self._pipelines.clear()
+
+    def post_partitioned(self, key, content, partition_count, content_type='text/csv', partition_column=None,
+                         post_headers=None):
+        """
+        Split table data into partition_count partitions and post each partition to QCache under a
+        separate key. The partitions are distributed over the nodes like any other key.
+
+        :param key: Key to store the table under
+        :param content: String with content encoded either as CSV or JSON.
+        :param partition_count: Number of partitions to split the table into.
+        :param content_type: application/json or text/csv depending on uploaded content
+        :param partition_column: Rows are assigned to partitions based on the hash of the value in this column.
+                                 If not set rows are assigned to partitions round robin.
+        :param post_headers: dict with additional headers to include.
+                             Key - header name
+                             Value - header value
+        :return: List with insert statistics for each partition
+        :raises UnexpectedServerResponse:
+        :raises TooManyConsecutiveErrors:
+        :raises NoCacheAvailable:
+        :raises ConcurrencyLimitExceeded:
+        :raises RetryBudgetExhausted:
+        """
+        self._check_fork()
+        parts = partition.split_content(content, partition_count, content_type=content_type,
+                                        partition_column=partition_column)
+
+        def post_part(index):
+            return self.post(partition.partition_key(key, index, partition_count), parts[index],
+                             content_type=content_type, post_headers=post_headers)
+
+        return self._executor.map(post_part, range(partition_count))
+
+    def get_partitioned(self, key, q, partition_count, post_query=None, query_headers=None):
+        """
+        Execute query against all partitions of a table stored using :meth:`post_partitioned` in parallel
+        and merge the results.
+
+        Ordering, slicing, distinct and the aggregates sum, count, min and max are applied to the
+        merged result. Other aggregates and sub queries are not supported. The result is always JSON.
+
+        :param key: Key for the table to query.
+        :param q: Dict with the query as described in the QCache documentation
+        :param partition_count: Number of partitions that the table was split into.
+        :param post_query: If True the query will be executed using a POST rather than GET, if False using GET.
+                           Defaults to selecting the method based on the size of the query, see post_query_threshold.
+        :param query_headers: dict with additional headers to include when issuing query.
+                              Key - header name
+                              Value - header value
+        :returns QueryResult: Contains the merged result or None if any of the partitions is missing.
+        :raises MalformedQueryException:
+        :raises UnexpectedServerResponse:
+        :raises TooManyConsecutiveErrors:
+        :raises NoCacheAvailable:
+        :raises ConcurrencyLimitExceeded:
+        :raises RetryBudgetExhausted:
+        """
+        self._check_fork()
+        partition_q = partition.partition_query(q)
+
+        def get_part(index):
+            return self.get(partition.partition_key(key, index, partition_count), partition_q,
+                            accept='application/json', post_query=post_query, query_headers=query_headers)
+
+        results = self._executor.map(get_part, range(partition_count))
+        if any(result is None for result in results):
+            return None
+
+        rows, unsliced_result_len = partition.merge_results(
+            q,
+            [json.loads(result.content.decode('utf-8')) for result in results],
+            [result.unsliced_result_len for result in results])
+
+        # Partitions are queried in parallel, the slowest partition determines the duration
+        statistics = {}
+        for result in results:
+            for name, value in result.statistics.items():
+                statistics[name] = max(value, statistics.get(name, value))
+
+        return QueryResult.from_content(json.dumps(rows).encode('utf-8'), unsliced_result_len,
+                                        statistics=statistics)
+
+    def query_partitioned(self, key, q, partition_count, load_fn, load_fn_kwargs=None, content_type='text/csv',
+                          partition_column=None, post_headers=None, post_query=None, query_headers=None):
+        """
+        Same as :meth:`query` but for tables split into partitions. If any of the partitions are missing
+        the complete table is fetched using :load_fn:, partitioned and pushed to QCache.
+
+        See :meth:`post_partitioned` and :meth:`get_partitioned` for a description of the parameters.
+
+        :return: QueryResult: Contains the merged result of the query.
+        :raises MalformedQueryException:
+        :raises UnexpectedServerResponse:
+        :raises TooManyConsecutiveErrors:
+        :raises NoCacheAvailable:
+        :raises ConcurrencyLimitExceeded:
+        :raises RetryBudgetExhausted:
+        """
+        content = None
+        try_count = 0
+        while True:
+            result = self.get_partitioned(key, q, partition_count, post_query, query_headers)
+            if result is not None:
+                return result
+
+            try_count += 1
+            if try_count > self.consecutive_error_count_limit:
+                raise TooManyConsecutiveErrors(
+                    'Unable to query dataset after {try_count} tries, this is probably a sign of problems'.format(try_count=try_count))
+
+            if try_count > 1:
+                # The data was lost again after being posted, reloading it is a retry
+                self._consume_retry(self.node_ring.get_node(key))
+
+            if content is None:
+                kwargs = load_fn_kwargs or {}
+                content = load_fn(**kwargs)
+
+            self.post_partitioned(key, content, partition_count, content_type=content_type,
+                                  partition_column=partition_column, post_headers=post_headers)
@@ -0,0 +1,87 @@
+"""
+Decoding of query results, see :meth:`QueryResult.decode`.
+
+Responses compressed using gzip or deflate are decompressed when received. Responses compressed
+using lz4, which is the most efficient for large results, are decompressed on demand and require
+the lz4 package, install qcache-client[lz4] to get it.
+
+Decoders for other content types than JSON and CSV can be added using :func:`register_decoder`.
+"""
+import csv
+import io
+import json
+import sys
+
+from qclient.exceptions import UnsupportedEncoding
+
+
+def lz4_available():
+    try:
+        import lz4.block  # noqa
+    except ImportError:
+        return False
+    return True
+
+
+def accept_encoding(encodings):
+    """
+    :param encodings: Content encodings in order of preference, eg. ['lz4', 'gzip'].
+    :return: Value for the Accept-Encoding header with the encodings that can be decoded, lz4 is
+             left out if the lz4 package is not installed.
+    """
+    return ', '.join(encoding for encoding in encodings if encoding != 'lz4' or lz4_available())
+
+
+def decompress(content, encoding):
+    """
+    :param content: Byte string as received.
+    :param encoding: Content-Encoding of the content.
+    :return: The decompressed content.
+    """
+    if encoding in (None, '', 'identity', 'gzip', 'deflate'):
+        # Decompressed by the HTTP client
+        return content
+
+    if encoding == 'lz4':
+        import lz4.block
+        return lz4.block.decompress(content)
+
+    raise UnsupportedEncoding('Unsupported content encoding "{encoding}"'.format(encoding=encoding))
+
+
+def _decode_json(content):
+    return json.loads(content.decode('utf-8'))
+
+
+def _decode_csv(content):
+    if sys.version_info[0] == 2:
+        return list(csv.DictReader(io.BytesIO(content)))
+    return list(csv.DictReader(io.StringIO(content.decode('utf-8'), newline='')))
+
+
+_DECODERS = {'application/json': _decode_json,
+             'text/csv': _decode_csv}
+
+
+def register_decoder(content_type, decoder):
+    """
+    Add a decoder for a content type, replacing any existing decoder for it.
+
+    :param content_type: Content type, eg. application/x-msgpack.
+    :param decoder: Function taking the decompressed content as a byte string.
+    """
+    _DECODERS[content_type] = decoder
+
+
+def decode(content, content_type):
+    """
+    :param content: Decompressed content.
+    :param content_type: Content-Type of the content, parameters such as charset are ignored.
+    :return: The decoded content, a list of dicts for JSON and CSV. Note that CSV values are strings.
+    """
+    media_type = (content_type or 'application/json').split(';')[0].strip().lower()
+    decoder = _DECODERS.get(media_type)
+    if decoder is None:
+        raise UnsupportedEncoding('No decoder for content type "{content_type}"'.format(content_type=content_type))
+
+    return decoder(content)
@@ -0,0 +1,80 @@
+class QClientException(Exception):
+    """
+    Base exception for all other exceptions raised in QClient
+    """
+    pass
+
+
+class NoCacheAvailable(QClientException):
+    """
+    Raised when no qcaches are deemed reachable from the currnent node.
+    """
+    pass
+
+
+class TooManyConsecutiveErrors(QClientException):
+    """
+    Raised to when operations have been retried too many times. This is done to avoid overloading
+    resources with failing requests. If raised it's probably an indicator of some misconfiguration
+    or network problem.
+    """
+    pass
+
+
+class UnexpectedServerResponse(QClientException):
+    """
+    Raised when the QCache server responded with an HTTP code that could not be interpreted.
+    """
+    pass
+
+
+class MalformedQueryException(QClientException):
+    """
+    Raised when the server was unable to process the query because of errors in syntax or semantics.
+    """
+    pass
+
+
+class UnsupportedAcceptType(QClientException):
+    """
+    Raised when the server cannot produce a response of the requested type.
+    """
+    pass
+
+
+class DeadlineExceeded(QClientException):
+    """
+    Raised when an operation could not be completed within the given timeout.
+    """
+    pass
+
+
+class QuorumNotReached(QClientException):
+    """
+    Raised when a replicated upload could not be stored on enough nodes to reach the write quorum.
+    """
+    pass
+
+
+class ConcurrencyLimitExceeded(QClientException):
+    """
+    Raised when the number of concurrent requests to a node is above the limit set by the
+    concurrency limiter and no slot was freed up within the max wait time.
+    """
+    pass
+
+
+class RetryBudgetExhausted(QClientException):
+    """
+    Raised when an operation should be retried but the retry budget has been used up. This is
+    done to avoid overloading the remaining nodes and upstream data sources when nodes are failing.
+    """
+    pass
+
+
+class UnsupportedEncoding(QClientException):
+    """
+    Raised when decoding a query result with a content type or content encoding that there is
+    no decoder for.
+    """
+    pass
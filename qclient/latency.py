@@ -0,0 +1,119 @@
+import threading
+import time
+
+# Monotonic clock when available (Python 3), wall clock otherwise
+clock = getattr(time, 'monotonic', time.time)
+
+# Latency percentiles reported by the benchmark and replay tools
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def percentile(ordered, p):
+    """
+    :param ordered: Sorted list of values.
+    :param p: Percentile, 0 - 100.
+    """
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100.0))]
+
+
+class LatencyEstimate(object):
+    """
+    Exponentially weighted moving average of a latency and its mean deviation. Same approach as
+    used by TCP to estimate the round trip time when computing retransmission timeouts.
+    """
+    def __init__(self, alpha=0.125, beta=0.25):
+        self.alpha = alpha
+        self.beta = beta
+        self.mean = None
+        self.deviation = 0.0
+        self.count = 0
+
+    def add(self, value):
+        if self.mean is None:
+            self.mean = value
+            self.deviation = value / 2.0
+        else:
+            self.deviation = (1 - self.beta) * self.deviation + self.beta * abs(value - self.mean)
+            self.mean = (1 - self.alpha) * self.mean + self.alpha * value
+
+        self.count += 1
+
+    def upper_bound(self, deviations=4):
+        return self.mean + deviations * self.deviation
+
+
+class LatencyTracker(object):
+    """
+    Tracks latency per node and operation.
+
+    For operations where the size of the payload is given the latency is tracked per byte,
+    the size of a request then needs to be given when fetching the estimate.
+    """
+    def __init__(self):
+        self._estimates = {}
+        self._lock = threading.Lock()
+
+    def record(self, node, operation, duration, size=None):
+        value = duration / size if size else duration
+        with self._lock:
+            estimate = self._estimates.get((node, operation))
+            if estimate is None:
+                estimate = self._estimates[(node, operation)] = LatencyEstimate()
+
+            estimate.add(value)
+
+    def estimate(self, node, operation):
+        """
+        :return: LatencyEstimate for node and operation or None if no latencies have been recorded.
+        """
+        return self._estimates.get((node, operation))
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+
+class TimeoutPolicy(object):
+    """
+    Derives read timeouts for requests to a node.
+
+    With adaptive timeouts disabled the configured read timeout is used for all operations
+    except posts which get ten times the configured timeout since parsing uploaded data
+    generally takes longer than executing queries.
+
+    With adaptive timeouts enabled the timeout is derived from the observed latencies
+    (mean + 4 * mean deviation) once min_samples observations have been made. Timeouts for
+    posts are scaled with the size of the payload. The result is always kept within
+    [min_read_timeout, max_read_timeout].
+    """
+    def __init__(self, connect_timeout, read_timeout, adaptive=False, min_read_timeout=0.1,
+                 max_read_timeout=None, min_samples=10):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.adaptive = adaptive
+        self.min_read_timeout = min_read_timeout
+        self.max_read_timeout = max_read_timeout if max_read_timeout is not None else 10 * read_timeout
+        self.min_samples = min_samples
+        self.tracker = LatencyTracker()
+
+    def _static_read_timeout(self, operation):
+        return 10 * self.read_timeout if operation == 'post' else self.read_timeout
+
+    def read_timeout_for(self, node, operation, size=None):
+        if not self.adaptive:
+            return self._static_read_timeout(operation)
+
+        estimate = self.tracker.estimate(node, operation)
+        if estimate is None or estimate.count < self.min_samples:
+            return self._static_read_timeout(operation)
+
+        timeout = estimate.upper_bound()
+        if operation == 'post' and size:
+            timeout *= size
+
+        return min(max(timeout, self.min_read_timeout), self.max_read_timeout)
+
+    def timeout_for(self, node, operation, size=None):
+        return self.connect_timeout, self.read_timeout_for(node, operation, size)
+
+    def record(self, node, operation, duration, size=None):
+        self.tracker.record(node, operation, duration, size if operation == 'post' else None)
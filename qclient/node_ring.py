@@ -1,26 +1,121 @@
 from bisect import bisect
+from collections import OrderedDict
 import hashlib
 from math import ceil
+import struct
 import sys
+import threading
 
 if sys.version_info[0] >= 3:
     _ord = lambda x: x
 else:
     _ord = ord
 
+_unpack_key = struct.Struct('<I').unpack_from
+
+# Rings built for a given configuration, shared between NodeRing instances until modified
+_MAX_SHARED_RINGS = 64
+_shared_rings = OrderedDict()
+_shared_rings_lock = threading.Lock()
+
+SNAPSHOT_VERSION = 1
+
+if hasattr(OrderedDict, 'move_to_end'):
+    def _touch(memo, key):
+        try:
+            memo.move_to_end(key)
+        except KeyError:
+            # Evicted by another thread
+            pass
+else:
+    def _touch(memo, key):
+        entry = memo.pop(key, None)
+        if entry is not None:
+            memo[key] = entry
+
+
 class NodeRing(object):
-    def __init__(self, nodes, weights=None, virtual_count=None):
+    """
+    Consistent hash ring mapping keys to nodes.
+
+    The ring is built on the first lookup. Rings with the same nodes, weights and virtual
+    count share the built ring until one of them is modified.
+
+    Lookups may run concurrently with a modification. Modifications build a new ring and publish
+    it in a single assignment, lookups see either the old or the new ring. Modifications must not
+    run concurrently with each other.
+
+    :param nodes: Nodes in the ring.
+    :param weights: Optional dict with the weight of nodes, nodes not included get weight 1.
+                    Each node is given weight * virtual_count virtual nodes, rounded to the
+                    nearest integer, so fractional weights are supported.
+    :param virtual_count: Number of virtual nodes per unit of weight.
+    :param memo_size: Number of recently looked up keys to remember the node for, saving the hashing
+                      and search on repeated lookups. Only the entries affected by changes to the ring
+                      are invalidated. 0 disables the memo.
+    """
+    def __init__(self, nodes, weights=None, virtual_count=None, memo_size=1024):
+        nodes = list(nodes)
         assert nodes
 
-        self.ring = {}
-        self.sorted_keys = []
-        self.weights = weights or {}
+        # Tuple (ring, sorted_keys), replaced as a whole on every change and never modified in place
+        self._state = None
+        self._node_set = None
+        self._pending_nodes = nodes
+        self.weights = dict(weights or {})
+        self.memo_size = memo_size
+        self._memo = OrderedDict()
+
+        # Incremented on every change to the ring
+        self.version = 0
 
         # If number of virtual nodes per real node is not given aim for 1000 nodes in
         # total. That will provide a fairly decent distribution without too much overhead
         # when creating the circle or adding/removing nodes.
         self.virtual_count = virtual_count if virtual_count else int(ceil(1000.0 / len(nodes)))
-        self.add_nodes(nodes)
+
+    def _config(self):
+        return (tuple(self._pending_nodes), tuple(sorted(self.weights.items())), self.virtual_count)
+
+    def _build(self):
+        config = self._config()
+        with _shared_rings_lock:
+            built = _shared_rings.get(config)
+            if built is not None:
+                _shared_rings.pop(config)
+                _shared_rings[config] = built
+
+        if built is None:
+            ring = {}
+            for node in self._pending_nodes:
+                for key in self.keys_for_node(node):
+                    ring[key] = node
+            built = (ring, sorted(ring))
+            with _shared_rings_lock:
+                _shared_rings[config] = built
+                if len(_shared_rings) > _MAX_SHARED_RINGS:
+                    _shared_rings.popitem(last=False)
+
+        self._state = built
+        self._pending_nodes = None
+        return built
+
+    def _current(self):
+        state = self._state
+        return state if state is not None else self._build()
+
+    def _publish(self, ring, sorted_keys):
+        self._state = (ring, sorted_keys)
+        self._node_set = None
+        self.version += 1
+
+    @property
+    def ring(self):
+        return self._current()[0]
+
+    @property
+    def sorted_keys(self):
+        return self._current()[1]
 
     def add_node(self, node, weight=None):
         if weight:
@@ -29,33 +124,187 @@ class NodeRing(object):
         self.add_nodes([node])
 
     def remove_node(self, node):
-        node_keys = set(self.keys_for_node(node))
-        self.sorted_keys = [key for key in self.sorted_keys if key not in node_keys]
-        for node_key in node_keys:
-            del self.ring[node_key]
+        old_ring, old_sorted_keys = self._current()
+        ring = dict((key, owner) for key, owner in old_ring.items() if owner != node)
+        self._publish(ring, [key for key in old_sorted_keys if key in ring])
 
         self.weights.pop(node, None)
 
-    def keys_for_node(self, node):
-        return [generate_key("{node}-{i}".format(node=node, i=i))
-                for i in range(self.weights.get(node, 1) * self.virtual_count)]
+        # Only keys on the removed node move
+        for string_key in [k for k, (_, owner) in self._memo.items() if owner == node]:
+            self._memo.pop(string_key, None)
+
+    def _virtual_node_count(self, weight):
+        return max(1, int(round(weight * self.virtual_count)))
+
+    def keys_for_node(self, node, start=0, stop=None):
+        stop = self._virtual_node_count(self.weights.get(node, 1)) if stop is None else stop
+        return [generate_key("{node}-{i}".format(node=node, i=i)) for i in range(start, stop)]
+
+    def set_weight(self, node, weight):
+        """
+        Change the weight of node. If the node is in the ring only the virtual nodes added or
+        removed by the change are hashed and moved, all other keys stay on their nodes.
+        """
+        old_count = self._virtual_node_count(self.weights.get(node, 1))
+        new_count = self._virtual_node_count(weight)
+        self.weights[node] = weight
+        if self._state is None or new_count == old_count or node not in self:
+            # Nothing built yet, or the weight is applied when the node is added
+            return
+
+        old_ring, old_sorted_keys = self._state
+        ring = dict(old_ring)
+        if new_count > old_count:
+            added = self.keys_for_node(node, old_count, new_count)
+            for key in added:
+                ring[key] = node
+            sorted_keys = sorted(old_sorted_keys + added)
+        else:
+            removed = set(key for key in self.keys_for_node(node, new_count, old_count) if ring.get(key) == node)
+            for key in removed:
+                del ring[key]
+            sorted_keys = [key for key in old_sorted_keys if key not in removed]
+
+        self._publish(ring, sorted_keys)
+        self._update_memo()
 
     def add_nodes(self, nodes):
+        old_ring, old_sorted_keys = self._current()
+        ring = dict(old_ring)
+        sorted_keys = list(old_sorted_keys)
         for node in nodes:
             for key in self.keys_for_node(node):
-                self.ring[key] = node
-                self.sorted_keys.append(key)
+                ring[key] = node
+                sorted_keys.append(key)
+
+        sorted_keys.sort()
+        self._publish(ring, sorted_keys)
+        self._update_memo()
 
-        self.sorted_keys.sort()
+    def _update_memo(self):
+        # Look up the node again for remembered keys using their stored hashes, no need to rehash
+        state = self._state
+        if not state[1]:
+            self._memo.clear()
+            return
+
+        for string_key, (key, _) in list(self._memo.items()):
+            self._memo[string_key] = (key, self._lookup(state, key))
+
+    @staticmethod
+    def _lookup(state, key):
+        ring, sorted_keys = state
+        pos = bisect(sorted_keys, key)
+        pos %= len(sorted_keys)
+        return ring[sorted_keys[pos]]
+
+    def _remember(self, string_key, key, node, state):
+        memo = self._memo
+        entry = memo[string_key] = (key, node)
+        if len(memo) > self.memo_size:
+            try:
+                memo.popitem(last=False)
+            except KeyError:
+                pass
+
+        # Changes publish the new state before updating the memo. If the ring changed since node was looked
+        # up the update may already have been done without this entry, forget it.
+        if self._state is not state and memo.get(string_key) is entry:
+            memo.pop(string_key, None)
 
     def get_node(self, string_key):
-        if not self.sorted_keys:
+        entry = self._memo.get(string_key)
+        if entry is not None:
+            _touch(self._memo, string_key)
+            return entry[1]
+
+        state = self._current()
+        if not state[1]:
             return None
 
         key = generate_key(string_key)
-        pos = bisect(self.sorted_keys, key)
-        pos %= len(self.sorted_keys)
-        return self.ring[self.sorted_keys[pos]]
+        node = self._lookup(state, key)
+        if self.memo_size:
+            self._remember(string_key, key, node, state)
+        return node
+
+    def get_nodes(self, string_key, count):
+        """
+        Return up to count distinct nodes for string_key. The first node is the one
+        returned by get_node, the following are its successors on the ring.
+        """
+        ring, sorted_keys = self._current()
+        if not sorted_keys:
+            return []
+
+        entry = self._memo.get(string_key)
+        key = entry[0] if entry is not None else generate_key(string_key)
+        pos = bisect(sorted_keys, key)
+        nodes = []
+        for i in range(len(sorted_keys)):
+            node = ring[sorted_keys[(pos + i) % len(sorted_keys)]]
+            if node not in nodes:
+                nodes.append(node)
+                if len(nodes) == count:
+                    break
+
+        return nodes
+
+    def __contains__(self, node):
+        if self._node_set is None:
+            self._node_set = frozenset(self.ring.values())
+        return node in self._node_set
+
+    def node_count(self):
+        """
+        :return: Number of nodes currently in the ring.
+        """
+        if self._node_set is None:
+            self._node_set = frozenset(self.ring.values())
+        return len(self._node_set)
+
+    def nodes(self):
+        """
+        :return: Sorted list of the nodes currently in the ring.
+        """
+        return sorted(set(self.ring.values()))
+
+    def snapshot(self):
+        """
+        :return: JSON serializable representation of the ring that can be loaded using :meth:`from_snapshot`
+                 without computing any hashes.
+        """
+        ring, sorted_keys = self._current()
+        nodes = sorted(set(ring.values()))
+        index = dict((node, i) for i, node in enumerate(nodes))
+        return {'version': SNAPSHOT_VERSION,
+                'virtual_count': self.virtual_count,
+                'nodes': nodes,
+                'weights': dict((node, weight) for node, weight in self.weights.items() if node in index),
+                'keys': list(sorted_keys),
+                'owners': [index[ring[key]] for key in sorted_keys]}
+
+    @classmethod
+    def from_snapshot(cls, snapshot, memo_size=1024):
+        """
+        Create ring from a snapshot taken using :meth:`snapshot`.
+        """
+        if snapshot.get('version') != SNAPSHOT_VERSION:
+            raise ValueError('Unsupported ring snapshot version: {version}'.format(version=snapshot.get('version')))
+
+        nodes = snapshot['nodes']
+        ring = cls.__new__(cls)
+        ring.weights = dict(snapshot['weights'])
+        ring.virtual_count = snapshot['virtual_count']
+        ring._pending_nodes = None
+        sorted_keys = list(snapshot['keys'])
+        ring._state = (dict(zip(sorted_keys, (nodes[i] for i in snapshot['owners']))), sorted_keys)
+        ring._node_set = None
+        ring.memo_size = memo_size
+        ring._memo = OrderedDict()
+        ring.version = 0
+        return ring
 
 
 def hash_digest(key):
@@ -65,5 +314,5 @@ def hash_digest(key):
 
 
 def generate_key(key):
-    byte_key = hash_digest(key)
-    return (byte_key[3] << 24) | (byte_key[2] << 16) | (byte_key[1] << 8) | byte_key[0]
+    # The first four bytes of the digest as a little endian integer
+    return _unpack_key(hashlib.md5(key.encode('utf-8')).digest())[0]
@@ -0,0 +1,134 @@
+import threading
+
+from qclient.latency import clock
+
+
+class _NodeLimit(object):
+    def __init__(self, limit):
+        self.limit = float(limit)
+        self.in_flight = 0
+
+
+class AIMDLimiter(object):
+    """
+    Adaptive limit on the number of concurrent requests per node.
+
+    The limit is increased additively, roughly by one for every limit successful requests, and
+    decreased multiplicatively when a request to the node times out, fails to connect or is
+    rejected by the node as overloaded.
+
+    Requests over the limit wait up to max_wait seconds for a slot before being rejected.
+
+    :param initial_limit: Limit used for nodes until adapted.
+    :param min_limit: Lower bound for the limit.
+    :param max_limit: Upper bound for the limit.
+    :param backoff_ratio: Factor to multiply the limit with on overload.
+    :param max_wait: Max number of seconds to wait for a slot, 0 fails immediately.
+    """
+    def __init__(self, initial_limit=10, min_limit=1, max_limit=200, backoff_ratio=0.5, max_wait=0.0):
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.max_wait = max_wait
+        self._nodes = {}
+        self._condition = threading.Condition()
+
+    def _node_limit(self, node):
+        node_limit = self._nodes.get(node)
+        if node_limit is None:
+            node_limit = self._nodes[node] = _NodeLimit(self.initial_limit)
+        return node_limit
+
+    def acquire(self, node, timeout=None):
+        """
+        :param timeout: Optional max number of seconds to wait for a slot, eg. the time left until the
+                        deadline of the operation. The wait never exceeds max_wait.
+        :return: True if a slot was acquired, False if the request should be rejected.
+        """
+        max_wait = self.max_wait if timeout is None else max(0.0, min(self.max_wait, timeout))
+        with self._condition:
+            node_limit = self._node_limit(node)
+            deadline = None
+            while node_limit.in_flight >= int(node_limit.limit):
+                now = clock()
+                if deadline is None:
+                    deadline = now + max_wait
+
+                if now >= deadline:
+                    return False
+
+                self._condition.wait(deadline - now)
+
+            node_limit.in_flight += 1
+            return True
+
+    def release(self, node, overloaded=False):
+        with self._condition:
+            node_limit = self._node_limit(node)
+            node_limit.in_flight -= 1
+            if overloaded:
+                node_limit.limit = max(self.min_limit, node_limit.limit * self.backoff_ratio)
+            else:
+                node_limit.limit = min(self.max_limit, node_limit.limit + 1.0 / node_limit.limit)
+
+            self._condition.notify_all()
+
+    def state(self, node):
+        """
+        :return: dict with the current limit and number of requests in flight for node.
+        """
+        with self._condition:
+            node_limit = self._node_limit(node)
+            return dict(concurrency_limit=int(node_limit.limit), in_flight=node_limit.in_flight)
+
+    def _after_fork(self):
+        # Keep the learned limits, requests in flight belong to the parent process
+        self._condition = threading.Condition()
+        for node_limit in self._nodes.values():
+            node_limit.in_flight = 0
+
+
+class RetryBudget(object):
+    """
+    Token bucket limiting the number of retries to a fraction of the number of requests.
+
+    Every successful request deposits ratio tokens and a retry withdraws one token. In
+    addition min_retries_per_second tokens are deposited over time to allow for retries
+    when the request rate is low.
+
+    :param ratio: Max number of retries per request, on average.
+    :param min_retries_per_second: Number of retries that are always allowed per second.
+    :param max_tokens: Max number of tokens that can be accumulated.
+    """
+    def __init__(self, ratio=0.1, min_retries_per_second=1.0, max_tokens=100.0):
+        self.ratio = ratio
+        self.min_retries_per_second = min_retries_per_second
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self._last_refill = clock()
+        self._lock = threading.Lock()
+
+    def _add(self, tokens):
+        self.tokens = min(self.max_tokens, self.tokens + tokens)
+
+    def deposit(self):
+        with self._lock:
+            self._add(self.ratio)
+
+    def try_withdraw(self):
+        """
+        :return: True if a retry is allowed.
+        """
+        with self._lock:
+            now = clock()
+            self._add((now - self._last_refill) * self.min_retries_per_second)
+            self._last_refill = now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return True
+
+            return False
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
@@ -0,0 +1,57 @@
+import threading
+
+_local = threading.local()
+
+
+def _run_in_worker(args):
+    fn, item = args
+    _local.in_worker = True
+    try:
+        return fn(item)
+    finally:
+        _local.in_worker = False
+
+
+class ParallelExecutor(object):
+    """
+    Small wrapper around a thread pool used to fan out requests to multiple nodes.
+
+    The pool is created on first use. Calls made from within a worker thread are executed
+    sequentially in that thread to avoid dead locks when parallel operations are nested,
+    eg. a partitioned upload where each partition is in turn uploaded to multiple replicas.
+
+    :param max_workers: Max number of concurrent operations.
+    """
+    def __init__(self, max_workers=8):
+        self.max_workers = max_workers
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                from multiprocessing.pool import ThreadPool
+                self._pool = ThreadPool(self.max_workers)
+            return self._pool
+
+    def map(self, fn, items):
+        """
+        Apply fn to all items and return the results in the same order as the items.
+        The first exception raised by fn, if any, is propagated to the caller.
+        """
+        items = list(items)
+        if len(items) <= 1 or self.max_workers <= 1 or getattr(_local, 'in_worker', False):
+            return [fn(item) for item in items]
+
+        return self._get_pool().map(_run_in_worker, [(fn, item) for item in items])
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool = None
+
+    def _after_fork(self):
+        # The threads of the pool only exist in the parent process
+        self._pool = None
+        self._lock = threading.Lock()
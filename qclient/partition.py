@@ -0,0 +1,205 @@
+"""
+Helpers for splitting a dataset into partitions stored under separate keys and for merging
+the results of running the same query against all partitions.
+"""
+import csv
+import io
+import json
+from itertools import cycle
+import sys
+
+from qclient.node_ring import generate_key
+
+# Aggregate functions that can be computed per partition and then combined on the client
+# together with the function used to combine the partial results.
+_MERGEABLE_AGGREGATES = {
+    'sum': sum,
+    'count': sum,
+    'min': min,
+    'max': max,
+}
+
+
+def partition_key(key, index, count):
+    return '{key}_p{index}of{count}'.format(key=key, index=index, count=count)
+
+
+def _to_text(content):
+    if isinstance(content, bytes):
+        return content.decode('utf-8')
+    return content
+
+
+def _partition_indices(rows, count, value_fn):
+    if value_fn is None:
+        return cycle(range(count))
+
+    return (generate_key(u'{0}'.format(value_fn(row))) % count for row in rows)
+
+
+def split_content(content, count, content_type='text/csv', partition_column=None):
+    """
+    Split content into count parts.
+
+    :param content: String with CSV or JSON (list of objects) content.
+    :param count: Number of partitions.
+    :param content_type: application/json or text/csv
+    :param partition_column: If given rows are placed in partitions based on the hash of the
+                             value in this column, otherwise rows are distributed round robin.
+    :return: List of count strings with the same encoding as content.
+    """
+    content = _to_text(content)
+    if content_type == 'application/json':
+        rows = json.loads(content)
+
+        def value_fn(row):
+            return row[partition_column]
+
+        parts = [[] for _ in range(count)]
+        for index, row in zip(_partition_indices(rows, count, value_fn if partition_column else None), rows):
+            parts[index].append(row)
+
+        return [json.dumps(part) for part in parts]
+
+    if content_type != 'text/csv':
+        raise ValueError('Unable to partition content of type "{content_type}"'.format(content_type=content_type))
+
+    if sys.version_info[0] == 2:
+        # The Python 2 csv module only handles byte strings
+        content = content.encode('utf-8')
+        buffer_class = io.BytesIO
+    else:
+        buffer_class = io.StringIO
+
+    reader = csv.reader(buffer_class(content))
+    header = next(reader)
+    rows = list(reader)
+    column_index = header.index(partition_column) if partition_column else None
+
+    def value_fn(row):
+        return _to_text(row[column_index])
+
+    outputs = [buffer_class() for _ in range(count)]
+    writers = [csv.writer(output) for output in outputs]
+    for writer in writers:
+        writer.writerow(header)
+
+    for index, row in zip(_partition_indices(rows, count, value_fn if partition_column else None), rows):
+        writers[index].writerow(row)
+
+    return [output.getvalue() for output in outputs]
+
+
+def _aggregates(q):
+    return [(column[1], column[0]) for column in q.get('select', [])
+            if isinstance(column, (list, tuple)) and len(column) == 2 and column[0] in _MERGEABLE_AGGREGATES]
+
+
+def _is_aggregate(q):
+    return bool(q.get('group_by')) or bool(_aggregates(q))
+
+
+def _limit_pushed_down(q):
+    return 'limit' in q and not _is_aggregate(q) and q.get('distinct') is None
+
+
+def partition_query(q):
+    """
+    Rewrite q into the query that should be executed against each partition.
+
+    Slicing is moved to the client since it has to be applied to the merged result.
+    Ordering is kept for non aggregated queries to allow each partition to return only
+    the rows that may end up in the final result.
+    """
+    if 'from' in q:
+        raise ValueError('Sub queries cannot be executed against partitioned datasets')
+
+    for column in q.get('select', []):
+        if isinstance(column, (list, tuple)) and column and column[0] not in _MERGEABLE_AGGREGATES:
+            raise ValueError('Select expression {column} cannot be merged across partitions'.format(column=column))
+
+    partition_q = dict(q)
+    partition_q.pop('offset', None)
+    partition_q.pop('limit', None)
+    if _is_aggregate(q):
+        partition_q.pop('order_by', None)
+    elif _limit_pushed_down(q):
+        partition_q['limit'] = q.get('offset', 0) + q['limit']
+
+    return partition_q
+
+
+def _merge_groups(q, rows):
+    group_by = q.get('group_by', [])
+    aggregates = _aggregates(q)
+    groups = {}
+    order = []
+    for row in rows:
+        group_key = tuple(row.get(column) for column in group_by)
+        existing = groups.get(group_key)
+        if existing is None:
+            groups[group_key] = dict(row)
+            order.append(group_key)
+            continue
+
+        for column, fn in aggregates:
+            existing[column] = _MERGEABLE_AGGREGATES[fn]([existing[column], row[column]])
+
+    return [groups[group_key] for group_key in order]
+
+
+def _distinct(q, rows):
+    columns = q['distinct'] or None
+    seen = set()
+    result = []
+    for row in rows:
+        row_key = tuple(row.get(c) for c in columns) if columns else tuple(sorted(row.items()))
+        if row_key not in seen:
+            seen.add(row_key)
+            result.append(row)
+
+    return result
+
+
+def _sort(q, rows):
+    # Stable sort on each column, least significant column first
+    for column in reversed(q['order_by']):
+        descending = column.startswith('-')
+        name = column[1:] if descending else column
+        rows.sort(key=lambda row: (row.get(name) is not None, row.get(name)), reverse=descending)
+
+    return rows
+
+
+def merge_results(q, partition_rows, partition_unsliced_lens):
+    """
+    Merge the rows returned from each partition into the result of executing q against
+    the complete dataset.
+
+    :param q: The original query.
+    :param partition_rows: List with one list of rows (dicts) per partition.
+    :param partition_unsliced_lens: List with the unsliced result length reported by each partition.
+    :return: Tuple (rows, unsliced_result_len)
+    """
+    rows = [row for part in partition_rows for row in part]
+    if _is_aggregate(q):
+        rows = _merge_groups(q, rows)
+
+    if q.get('distinct') is not None:
+        rows = _distinct(q, rows)
+
+    if q.get('order_by'):
+        rows = _sort(q, rows)
+
+    if _limit_pushed_down(q):
+        unsliced_result_len = sum(partition_unsliced_lens)
+    else:
+        unsliced_result_len = len(rows)
+
+    offset = q.get('offset', 0)
+    if 'limit' in q:
+        rows = rows[offset:offset + q['limit']]
+    elif offset:
+        rows = rows[offset:]
+
+    return rows, unsliced_result_len
@@ -0,0 +1,172 @@
+"""
+HTTP/1.1 pipelining of queries to a node over a dedicated connection. All requests in a batch
+are written before the first response is read, so a batch of queries costs about one network
+round trip rather than one per query. Responses are returned in request order.
+"""
+import base64
+import socket
+import zlib
+
+try:
+    from http.client import HTTPException, HTTPResponse
+    from urllib.parse import quote, urlsplit
+except ImportError:
+    from httplib import HTTPException, HTTPResponse
+    from urllib import quote
+    from urlparse import urlsplit
+
+# Keep batches small enough for the requests to fit in the socket buffers, the server does not
+# read more requests while it's blocked writing responses that the client is not yet reading.
+MAX_DEPTH = 32
+
+# Characters left unquoted in dataset keys, the same as in URLs prepared by requests
+_SAFE_KEY_CHARACTERS = "!#$%&'()*+,/:;=?@[]~"
+
+# Errors that a batch may fail with
+ERRORS = (socket.error, HTTPException)
+
+
+class PipelinedResponse(object):
+    """
+    Response to a pipelined request with the attributes of a requests response used by the client.
+    """
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+
+class _NonClosingFile(object):
+    # HTTPResponse closes its file when the response has been read but the file
+    # is shared with the responses that follow on the connection.
+    def __init__(self, f):
+        self._file = f
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def close(self):
+        pass
+
+
+class _SharedFile(object):
+    # Stands in for the socket given to HTTPResponse, which reads through sock.makefile()
+    def __init__(self, f):
+        self._file = f
+
+    def makefile(self, *args, **kwargs):
+        return _NonClosingFile(self._file)
+
+
+def _decompress(content, encoding):
+    # Like requests, content compressed using gzip or deflate is decompressed right away
+    try:
+        if encoding == 'gzip':
+            return zlib.decompress(content, 16 + zlib.MAX_WBITS)
+        if encoding == 'deflate':
+            try:
+                return zlib.decompress(content)
+            except zlib.error:
+                # Raw deflate stream without zlib header
+                return zlib.decompress(content, -zlib.MAX_WBITS)
+    except zlib.error as e:
+        raise HTTPException('Failed to decompress {encoding} content: {error}'.format(encoding=encoding, error=e))
+
+    return content
+
+
+def supports_node(node):
+    """
+    :return: True if requests to node can be pipelined. Only plain HTTP is supported.
+    """
+    return urlsplit(node).scheme == 'http'
+
+
+def basic_auth_header(user, password):
+    user, password = [part if isinstance(part, bytes) else part.encode('latin1') for part in (user, password)]
+    return 'Basic ' + base64.b64encode(user + b':' + password).decode('ascii')
+
+
+class PipelinedConnection(object):
+    """
+    Connection to a node that queries are pipelined over. The connection is kept open between
+    batches and reopened if the server has closed it. Not thread safe.
+
+    :param node: Node address, eg. http://host1:9401
+    """
+    def __init__(self, node):
+        parts = urlsplit(node)
+        self.node = node
+        self._address = (parts.hostname, parts.port or 80)
+        self._host = parts.netloc
+        self._prefix = parts.path.rstrip('/')
+        self._sock = None
+        self._file = None
+
+    def _connect(self, timeout):
+        self._sock = socket.create_connection(self._address, timeout[0])
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._sock.makefile('rb')
+
+    def close(self):
+        if self._sock is not None:
+            self._file.close()
+            self._sock.close()
+            self._sock = None
+            self._file = None
+
+    def _encode_request(self, key, query_string, headers):
+        lines = ['GET {prefix}/qcache/dataset/{key}?{query_string} HTTP/1.1'.format(
+                     prefix=self._prefix, key=quote(key, safe=_SAFE_KEY_CHARACTERS), query_string=query_string),
+                 'Host: ' + self._host]
+        lines.extend('{name}: {value}'.format(name=name, value=value) for name, value in headers.items())
+        lines.extend(('', ''))
+        return '\r\n'.join(lines).encode('latin1')
+
+    def _exchange(self, batch, timeout):
+        self._sock.settimeout(timeout[1])
+        self._sock.sendall(b''.join(batch))
+        responses = []
+        for _ in batch:
+            response = HTTPResponse(_SharedFile(self._file), method='GET')
+            response.begin()
+            content = _decompress(response.read(), response.getheader('Content-Encoding'))
+            responses.append(PipelinedResponse(response.status, response.msg, content))
+            if response.will_close:
+                # Requests after this one were dropped by the server and are sent again
+                self.close()
+                break
+
+        return responses
+
+    def _send_batch(self, batch, timeout):
+        if self._sock is not None:
+            try:
+                return self._exchange(batch, timeout)
+            except socket.timeout:
+                raise
+            except ERRORS:
+                # The server may have closed the idle connection, retry once on a new one
+                self.close()
+
+        self._connect(timeout)
+        return self._exchange(batch, timeout)
+
+    def get_all(self, queries, headers, timeout):
+        """
+        :param queries: List of (key, URL encoded query string) tuples.
+        :param headers: dict with headers to include in all requests.
+        :param timeout: (connect timeout, read timeout) tuple in seconds.
+        :return: List with a :class:`PipelinedResponse` per query, in the same order as the queries.
+        :raises socket.error, HTTPException: If the node cannot be reached or responds with garbage.
+        """
+        encoded = [self._encode_request(key, query_string, headers) for key, query_string in queries]
+        responses = []
+        try:
+            while len(responses) < len(encoded):
+                responses.extend(self._send_batch(encoded[len(responses):len(responses) + MAX_DEPTH], timeout))
+        except ERRORS:
+            self.close()
+            raise
+
+        return responses
@@ -0,0 +1,131 @@
+from collections import OrderedDict
+import json
+import re
+import threading
+
+try:
+    from urllib.parse import urlencode
+except ImportError:
+    from urllib import urlencode
+
+
+class Param(object):
+    """
+    Placeholder for a value in a :class:`PreparedQuery` that is given when the query is bound.
+
+    :param name: Name of the parameter.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return 'Param({name!r})'.format(name=self.name)
+
+
+class BoundQuery(object):
+    """
+    A prepared query with all parameters given. Can be passed as query to :meth:`QClient.get`
+    and :meth:`QClient.query`.
+
+    :param json_q: The query serialized to JSON.
+    """
+    __slots__ = ('json', '_query_string', '_body')
+
+    def __init__(self, json_q):
+        self.json = json_q
+        self._query_string = None
+        self._body = None
+
+    @property
+    def body(self):
+        """
+        UTF-8 encoded query used when executing the query using POST.
+        """
+        if self._body is None:
+            self._body = self.json.encode('utf-8')
+        return self._body
+
+    @property
+    def query_string(self):
+        """
+        URL encoded query string used when executing the query using GET.
+        """
+        if self._query_string is None:
+            self._query_string = urlencode({'q': self.json})
+        return self._query_string
+
+
+class PreparedQuery(object):
+    """
+    Query that is serialized once and then bound to different parameter values. Saves the cost of
+    serializing and URL encoding the complete query for every request when the same query shapes
+    are executed over and over again.
+
+    >>> prepared = PreparedQuery({'select': ['foo'], 'where': ['==', 'bar', Param('bar')]})
+    >>> result = client.get('someKey', prepared.bind(bar=17))
+
+    The most recently used bound queries are cached.
+
+    :param q: Dict with the query as described in the QCache documentation with :class:`Param`
+              placeholders for values that change between executions.
+    :param cache_size: Max number of bound queries to cache.
+    """
+    def __init__(self, q, cache_size=256):
+        self.q = q
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._parts, self._names = self._compile(q)
+
+    @staticmethod
+    def _compile(q):
+        names = []
+
+        def replace(value):
+            if isinstance(value, Param):
+                names.append(value.name)
+                return _marker(len(names) - 1)
+            if isinstance(value, dict):
+                return dict((k, replace(v)) for k, v in value.items())
+            if isinstance(value, (list, tuple)):
+                return [replace(v) for v in value]
+            return value
+
+        # Markers are numbered in the order the query is walked, which may differ from the
+        # order that they are serialized in, map them back to their names by number
+        pieces = _MARKER_PATTERN.split(json.dumps(replace(q)))
+        return pieces[0::2], [names[int(i)] for i in pieces[1::2]]
+
+    def bind(self, **params):
+        """
+        :param params: Values for all parameters in the query.
+        :return: BoundQuery
+        """
+        values = tuple(json.dumps(params[name]) for name in self._names)
+        with self._lock:
+            bound = self._cache.get(values)
+            if bound is not None:
+                self._cache.pop(values)
+                self._cache[values] = bound
+                return bound
+
+        pieces = [self._parts[0]]
+        for value, part in zip(values, self._parts[1:]):
+            pieces.append(value)
+            pieces.append(part)
+
+        bound = BoundQuery(''.join(pieces))
+        with self._lock:
+            self._cache[values] = bound
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return bound
+
+
+def _marker(index):
+    return '\x00qclient-param-{index}\x00'.format(index=index)
+
+
+# A marker as serialized by json.dumps
+_MARKER_PATTERN = re.compile(r'"\\u0000qclient-param-(\d+)\\u0000"')
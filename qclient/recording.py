@@ -0,0 +1,176 @@
+"""
+Recording of queries and uploads, and replay of recorded queries against a cluster to compare
+latencies, eg. before and after upgrading QCache or the client.
+
+Recordings are append only files with one JSON object per line. Multiple processes may append
+to the same file.
+"""
+from collections import defaultdict
+import json
+import random
+import threading
+import time
+
+from qclient.latency import PERCENTILES, clock, percentile
+from qclient.prepared import BoundQuery
+
+
+class Recorder(object):
+    """
+    Records a sample of the queries and uploads made by a client, see the recorder parameter of QClient.
+
+    Each entry contains the time, operation, key, query, accept type and extra headers for queries, the
+    outcome, the request and response sizes in bytes, the latency in seconds including retries and the
+    statistics reported by the server. The outcome is the HTTP status, 200 or 404 for queries and 201 for
+    uploads, or the name of the exception raised. Uploaded content is not recorded.
+
+    :param path: File to append entries to.
+    :param sample_rate: Fraction of operations to record.
+    """
+    def __init__(self, path, sample_rate=1.0):
+        self.path = path
+        self.sample_rate = sample_rate
+        self._file = open(path, 'a')
+        self._lock = threading.Lock()
+
+    def sample(self):
+        """
+        :return: True if the next operation should be recorded.
+        """
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def _write(self, entry):
+        line = json.dumps(dict((name, value) for name, value in entry.items() if value is not None),
+                          separators=(',', ':'), sort_keys=True) + '\n'
+        with self._lock:
+            # Flushed right away to keep lines from different processes apart
+            self._file.write(line)
+            self._file.flush()
+
+    def record_get(self, started_at, key, q, accept, query_headers, latency, result=None, error=None):
+        json_q = q.json if isinstance(q, BoundQuery) else json.dumps(q)
+        self._write({'time': started_at,
+                     'op': 'get',
+                     'key': key,
+                     'q': json.loads(json_q),
+                     'accept': accept,
+                     'headers': query_headers or None,
+                     'status': type(error).__name__ if error is not None else (200 if result is not None else 404),
+                     'request_size': len(json_q),
+                     'response_size': len(result.content) if result is not None else None,
+                     'latency': latency,
+                     'stats': (result.statistics or None) if result is not None else None})
+
+    def record_post(self, started_at, key, content_type, size, latency, stats=None, error=None):
+        self._write({'time': started_at,
+                     'op': 'post',
+                     'key': key,
+                     'content_type': content_type,
+                     'status': type(error).__name__ if error is not None else 201,
+                     'request_size': size,
+                     'latency': latency,
+                     'stats': stats or None})
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+
+def read_recording(path):
+    """
+    :return: List of the entries in a recording, ordered by time.
+    """
+    with open(path) as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+
+    return sorted(entries, key=lambda entry: entry['time'])
+
+
+def replay(client, entries, rate=1.0, threads=8):
+    """
+    Re-issue the recorded queries using client. Uploads are not replayed since their content is not recorded,
+    make sure the datasets are available in the target cluster, eg. by replaying against the cluster that
+    the recording was made against.
+
+    :param client: QClient for the target cluster.
+    :param entries: Recorded entries, see :func:`read_recording`.
+    :param rate: Replay speed relative to the recording, 2.0 replays twice as fast. None replays as
+                 fast as possible.
+    :param threads: Max number of concurrent queries. Queries are delayed if all threads are busy.
+    :return: List of (entry, outcome, latency) tuples, with the outcome as recorded, for the replayed queries.
+    """
+    queries = [entry for entry in entries if entry['op'] == 'get']
+    if not queries:
+        return []
+
+    first = queries[0]['time']
+    start = clock()
+    pending = iter(queries)
+    lock = threading.Lock()
+    replayed = []
+
+    def worker():
+        while True:
+            with lock:
+                entry = next(pending, None)
+            if entry is None:
+                return
+
+            if rate:
+                delay = start + (entry['time'] - first) / rate - clock()
+                if delay > 0:
+                    time.sleep(delay)
+
+            t0 = clock()
+            try:
+                result = client.get(entry['key'], entry['q'], accept=entry.get('accept', 'application/json'),
+                                    query_headers=entry.get('headers'))
+                outcome = 200 if result is not None else 404
+            except Exception as e:
+                outcome = type(e).__name__
+            replayed.append((entry, outcome, clock() - t0))
+
+    workers = [threading.Thread(target=worker, name='qclient-replay-{i}'.format(i=i)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    return replayed
+
+
+def compare(replayed):
+    """
+    :param replayed: Result of :func:`replay`.
+    :return: dict with the recorded and replayed latency percentiles in seconds, the number of queries and
+             the number of queries whose outcome differed from the recording. The outcomes are counted per
+             (recorded, replayed) pair under changed_outcomes.
+    """
+    recorded = sorted(entry['latency'] for entry, _, _ in replayed)
+    replayed_latencies = sorted(latency for _, _, latency in replayed)
+    changed = defaultdict(int)
+    for entry, outcome, _ in replayed:
+        if entry['status'] != outcome:
+            changed[(entry['status'], outcome)] += 1
+
+    return {'count': len(replayed),
+            'percentiles': [(p, percentile(recorded, p), percentile(replayed_latencies, p)) for p in PERCENTILES]
+            if replayed else [],
+            'changed_outcomes': dict(changed)}
+
+
+def format_comparison(comparison):
+    lines = ['{count} queries replayed'.format(count=comparison['count'])]
+    for p, recorded, replayed in comparison['percentiles']:
+        lines.append('  p{p}: recorded {recorded:.2f}ms, replayed {replayed:.2f}ms ({change:+.1%})'.format(
+            p=p, recorded=1000 * recorded, replayed=1000 * replayed,
+            change=(replayed - recorded) / recorded if recorded else 0.0))
+
+    for (recorded, replayed), count in sorted(comparison['changed_outcomes'].items(), key=str):
+        lines.append('  {count} queries {recorded} when recorded, {replayed} when replayed'.format(
+            count=count, recorded=recorded, replayed=replayed))
+
+    return '\n'.join(lines)
@@ -0,0 +1,118 @@
+import logging
+import threading
+
+from qclient.latency import clock
+
+logger = logging.getLogger(__name__)
+
+
+class _RefreshEntry(object):
+    def __init__(self, key, load_fn, load_fn_kwargs, refresh_interval, check_interval, content_type, post_headers):
+        self.key = key
+        self.load_fn = load_fn
+        self.load_fn_kwargs = load_fn_kwargs or {}
+        self.refresh_interval = refresh_interval
+        self.check_interval = check_interval
+        self.content_type = content_type
+        self.post_headers = post_headers
+        now = clock()
+        self.next_refresh = now
+        self.next_check = now + check_interval if check_interval else None
+
+    def next_due(self):
+        return min(self.next_refresh, self.next_check) if self.next_check is not None else self.next_refresh
+
+
+class RefreshAhead(object):
+    """
+    Background worker that keeps registered datasets loaded in QCache.
+
+    Registered datasets are loaded and posted immediately, then re-posted every refresh_interval
+    seconds. If a check_interval is given the worker also checks that the dataset is still present
+    in QCache that often and re-posts it immediately if it has been evicted.
+
+    Refreshes, their duration and failures are recorded in the client statistics for the node
+    owning the key.
+
+    :param client: QClient used to check for and post the datasets.
+    """
+    def __init__(self, client):
+        self.client = client
+        self._entries = {}
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def register(self, key, load_fn, refresh_interval, load_fn_kwargs=None, check_interval=None,
+                 content_type='text/csv', post_headers=None):
+        with self._condition:
+            self._entries[key] = _RefreshEntry(key, load_fn, load_fn_kwargs, refresh_interval, check_interval,
+                                               content_type, post_headers)
+            self._stopped = False
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='qclient-refresh')
+                self._thread.daemon = True
+                self._thread.start()
+
+            self._condition.notify()
+
+    def unregister(self, key):
+        with self._condition:
+            self._entries.pop(key, None)
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+            thread, self._thread = self._thread, None
+
+        if thread is not None:
+            thread.join()
+
+    def _next_entry(self):
+        with self._condition:
+            while not self._stopped:
+                now = clock()
+                entry = min(self._entries.values(), key=_RefreshEntry.next_due) if self._entries else None
+                if entry is not None and entry.next_due() <= now:
+                    return entry
+
+                self._condition.wait(entry.next_due() - now if entry else None)
+
+            return None
+
+    def _run(self):
+        while True:
+            entry = self._next_entry()
+            if entry is None:
+                return
+
+            now = clock()
+            if entry.next_refresh <= now or not self._is_present(entry):
+                self._refresh(entry)
+
+            if entry.check_interval:
+                entry.next_check = clock() + entry.check_interval
+
+    def _is_present(self, entry):
+        try:
+            return self.client.get(entry.key, {'limit': 0}) is not None
+        except Exception:
+            # Let the refresh take care of any problems
+            logger.exception('Failed to check presence of %s', entry.key)
+            return False
+
+    def _refresh(self, entry):
+        t0 = clock()
+        try:
+            content = entry.load_fn(**entry.load_fn_kwargs)
+            self.client.post(entry.key, content, content_type=entry.content_type, post_headers=entry.post_headers)
+            statistics = self.client.statistics[self.client.node_ring.get_node(entry.key)]
+            statistics['refreshes'] += 1
+            statistics['refresh_duration'] += clock() - t0
+            entry.next_refresh = clock() + entry.refresh_interval
+        except Exception:
+            logger.exception('Failed to refresh %s', entry.key)
+            self.client.statistics[self.client.node_ring.get_node(entry.key)]['refresh_failures'] += 1
+            # Try again on the next check, or after a full interval if presence is not checked
+            entry.next_refresh = clock() + (entry.check_interval or entry.refresh_interval)
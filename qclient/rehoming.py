@@ -0,0 +1,135 @@
+import logging
+import threading
+
+from qclient.node_ring import NodeRing
+
+logger = logging.getLogger(__name__)
+
+
+class Rehomer(object):
+    """
+    Moves datasets back to their home node when it is resurrected into the node ring.
+
+    While a node is down the keys that would normally be stored on it are tracked together with
+    the node that they were posted to instead. When the node comes back queries for those keys
+    keep going to the temporary owner while the datasets are copied to the returning node in
+    the background. Each key is routed to its home node again once its copy has completed, or failed.
+    Uploads of a key cancel its copy, waiting for it to finish if it is in progress, so that the copy
+    cannot overwrite the new data on the home node with the old.
+
+    :param client: The QClient
+    :param node_list: All nodes, used to determine the home node of keys.
+    :param max_tracked_keys: Max number of displaced keys to track per node.
+    :param weights: Optional dict with node weights, see :class:`NodeRing`.
+    """
+    def __init__(self, client, node_list, max_tracked_keys=10000, weights=None):
+        self.client = client
+        self.node_list = list(node_list)
+        self.weights = dict(weights or {})
+        self.max_tracked_keys = max_tracked_keys
+        self._home_ring = None
+        self._displaced = {}
+        self._routes = {}
+        self._copying = set()
+        self._lock = threading.Condition()
+
+    def _home_node(self, key):
+        if self._home_ring is None:
+            self._home_ring = NodeRing(self.node_list, self.weights)
+        return self._home_ring.get_node(key)
+
+    def set_weight(self, node, weight):
+        self.weights[node] = weight
+        if self._home_ring is not None:
+            self._home_ring.set_weight(node, weight)
+
+    def track(self, key, node, content_type, post_headers):
+        """
+        Record that key was posted to node.
+        """
+        home_node = self._home_node(key)
+        if home_node == node:
+            return
+
+        with self._lock:
+            displaced = self._displaced.setdefault(home_node, {})
+            if key in displaced or len(displaced) < self.max_tracked_keys:
+                displaced[key] = (node, content_type, post_headers)
+
+    def route(self, key):
+        """
+        :return: The node to route requests for key to while it's being copied to its home node, None otherwise.
+        """
+        return self._routes.get(key)
+
+    def cancel(self, key):
+        """
+        Cancel the pending copy of key, if any, and route it to its home node. Called before uploading
+        key. Waits for the copy to finish if it is in progress.
+        """
+        if key not in self._routes and key not in self._copying:
+            return
+
+        with self._lock:
+            self._routes.pop(key, None)
+            while key in self._copying:
+                self._lock.wait()
+
+    def node_resurrected(self, node):
+        """
+        Start copying datasets displaced from node back to it. Must be called before node is added
+        back to the node ring.
+        """
+        with self._lock:
+            displaced = self._displaced.pop(node, {})
+            for key, (temporary_owner, _, _) in displaced.items():
+                self._routes[key] = temporary_owner
+
+        if displaced:
+            thread = threading.Thread(target=self._copy_all, args=(node, displaced), name='qclient-rehome')
+            thread.daemon = True
+            thread.start()
+
+    def _after_fork(self):
+        # Copies in progress are done by threads in the parent process
+        self._lock = threading.Condition()
+        self._routes = {}
+        self._copying = set()
+
+    def _copy_all(self, node, displaced):
+        for key, (temporary_owner, content_type, post_headers) in displaced.items():
+            with self._lock:
+                if key not in self._routes:
+                    # Cancelled by an upload of the key
+                    continue
+                self._copying.add(key)
+
+            try:
+                if self._copy(key, temporary_owner, node, content_type, post_headers):
+                    self.client.statistics[node]['rehomed'] += 1
+                else:
+                    self.client.statistics[node]['rehome_failures'] += 1
+            except Exception:
+                logger.exception('Failed to copy %s from %s to %s', key, temporary_owner, node)
+                self.client.statistics[node]['rehome_failures'] += 1
+            finally:
+                with self._lock:
+                    self._routes.pop(key, None)
+                    self._copying.discard(key)
+                    self._lock.notify_all()
+
+    def _copy(self, key, source, destination, content_type, post_headers):
+        client = self.client
+        response = client._request(source, 'get', client.session.get, client._key_url(source, key),
+                                   params={'q': '{}'}, headers={'Accept': content_type})
+        if response.status_code != 200:
+            # Evicted or otherwise lost in the meantime
+            return False
+
+        headers = {'Content-type': content_type}
+        if post_headers:
+            headers.update(post_headers)
+
+        response = client._request(destination, 'post', client.session.post, client._key_url(destination, key),
+                                   size=len(response.content), headers=headers, data=response.content)
+        return response.status_code == 201
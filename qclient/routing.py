@@ -0,0 +1,140 @@
+from collections import defaultdict, OrderedDict
+import random
+import threading
+
+
+class HashRouting(object):
+    """
+    Default routing policy. All operations for a key are sent to the node that owns
+    the key according to the node ring.
+    """
+    def select(self, ring, key, score):
+        """
+        :param ring: NodeRing to select nodes from.
+        :param key: Key of the dataset.
+        :param score: Function returning the current cost of sending a request to a node, lower is better.
+        :return: List of candidate nodes for key in order of preference, empty if no nodes are available.
+        """
+        node = ring.get_node(key)
+        return [node] if node else []
+
+
+class LeastLoadedRouting(object):
+    """
+    Latency aware routing policy. The first candidate_count nodes on the ring are candidates for
+    a key. Requests are sent to the best of two randomly selected candidates ("power of two choices")
+    where the cost of a node is its recent latency multiplied by the number of requests in flight to it.
+
+    Uploads are stored on the preferred node. Queries are tried against the remaining candidates in
+    ring order if the data is not found on the preferred node.
+
+    :param candidate_count: Number of nodes, starting with the owner of the key, that may hold a key.
+    """
+    def __init__(self, candidate_count=2):
+        self.candidate_count = candidate_count
+
+    def select(self, ring, key, score):
+        nodes = ring.get_nodes(key, self.candidate_count)
+        if len(nodes) < 2:
+            return nodes
+
+        choices = random.sample(nodes, 2) if len(nodes) > 2 else nodes
+        best = min(choices, key=score)
+        return [best] + [node for node in nodes if node != best]
+
+
+class BoundedLoadRouting(object):
+    """
+    Consistent hashing with bounded loads. Caps the amount of data placed on each node to
+    (1 + epsilon) times its fair share, the average load scaled by the weight of the node.
+
+    The load of a node is the total size of the datasets uploaded to it by this client. An upload
+    is placed on the owner of the key if that keeps the owner within its bound, otherwise on the
+    first successor on the ring that stays within its bound. The node chosen for a key is
+    remembered and used for queries and re-uploads of the key as long as it stays within bounds,
+    so keys do not bounce between nodes. Queries for keys without a remembered node, eg. uploaded
+    by another process, are tried against the first candidate_count nodes on the ring in order.
+
+    Replicated uploads are placed on the owner and its successors as usual.
+
+    :param epsilon: Allowed load above the fair share, eg. 0.25 allows 25% above.
+    :param candidate_count: Number of nodes, starting with the owner of the key, to try queries for
+                            keys without a remembered node against.
+    :param max_tracked_keys: Max number of keys to remember. The least recently uploaded keys are
+                             forgotten, and no longer count towards the load, when exceeded.
+    """
+    def __init__(self, epsilon=0.25, candidate_count=2, max_tracked_keys=100000):
+        self.epsilon = epsilon
+        self.candidate_count = candidate_count
+        self.max_tracked_keys = max_tracked_keys
+        self._assignments = OrderedDict()
+        self._loads = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def select(self, ring, key, score):
+        assignment = self._assignments.get(key)
+        nodes = ring.get_nodes(key, self.candidate_count)
+        if assignment is not None and assignment[0] in ring:
+            return [assignment[0]] + [node for node in nodes if node != assignment[0]]
+
+        return nodes
+
+    def _within_bound(self, ring, node, size, total_load, total_weight):
+        load = self._loads[node]
+        if load == 0:
+            # Always accept at least one dataset, no matter how large
+            return True
+
+        fair_share = total_load * ring.weights.get(node, 1) / total_weight
+        return load + size <= (1.0 + self.epsilon) * fair_share
+
+    def place(self, ring, key, size):
+        """
+        Select node to upload a dataset of size bytes for key to and account for its load.
+
+        :return: The selected node, None if there are no nodes in the ring.
+        """
+        nodes = ring.get_nodes(key, ring.node_count())
+        if not nodes:
+            return None
+
+        with self._lock:
+            previous = self._forget(key)
+            total_load = sum(self._loads[node] for node in nodes) + size
+            total_weight = float(sum(ring.weights.get(node, 1) for node in nodes))
+            if previous in nodes:
+                # Stay on the current node if possible
+                nodes = [previous] + [node for node in nodes if node != previous]
+
+            selected = next((node for node in nodes if self._within_bound(ring, node, size, total_load, total_weight)),
+                            nodes[0])
+
+            self._assignments[key] = (selected, size)
+            self._loads[selected] += size
+            while len(self._assignments) > self.max_tracked_keys:
+                self._forget(next(iter(self._assignments)))
+
+            return selected
+
+    def _forget(self, key):
+        assignment = self._assignments.pop(key, None)
+        if assignment is None:
+            return None
+
+        node, size = assignment
+        self._loads[node] -= size
+        return node
+
+    def forget(self, key):
+        """
+        Stop tracking key, eg. because it has been deleted.
+        """
+        with self._lock:
+            self._forget(key)
+
+    def loads(self):
+        """
+        :return: dict with the number of bytes placed on each node.
+        """
+        with self._lock:
+            return dict((node, load) for node, load in self._loads.items() if load)
@@ -0,0 +1,124 @@
+from contextlib import contextmanager
+import mmap
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, only threads within a process are synchronized there
+    fcntl = None
+
+UP = 0
+DOWN = 1
+
+# Change counter
+_HEADER = struct.Struct('<Q')
+
+# State, time of last state change and time of last probe, per node
+_RECORD = struct.Struct('<Qdd')
+
+
+class SharedNodeHealth(object):
+    """
+    Node health shared between all processes on a host through a memory mapped file, eg. the
+    workers of a pre-fork server. A node dropped by one process is dropped by all other processes
+    using the same file on their next operation, and likewise for nodes that are resurrected.
+    Probes of dropped nodes are coordinated so that each node is probed at most once every
+    probe_interval seconds by all processes together.
+
+    All processes must use the same node list.
+
+    :param path: Path to the file, created if it does not exist.
+    :param node_list: List of all nodes.
+    :param probe_interval: Min number of seconds between probes of a dropped node.
+    """
+    def __init__(self, path, node_list, probe_interval=1.0):
+        self.path = path
+        self.probe_interval = probe_interval
+        self._nodes = sorted(set(node_list))
+        self._index = dict((node, i) for i, node in enumerate(self._nodes))
+        self._lock = threading.Lock()
+
+        size = _HEADER.size + len(self._nodes) * _RECORD.size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            if fcntl:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.lockf(self._fd, fcntl.LOCK_UN)
+
+    def _offset(self, index):
+        return _HEADER.size + index * _RECORD.size
+
+    def _read(self, index):
+        return _RECORD.unpack_from(self._map, self._offset(index))
+
+    def _write(self, index, state, changed_at, probed_at):
+        _RECORD.pack_into(self._map, self._offset(index), state, changed_at, probed_at)
+
+    def _set_state(self, node, state):
+        index = self._index.get(node)
+        if index is None:
+            return
+
+        with self._locked():
+            current_state, _, probed_at = self._read(index)
+            if current_state != state:
+                now = time.time()
+                self._write(index, state, now, now if state == DOWN else probed_at)
+                _HEADER.pack_into(self._map, 0, self.version() + 1)
+
+    def version(self):
+        """
+        :return: Counter incremented on every change of state of any node.
+        """
+        return _HEADER.unpack_from(self._map, 0)[0]
+
+    def mark_down(self, node):
+        self._set_state(node, DOWN)
+
+    def mark_up(self, node):
+        self._set_state(node, UP)
+
+    def down_nodes(self):
+        """
+        :return: Set of nodes currently marked as down.
+        """
+        return set(node for index, node in enumerate(self._nodes) if self._read(index)[0] == DOWN)
+
+    def claim_probe(self, node):
+        """
+        :return: True if the caller should probe node, False if it has been probed recently by any process.
+        """
+        index = self._index.get(node)
+        if index is None:
+            return True
+
+        with self._locked():
+            state, changed_at, probed_at = self._read(index)
+            now = time.time()
+            if now - probed_at < self.probe_interval:
+                return False
+
+            self._write(index, state, changed_at, now)
+            return True
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+    def _after_fork(self):
+        # The mapping is shared with the parent, only the thread lock needs replacing
+        self._lock = threading.Lock()
@@ -0,0 +1,207 @@
+from collections import OrderedDict
+import errno
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+import threading
+import time
+
+SUFFIX = '.spill'
+
+
+class MappedContent(object):
+    """
+    Dataset content stored in a spill file, mapped into memory. Uploads read the content
+    straight from the mapping, see :meth:`open`.
+
+    :param path: Path to the spill file.
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._size = os.fstat(f.fileno()).st_size
+            # Empty files cannot be mapped
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self._size else None
+
+    def __len__(self):
+        return self._size
+
+    def open(self):
+        """
+        :return: A new file like object reading the content from the start. Each upload needs its own.
+        """
+        return _MappedReader(self._map, self._size)
+
+
+class _MappedReader(object):
+    # Deliberately not iterable, requests streams objects with read() and a length
+    # using a fixed Content-Length.
+    def __init__(self, mapped, size):
+        self._map = mapped
+        self._size = size
+        self._position = 0
+
+    def __len__(self):
+        return self._size - self._position
+
+    def read(self, size=-1):
+        if self._map is None:
+            return b''
+
+        end = self._size if size is None or size < 0 else min(self._size, self._position + size)
+        data = self._map[self._position:end]
+        self._position = end
+        return data
+
+
+class SpillCache(object):
+    """
+    Local disk cache for the output of load functions passed to :meth:`QClient.query`.
+
+    When a dataset has been evicted from QCache it is re-uploaded from the spill file, mapped
+    into memory, instead of calling the load function again. Entries are keyed by dataset key
+    and load function arguments and expire ttl seconds after they were written. The least
+    recently used entries are removed when the total size exceeds max_bytes.
+
+    Multiple processes may share the same directory.
+
+    :param directory: Directory to store spill files in, created if it does not exist.
+    :param ttl: Number of seconds that a spilled dataset may be used.
+    :param max_bytes: Max total size of the spill files.
+    """
+    def __init__(self, directory, ttl=3600, max_bytes=1024 ** 3):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        self._load_entries()
+
+    def _load_entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            try:
+                stat = os.stat(self._path(name))
+            except OSError:
+                continue
+
+            if name.endswith(SUFFIX):
+                entries.append((stat.st_mtime, name, stat.st_size))
+
+        with self._lock:
+            for _, name, size in sorted(entries):
+                self._add(name, size)
+            self._evict()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    @staticmethod
+    def _name(key, load_fn_kwargs):
+        identity = json.dumps([key, load_fn_kwargs or {}], sort_keys=True, default=repr)
+        return hashlib.sha1(identity.encode('utf-8')).hexdigest() + SUFFIX
+
+    def _add(self, name, size):
+        self._size -= self._entries.pop(name, 0)
+        self._entries[name] = size
+        self._size += size
+
+    def _remove(self, name):
+        self._size -= self._entries.pop(name, 0)
+        try:
+            os.remove(self._path(name))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+
+    def get(self, key, load_fn_kwargs=None):
+        """
+        :return: :class:`MappedContent` with the spilled dataset, None if missing or expired.
+        """
+        name = self._name(key, load_fn_kwargs)
+        path = self._path(name)
+        with self._lock:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                self._entries.pop(name, None)
+                return None
+
+            if time.time() - stat.st_mtime > self.ttl:
+                self._remove(name)
+                return None
+
+            # Mark as recently used, also adopts files spilled by other processes
+            self._add(name, stat.st_size)
+
+        try:
+            return MappedContent(path)
+        except (IOError, OSError):
+            # Removed by another process in the meantime
+            return None
+
+    def put(self, key, load_fn_kwargs, content):
+        """
+        Spill content returned by the load function to disk.
+
+        :return: True if the content was stored. Content that is not text or bytes, or larger than
+                 max_bytes, is not stored.
+        """
+        if not isinstance(content, bytes) and hasattr(content, 'encode'):
+            content = content.encode('utf-8')
+
+        if not isinstance(content, bytes) or len(content) > self.max_bytes:
+            return False
+
+        name = self._name(key, load_fn_kwargs)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            _replace(tmp_path, self._path(name))
+        except (IOError, OSError):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+
+        with self._lock:
+            self._add(name, len(content))
+            self._evict()
+
+        return True
+
+    def discard(self, key, load_fn_kwargs=None):
+        with self._lock:
+            self._remove(self._name(key, load_fn_kwargs))
+
+    def clear(self):
+        with self._lock:
+            for name in list(self._entries):
+                self._remove(name)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+
+def _replace(source, destination):
+    try:
+        os.replace(source, destination)
+    except AttributeError:
+        # Python 2, rename does not overwrite existing files on Windows
+        if os.name == 'nt' and os.path.exists(destination):
+            os.remove(destination)
+        os.rename(source, destination)
@@ -0,0 +1,110 @@
+"""
+Per key usage statistics, see :meth:`QClient.get_key_statistics`.
+"""
+import heapq
+import threading
+
+FIELDS = ('queries', 'misses', 'query_time', 'reloads', 'load_time', 'uploads', 'upload_bytes', 'upload_time')
+
+
+class _Usage(object):
+    __slots__ = ('cost', 'error') + FIELDS
+
+    def __init__(self, cost):
+        self.cost = cost
+        self.error = cost
+        for name in FIELDS:
+            setattr(self, name, 0)
+
+
+class KeyUsage(object):
+    """
+    Tracks query latency, misses, reloads of data and uploads for the keys that the client spends the
+    most time on, in memory bounded by the number of keys tracked.
+
+    Keys are ranked by cost, the total time spent querying, loading and uploading them, using the space
+    saving algorithm. When a key that is not tracked is used and capacity keys are already tracked, the
+    key with the lowest cost is replaced. The new key inherits that cost, which is an upper bound for the
+    cost of the new key before it was tracked, as its error. Keys with a cost higher than the error of the
+    least costly key are guaranteed to be tracked. The other counters only include operations since the
+    key was most recently tracked.
+
+    :param capacity: Max number of keys to track.
+    """
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self._usage = {}
+        # Min heap with one (cost, key) item per tracked key, costs may be lower than the current
+        self._heap = []
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        usage = self._usage.get(key)
+        if usage is None:
+            cost = self._evict() if len(self._usage) >= self.capacity else 0.0
+            usage = self._usage[key] = _Usage(cost)
+            heapq.heappush(self._heap, (cost, key))
+        return usage
+
+    def _evict(self):
+        while True:
+            cost, key = heapq.heappop(self._heap)
+            usage = self._usage[key]
+            if usage.cost == cost:
+                del self._usage[key]
+                return cost
+
+            # Cost increased since pushed, reposition
+            heapq.heappush(self._heap, (usage.cost, key))
+
+    def record_query(self, key, latency, found):
+        with self._lock:
+            usage = self._get(key)
+            usage.queries += 1
+            usage.misses += 0 if found else 1
+            usage.query_time += latency
+            usage.cost += latency
+
+    def record_load(self, key, duration):
+        with self._lock:
+            usage = self._get(key)
+            usage.reloads += 1
+            usage.load_time += duration
+            usage.cost += duration
+
+    def record_upload(self, key, size, duration):
+        with self._lock:
+            usage = self._get(key)
+            usage.uploads += 1
+            usage.upload_bytes += size
+            usage.upload_time += duration
+            usage.cost += duration
+
+    def top(self, count=10, order_by='cost'):
+        """
+        :param count: Number of keys to return.
+        :param order_by: Statistic to order by, cost, reload_time, miss_rate or any of FIELDS.
+        :return: List of dicts with the statistics of the count keys with the highest order_by.
+        """
+        with self._lock:
+            statistics = [self._statistics(key, usage) for key, usage in self._usage.items()]
+
+        return sorted(statistics, key=lambda s: s[order_by], reverse=True)[:count]
+
+    @staticmethod
+    def _statistics(key, usage):
+        statistics = dict((name, getattr(usage, name)) for name in FIELDS)
+        statistics.update(key=key, cost=usage.cost, error=usage.error,
+                          miss_rate=float(usage.misses) / usage.queries if usage.queries else 0.0,
+                          reload_time=usage.load_time + usage.upload_time)
+        return statistics
+
+    def clear(self):
+        with self._lock:
+            self._usage = {}
+            self._heap = []
+
+    def _after_fork(self):
+        # Like the other client statistics, usage is counted per process
+        self._lock = threading.Lock()
+        self.clear()
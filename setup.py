@@ -72,6 +72,11 @@ setup(
         "requests>=2.20.0"
     ],
     extras_require={
-        # eg: 'rst': ["docutils>=0.11"],
+        'lz4': ["lz4>=0.10"],
+    },
+    entry_points={
+        'console_scripts': [
+            'qclient-bench = qclient.bench:main',
+        ]
     }
 )
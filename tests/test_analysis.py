@@ -0,0 +1,39 @@
+from qclient import analysis
+
+NODES = ['aaa', 'bbb', 'ccc', 'ddd']
+
+
+def test_balance_of_weighted_ring():
+    keys = analysis.sample_keys(20000)
+    assignment = analysis.placement('ring', NODES, keys, weights={'ddd': 2})
+    stats = analysis.balance(assignment, NODES, weights={'ddd': 2})
+
+    assert abs(sum(stats['shares'].values()) - 1.0) < 1e-9
+    assert 0.35 < stats['shares']['ddd'] < 0.45
+    assert stats['min_load_ratio'] <= 1.0 <= stats['max_load_ratio'] < 1.2
+
+
+def test_only_keys_of_removed_node_move():
+    keys = analysis.sample_keys(5000)
+    before = analysis.placement('ring', NODES, keys)
+    result = analysis.movement('ring', NODES, keys)
+
+    for node in NODES:
+        share = sum(1 for n in before.values() if n == node) / float(len(keys))
+        assert abs(result['removed'][node]['moved'] - share) < 1e-9
+        assert result['removed'][node]['ideal'] == 0.25
+
+    assert 0.1 < result['added']['moved'] < 0.3
+
+
+def test_bounded_placement_respects_bound():
+    keys = analysis.sample_keys(5000)
+    stats = analysis.balance(analysis.placement('bounded', NODES, keys, epsilon=0.01), NODES)
+    assert stats['max_load_ratio'] < 1.02
+
+
+def test_report(capsys):
+    analysis.main(NODES + ['--keys', '1000', '--weight', 'aaa=0.5'])
+    output = capsys.readouterr()[0]
+    assert 'virtual nodes' in output
+    assert 'bounded:' in output
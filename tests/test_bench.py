@@ -0,0 +1,57 @@
+import random
+
+from qclient import NodeRing
+from qclient.bench import Results, WeightedSampler, load_query_file, run, zipf_sampler
+
+NODES = ['http://localhost:2222', 'http://localhost:2223']
+
+
+class FakeClient(object):
+    def __init__(self):
+        self.node_ring = NodeRing(NODES)
+
+
+def test_zipf_sampler_skews_towards_first_items():
+    sampler = zipf_sampler(list(range(100)), 1.2)
+    rng = random.Random(1)
+    samples = [sampler.sample(rng) for _ in range(10000)]
+
+    assert samples.count(0) > samples.count(1) > samples.count(10) > 0
+    assert samples.count(0) > 1000
+
+
+def test_weighted_sampler():
+    sampler = WeightedSampler(['a', 'b'], [0, 1])
+    assert set(sampler.sample(random.Random(i)) for i in range(100)) == set(['b'])
+
+
+def test_run_counts_latencies_and_errors_per_node():
+    client = FakeClient()
+    outcomes = {'ok': lambda: 'result', 'missing': lambda: None, 'failing': lambda: 1 / 0}
+
+    def next_operation(rng):
+        key = rng.choice(sorted(outcomes))
+        return key, outcomes[key]
+
+    results, elapsed = run(client, next_operation, threads=3, duration=10.0, max_operations=300, seed=1)
+    summary = results.summary(elapsed)
+
+    assert summary['all']['requests'] == 300
+    assert sum(summary['all']['errors'].values()) + len(results.latencies[client.node_ring.get_node('ok')]) == 300
+    assert set(summary['all']['errors']) == set(['missing', 'ZeroDivisionError'])
+    assert summary[client.node_ring.get_node('failing')]['errors']['ZeroDivisionError'] > 0
+    assert [p for p, _ in summary['all']['percentiles']] == [50, 90, 99, 99.9]
+
+
+def test_load_query_file(tmpdir):
+    path = tmpdir.join('queries.jsonl')
+    path.write('{"key": "a", "q": {"limit": 1}, "weight": 2}\n\n{"key": "b", "accept": "text/csv"}\n')
+
+    sampler = load_query_file(str(path))
+
+    assert sampler.items == [{'key': 'a', 'q': {'limit': 1}, 'accept': 'application/json'},
+                             {'key': 'b', 'q': {}, 'accept': 'text/csv'}]
+
+
+def test_empty_summary():
+    assert Results().summary(1.0)['all'] == {'requests': 0, 'throughput': 0.0, 'percentiles': [], 'errors': {}}
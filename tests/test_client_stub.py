@@ -0,0 +1,433 @@
+import json
+import threading
+import time
+
+import pytest
+
+from qclient import (AIMDLimiter, ConcurrencyLimitExceeded, DeadlineExceeded, LeastLoadedRouting, QClient,
+                     RetryBudget, RetryBudgetExhausted, SpillCache, UnexpectedServerResponse)
+from qclient.node_ring import NodeRing
+from benchmarks.stub_server import StubQCache
+
+ROWS = [{'foo': 'abc', 'bar': 1}, {'foo': 'def', 'bar': 2}]
+
+
+@pytest.fixture
+def stub():
+    stub = StubQCache().start()
+    yield stub
+    stub.stop()
+
+
+@pytest.fixture
+def stubs():
+    stubs = [StubQCache().start() for _ in range(2)]
+    yield stubs
+    for stub in stubs:
+        stub.stop()
+
+
+def test_concurrent_resurrection_of_dropped_node(stub):
+    client = QClient([stub.url], trust_env=False)
+    client.post_partitioned('k', json.dumps(ROWS), 4, content_type='application/json', partition_column='foo')
+    client._drop_node(stub.url)
+
+    # All partition queries find the ring empty and probe the node at the same time
+    result = client.get_partitioned('k', {}, 4)
+
+    assert len(json.loads(result.content.decode('utf-8'))) == len(ROWS)
+    assert client.failing_nodes == set()
+    assert client.node_ring.node_count() == 1
+    assert len(client.node_ring.sorted_keys) == client.node_ring.virtual_count
+    assert client.statistics[stub.url]['resurrections'] == 1
+
+
+def test_single_slow_response_does_not_drop_node_with_adaptive_timeouts(stubs):
+    client = QClient([stub.url for stub in stubs], trust_env=False, adaptive_timeouts=True, min_read_timeout=0.1)
+    owner = [stub for stub in stubs if stub.url == client.node_ring.get_node('k')][0]
+    loads = []
+
+    def load():
+        loads.append(1)
+        return json.dumps(ROWS)
+
+    for _ in range(30):
+        client.query('k', {}, load, content_type='application/json')
+
+    delays = [0.25]
+    owner.simulate_latency = lambda: time.sleep(delays.pop()) if delays else None
+    result = client.query('k', {}, load, content_type='application/json')
+
+    assert json.loads(result.content.decode('utf-8')) == ROWS
+    assert client.failing_nodes == set()
+    assert client.statistics[owner.url]['read_timeout'] == 1
+    assert len(loads) == 1
+
+
+def test_node_dropped_after_repeated_read_timeouts_with_adaptive_timeouts(stub):
+    client = QClient([stub.url], trust_env=False, adaptive_timeouts=True, min_read_timeout=0.1)
+    client.post('k', json.dumps(ROWS), content_type='application/json')
+    for _ in range(30):
+        client.get('k', {})
+
+    delays = [0.5, 0.5, 0.5]
+    stub.simulate_latency = lambda: time.sleep(delays.pop()) if delays else None
+    assert client.get('k', {}) is not None
+
+    # Dropped after the third timeout and resurrected by the status check that followed
+    assert client.statistics[stub.url]['read_timeout'] == 3
+    assert client.statistics[stub.url]['resurrections'] == 1
+
+
+def test_least_loaded_routing_avoids_slow_node(stubs):
+    fast, slow = stubs
+    slow.delay = 0.02
+    for stub in stubs:
+        stub.datasets['k'] = ('application/json', json.dumps(ROWS).encode('utf-8'))
+    client = QClient([stub.url for stub in stubs], trust_env=False, routing_policy=LeastLoadedRouting(2))
+
+    for _ in range(50):
+        assert client.get('k', {}) is not None
+
+    # At most the first query goes to the slow node, before its latency is known
+    tracker = client.timeout_policy.tracker
+    assert tracker.estimate(slow.url, 'get').count <= 1
+    assert tracker.estimate(fast.url, 'get').count >= 49
+
+
+def test_least_loaded_routing_falls_back_to_other_candidates(stubs):
+    fast, slow = stubs
+    slow.delay = 0.02
+    slow.datasets['k'] = ('application/json', json.dumps(ROWS).encode('utf-8'))
+    client = QClient([stub.url for stub in stubs], trust_env=False, routing_policy=LeastLoadedRouting(2))
+
+    for _ in range(5):
+        result = client.get('k', {})
+        assert json.loads(result.content.decode('utf-8')) == ROWS
+
+
+def test_concurrency_limit_rejections(stub):
+    stub.delay = 0.3
+    limiter = AIMDLimiter(initial_limit=1, max_wait=0.0)
+    client = QClient([stub.url], trust_env=False, concurrency_limiter=limiter)
+    thread = threading.Thread(target=client.get, args=('k', {}))
+    thread.start()
+    time.sleep(0.1)
+
+    with pytest.raises(ConcurrencyLimitExceeded):
+        client.get('k', {})
+    thread.join()
+
+    assert client.statistics[stub.url]['concurrency_rejections'] == 1
+
+
+def test_concurrency_limit_shrinks_when_node_overloaded(stub):
+    limiter = AIMDLimiter(initial_limit=10)
+    client = QClient([stub.url], trust_env=False, concurrency_limiter=limiter)
+    assert client.get('k', {}) is None
+    assert client.statistics[stub.url]['concurrency_limit'] == 10
+
+    stub.fixed_status = 503
+    with pytest.raises(UnexpectedServerResponse):
+        client.get('k', {})
+
+    assert client.statistics[stub.url]['concurrency_limit'] == 5
+    assert limiter.state(stub.url) == {'concurrency_limit': 5, 'in_flight': 0}
+
+
+def test_retry_budget_exhausted_by_retries(stub):
+    dead = 'http://127.0.0.1:1'
+    client = QClient([stub.url, dead], trust_env=False,
+                     retry_budget=RetryBudget(ratio=0.0, min_retries_per_second=0.0, max_tokens=0.0))
+    key = next(key for key in (str(i) for i in range(100)) if client.node_ring.get_node(key) == dead)
+
+    with pytest.raises(RetryBudgetExhausted):
+        client.get(key, {})
+
+    assert client.failing_nodes == set([dead])
+    assert client.statistics[dead]['retry_budget_exhausted'] == 1
+
+
+class _Forgetful(dict):
+    def __setitem__(self, key, value):
+        # Datasets are evicted as soon as they are uploaded
+        pass
+
+
+def test_retry_budget_exhausted_by_reloads(stub):
+    stub._server.datasets = _Forgetful()
+    client = QClient([stub.url], trust_env=False,
+                     retry_budget=RetryBudget(ratio=0.0, min_retries_per_second=0.0, max_tokens=0.0))
+    loads = []
+
+    def load():
+        loads.append(1)
+        return json.dumps(ROWS)
+
+    # The first load is not a retry, loading again after the data is lost is
+    with pytest.raises(RetryBudgetExhausted):
+        client.query('k', {}, load, content_type='application/json')
+
+    assert len(loads) == 1
+    assert client.statistics[stub.url]['retry_budget_exhausted'] == 1
+
+
+def test_status_probe_of_dropped_node_respects_deadline(stubs):
+    live, hung = stubs
+    hung.delay = 2.0
+    client = QClient([live.url, hung.url], trust_env=False)
+    client._drop_node(hung.url)
+
+    t0 = time.time()
+    with pytest.raises(DeadlineExceeded):
+        client.get('k', {}, timeout=0.1)
+
+    assert time.time() - t0 < 0.5
+
+
+def test_probe_of_slow_dropped_node_does_not_block_other_requests(stubs):
+    live, slow = stubs
+    slow.delay = 0.8
+    client = QClient([live.url, slow.url], trust_env=False)
+    client._drop_node(slow.url)
+    probe = threading.Thread(target=client._test_dropped_nodes)
+    probe.start()
+    time.sleep(0.1)
+
+    # Also checks the dropped nodes, the one being probed is skipped
+    t0 = time.time()
+    assert client.get('k', {}) is None
+    elapsed = time.time() - t0
+    probe.join()
+
+    assert elapsed < 0.3
+    assert client.failing_nodes == set()
+    assert client.statistics[slow.url]['resurrections'] == 1
+
+
+def test_wait_for_concurrency_slot_respects_deadline(stub):
+    stub.delay = 0.5
+    client = QClient([stub.url], trust_env=False, concurrency_limiter=AIMDLimiter(initial_limit=1, max_wait=5.0))
+    thread = threading.Thread(target=client.get, args=('k', {}))
+    thread.start()
+    time.sleep(0.1)
+
+    t0 = time.time()
+    with pytest.raises(DeadlineExceeded):
+        client.get('k', {}, timeout=0.1)
+    elapsed = time.time() - t0
+    thread.join()
+
+    assert elapsed < 0.3
+
+
+def wait_for(condition, timeout=2.0):
+    end = time.time() + timeout
+    while not condition():
+        assert time.time() < end, 'Condition not met in time'
+        time.sleep(0.01)
+
+
+def test_registered_dataset_refreshed_periodically(stub):
+    client = QClient([stub.url], trust_env=False)
+    loads = []
+
+    def load():
+        loads.append(1)
+        return json.dumps(ROWS)
+
+    client.register_refresh('k', load, refresh_interval=0.1, content_type='application/json')
+    wait_for(lambda: len(loads) >= 3)
+    client.close()
+
+    assert 'k' in stub.datasets
+    assert client.statistics[stub.url]['refreshes'] >= 2
+    assert client.statistics[stub.url]['refresh_failures'] == 0
+
+
+def test_evicted_registered_dataset_reloaded(stub):
+    client = QClient([stub.url], trust_env=False)
+    loads = []
+
+    def load():
+        loads.append(1)
+        return json.dumps(ROWS)
+
+    client.register_refresh('k', load, refresh_interval=60, check_interval=0.05, content_type='application/json')
+    wait_for(lambda: 'k' in stub.datasets)
+    del stub.datasets['k']
+    wait_for(lambda: 'k' in stub.datasets)
+    client.close()
+
+    assert len(loads) == 2
+    assert client.query('k', {}, load, content_type='application/json') is not None
+    assert len(loads) == 2
+
+
+def test_replicated_post_succeeds_with_replica_down_by_default(stub):
+    dead = 'http://127.0.0.1:1'
+    client = QClient([stub.url, dead], trust_env=False, replication_factor=2)
+
+    client.post('k', json.dumps(ROWS), content_type='application/json')
+
+    assert 'k' in stub.datasets
+    assert client.failing_nodes == set([dead])
+
+
+@pytest.mark.parametrize('write_quorum', [None, 2])
+def test_replicated_post_with_replica_rejecting_upload(stubs, write_quorum):
+    healthy, failing = stubs
+    failing.fixed_status = 500
+    client = QClient([stub.url for stub in stubs], trust_env=False, replication_factor=2, write_quorum=write_quorum)
+
+    if write_quorum == 2:
+        with pytest.raises(UnexpectedServerResponse):
+            client.post('k', json.dumps(ROWS), content_type='application/json')
+    else:
+        client.post('k', json.dumps(ROWS), content_type='application/json')
+
+    assert 'k' in healthy.datasets
+    assert client.statistics[failing.url]['unknown_error'] == 1
+
+
+class _CountingUploads(dict):
+    def __init__(self):
+        super(_CountingUploads, self).__init__()
+        self.uploads = 0
+
+    def __setitem__(self, key, value):
+        self.uploads += 1
+        super(_CountingUploads, self).__setitem__(key, value)
+
+
+def test_replicated_post_retried_only_on_missing_replicas(stubs):
+    dead = 'http://127.0.0.1:1'
+    for stub in stubs:
+        stub._server.datasets = _CountingUploads()
+    client = QClient([stub.url for stub in stubs] + [dead], trust_env=False, replication_factor=2, write_quorum=2)
+    key = next(key for key in (str(i) for i in range(100)) if dead in client.node_ring.get_nodes(key, 2))
+
+    client.post(key, json.dumps(ROWS), content_type='application/json')
+
+    assert client.failing_nodes == set([dead])
+    assert [stub.datasets.uploads for stub in stubs] == [1, 1]
+
+
+@pytest.fixture
+def short_url_stub():
+    stub = StubQCache(max_url_length=500).start()
+    stub.datasets['k'] = ('application/json', json.dumps(ROWS).encode('utf-8'))
+    yield stub
+    stub.stop()
+
+
+def in_query(count):
+    return {'where': ['in', 'foo', ['value{0}'.format(i) for i in range(count)]]}
+
+
+def test_long_query_executed_using_post(short_url_stub):
+    client = QClient([short_url_stub.url], trust_env=False, post_query_threshold=200)
+    q = in_query(50)
+
+    # Rejected as too long when forced to use GET
+    with pytest.raises(UnexpectedServerResponse):
+        client.get('k', q, post_query=False)
+
+    result = client.get('k', q)
+
+    assert json.loads(result.content.decode('utf-8')) == ROWS
+    assert client.statistics[short_url_stub.url]['get_too_long'] == 0
+
+
+def test_get_rejected_as_too_long_retried_using_post(short_url_stub):
+    node = short_url_stub.url
+    client = QClient([node], trust_env=False)
+    q = in_query(50)
+
+    result = client.get('k', q)
+
+    assert json.loads(result.content.decode('utf-8')) == ROWS
+    assert client.statistics[node]['get_too_long'] == 1
+    assert client._get_length_limits == {node: len(json.dumps(q))}
+
+    # Queries at least as long use POST directly, shorter ones still use GET
+    for q in (in_query(50), in_query(60), in_query(1)):
+        result = client.get('k', q)
+        assert json.loads(result.content.decode('utf-8')) == ROWS
+
+    assert client.statistics[node]['get_too_long'] == 1
+    assert not client._use_post_query(node, json.dumps(in_query(1)), None)
+
+
+def test_evicted_dataset_uploaded_from_spill_cache(stub, tmpdir):
+    client = QClient([stub.url], trust_env=False, spill_cache=SpillCache(str(tmpdir)))
+    loads = []
+
+    def load(day):
+        loads.append(day)
+        return json.dumps(ROWS)
+
+    for _ in range(2):
+        result = client.query('k', {}, load, load_fn_kwargs={'day': 1}, content_type='application/json')
+        assert json.loads(result.content.decode('utf-8')) == ROWS
+        del stub.datasets['k']
+
+    result = client.query('k', {}, load, load_fn_kwargs={'day': 1}, content_type='application/json')
+
+    assert json.loads(result.content.decode('utf-8')) == ROWS
+    assert stub.datasets['k'] == ('application/json', json.dumps(ROWS).encode('utf-8'))
+    assert loads == [1]
+    assert client.statistics[stub.url]['spill_hits'] == 2
+
+    # Other load function arguments are loaded
+    client.query('k2', {}, load, load_fn_kwargs={'day': 2}, content_type='application/json')
+    assert loads == [1, 2]
+
+
+def test_set_node_weight_moves_keys_to_node(stubs):
+    light, heavy = [stub.url for stub in stubs]
+    client = QClient([light, heavy], trust_env=False)
+    keys = [str(i) for i in range(500)]
+    before = dict((key, client.node_ring.get_node(key)) for key in keys)
+
+    client.set_node_weight(heavy, 2)
+    after = dict((key, client.node_ring.get_node(key)) for key in keys)
+
+    moved = [key for key in keys if before[key] != after[key]]
+    assert moved
+    assert all(after[key] == heavy for key in moved)
+    result = client.query(moved[0], {}, lambda: json.dumps(ROWS), content_type='application/json')
+    assert json.loads(result.content.decode('utf-8')) == ROWS
+    assert moved[0] in stubs[1].datasets
+
+    # The weight is kept when the node is dropped and resurrected
+    client._drop_node(heavy)
+    client._test_dropped_nodes()
+    assert dict((key, client.node_ring.get_node(key)) for key in keys) == after
+
+
+def test_update_weights_from_status(stubs):
+    small, large = [stub.url for stub in stubs]
+    client = QClient([small, large], trust_env=False)
+    capacities = {small: 100, large: 300}
+
+    def capacity(response):
+        return next((c for node, c in capacities.items() if response.url.startswith(node)), None)
+
+    assert client.update_weights_from_status(capacity) == {small: 0.5, large: 1.5}
+    assert client.node_ring.sorted_keys == NodeRing([small, large], weights={small: 0.5, large: 1.5}).sorted_keys
+
+    # Nodes without a known capacity keep their weight
+    del capacities[large]
+    assert client.update_weights_from_status(capacity) == {small: 1.0}
+    assert client.weights == {small: 1.0, large: 1.5}
+
+    # As do nodes for which the capacity cannot be determined
+    def failing_capacity(response):
+        if response.url.startswith(small):
+            time.sleep(0.1)
+            raise StopIteration()
+        return 200
+
+    assert client.update_weights_from_status(failing_capacity) == {large: 1.0}
+    assert client.weights == {small: 1.0, large: 1.0}
@@ -0,0 +1,52 @@
+import zlib
+
+import pytest
+
+from qclient import QueryResult, UnsupportedEncoding, register_decoder
+from qclient import decoding
+from qclient.pipelining import _decompress
+
+
+def result(content, content_type, encoding=None):
+    return QueryResult.from_content(content, 1, encoding=encoding, content_type=content_type)
+
+
+def test_decode_json_and_csv():
+    assert result(b'[{"foo": 1.5}]', 'application/json; charset=UTF-8').decode() == [{'foo': 1.5}]
+    assert result(b'foo,bar\r\n1.5,a\r\n', 'text/csv').decode() == [{'foo': '1.5', 'bar': 'a'}]
+
+
+def test_decode_lz4():
+    lz4_block = pytest.importorskip('lz4.block')
+    query_result = result(lz4_block.compress(b'[{"foo": 1}]'), 'application/json', encoding='lz4')
+
+    assert query_result.decompress() == b'[{"foo": 1}]'
+    assert query_result.decode() == [{'foo': 1}]
+
+
+def test_unknown_content_type_and_encoding():
+    with pytest.raises(UnsupportedEncoding):
+        result(b'', 'application/x-unknown').decode()
+
+    with pytest.raises(UnsupportedEncoding):
+        result(b'', 'application/json', encoding='br').decode()
+
+
+def test_registered_decoder():
+    register_decoder('application/x-lines', lambda content: content.splitlines())
+    try:
+        assert result(b'a\nb', 'application/x-lines').decode() == [b'a', b'b']
+    finally:
+        decoding._DECODERS.pop('application/x-lines')
+
+
+def test_accept_encoding_leaves_out_lz4_if_not_installed(monkeypatch):
+    monkeypatch.setattr(decoding, 'lz4_available', lambda: False)
+    assert decoding.accept_encoding(['lz4', 'gzip']) == 'gzip'
+
+
+def test_pipelined_responses_decompressed():
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    assert _decompress(compressor.compress(b'[1]') + compressor.flush(), 'gzip') == b'[1]'
+    assert _decompress(zlib.compress(b'[1]'), 'deflate') == b'[1]'
+    assert _decompress(b'[1]', None) == b'[1]'
@@ -0,0 +1,28 @@
+import subprocess
+import sys
+
+import pytest
+
+import qclient
+
+
+def loaded_modules(statement):
+    code = '{statement}; import sys; print(" ".join(sorted(sys.modules)))'.format(statement=statement)
+    return subprocess.check_output([sys.executable, '-c', code]).decode('utf-8').split()
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason='Names are imported eagerly before Python 3.7')
+def test_import_does_not_load_requests():
+    assert 'requests' not in loaded_modules('import qclient')
+    assert 'requests' not in loaded_modules('from qclient import NoCacheAvailable, NodeRing')
+
+
+def test_client_loaded_on_first_use():
+    assert 'requests' in loaded_modules('from qclient import QClient')
+
+
+def test_public_names_available():
+    for name in qclient.__all__:
+        assert getattr(qclient, name) is not None
+
+    assert issubclass(qclient.NoCacheAvailable, qclient.QClientException)
@@ -0,0 +1,38 @@
+from qclient.latency import LatencyEstimate, TimeoutPolicy
+
+
+def test_latency_estimate_converges():
+    estimate = LatencyEstimate()
+    for _ in range(100):
+        estimate.add(0.01)
+
+    assert abs(estimate.mean - 0.01) < 1e-6
+    assert estimate.deviation < 1e-4
+
+
+def test_static_timeouts_when_not_adaptive():
+    policy = TimeoutPolicy(1.0, 2.0)
+    policy.record('node', 'get', 0.001)
+
+    assert policy.timeout_for('node', 'get') == (1.0, 2.0)
+    assert policy.timeout_for('node', 'post', 1000) == (1.0, 20.0)
+
+
+def test_adaptive_timeouts_follow_latency_within_bounds():
+    policy = TimeoutPolicy(1.0, 2.0, adaptive=True, min_read_timeout=0.05, max_read_timeout=5.0, min_samples=5)
+    for _ in range(4):
+        policy.record('node', 'get', 0.2)
+
+    # Not enough samples yet
+    assert policy.read_timeout_for('node', 'get') == 2.0
+
+    policy.record('node', 'get', 0.2)
+    assert 0.2 < policy.read_timeout_for('node', 'get') < 1.0
+    assert policy.read_timeout_for('other_node', 'get') == 2.0
+
+    for _ in range(5):
+        policy.record('node', 'post', 1.0, size=1000)
+
+    assert 1.0 < policy.read_timeout_for('node', 'post', size=1000) < 5.0
+    assert policy.read_timeout_for('node', 'post', size=10 ** 6) == 5.0
+    assert policy.read_timeout_for('node', 'post', size=1) == 0.05
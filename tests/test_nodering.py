@@ -1,7 +1,9 @@
+import json
 from collections import defaultdict
 import random
 import string
 import pytest
+from qclient import QClient
 from qclient.node_ring import NodeRing
 
 
@@ -62,3 +64,160 @@ def test_get_node_no_nodes_available():
     ring.remove_node('12345')
 
     assert ring.get_node('12345') is None
+
+
+def test_get_nodes_returns_distinct_successors():
+    ring = NodeRing(['aaa', 'bbb', 'ccc'])
+    for s in (str(i) for i in range(100)):
+        nodes = ring.get_nodes(s, 2)
+        assert len(set(nodes)) == 2
+        assert nodes[0] == ring.get_node(s)
+
+    assert sorted(ring.get_nodes('abc', 5)) == ['aaa', 'bbb', 'ccc']
+
+
+def test_ring_built_on_first_lookup_and_shared():
+    first = NodeRing(['aaa', 'bbb'])
+    second = NodeRing(['aaa', 'bbb'])
+    assert first._state is None
+
+    first.get_node('abc')
+    second.get_node('abc')
+    assert first.sorted_keys is second.sorted_keys
+
+    # Modifications are not visible to other rings
+    second.remove_node('aaa')
+    assert set(first.ring.values()) == set(['aaa', 'bbb'])
+    assert set(second.ring.values()) == set(['bbb'])
+
+
+def test_ring_restored_from_snapshot():
+    ring = NodeRing(['aaa', 'bbb', 'ccc'], weights={'bbb': 2})
+    ring.remove_node('ccc')
+    snapshot = json.loads(json.dumps(ring.snapshot()))
+
+    restored = NodeRing.from_snapshot(snapshot)
+    assert restored.nodes() == ['aaa', 'bbb']
+    for s in (str(i) for i in range(1000)):
+        assert restored.get_node(s) == ring.get_node(s)
+
+    restored.add_node('ccc')
+    assert NodeRing(['aaa', 'bbb', 'ccc'], weights={'bbb': 2}).get_node('xyz') == restored.get_node('xyz')
+
+
+@pytest.mark.parametrize('snapshot_weights, snapshot_virtual_count, weights, used', [
+    ({'bbb': 2}, None, {'bbb': 2}, True),
+    ({'bbb': 2}, None, {'bbb': 2.0, 'aaa': 1}, True),
+    ({'bbb': 2}, None, {}, False),
+    ({}, None, {'bbb': 2}, False),
+    ({'bbb': 2}, 10, {'bbb': 2}, False),
+])
+def test_client_ring_snapshot_only_used_with_same_configuration(snapshot_weights, snapshot_virtual_count, weights,
+                                                               used):
+    nodes = ['aaa', 'bbb', 'ccc']
+    snapshot = NodeRing(nodes, weights=snapshot_weights, virtual_count=snapshot_virtual_count).snapshot()
+
+    client = QClient(nodes, weights=weights, ring_snapshot=snapshot)
+
+    # A ring restored from a snapshot is never built from the nodes
+    assert (client.node_ring._pending_nodes is None) == used
+    assert client.node_ring.sorted_keys == NodeRing(nodes, weights=weights).sorted_keys
+
+
+def test_fractional_weights():
+    ring = NodeRing(['aaa', 'bbb'], weights={'bbb': 0.5})
+    distribution = defaultdict(int)
+    for s in (str(i) for i in range(30000)):
+        distribution[ring.get_node(s)] += 1
+
+    assert 18000 < distribution['aaa'] < 22000
+    assert 8000 < distribution['bbb'] < 12000
+
+
+def test_set_weight_only_moves_keys_to_or_from_node():
+    strings = [str(i) for i in range(10000)]
+    ring = NodeRing(['aaa', 'bbb', 'ccc'])
+    before = dict((s, ring.get_node(s)) for s in strings)
+
+    ring.set_weight('bbb', 1.5)
+    after = dict((s, ring.get_node(s)) for s in strings)
+    assert all(after[s] == 'bbb' for s in strings if before[s] != after[s])
+    assert ring.sorted_keys == NodeRing(['aaa', 'bbb', 'ccc'], weights={'bbb': 1.5}).sorted_keys
+
+    ring.set_weight('bbb', 0.5)
+    reduced = dict((s, ring.get_node(s)) for s in strings)
+    assert all(after[s] == 'bbb' for s in strings if reduced[s] != after[s])
+    assert ring.sorted_keys == NodeRing(['aaa', 'bbb', 'ccc'], weights={'bbb': 0.5}).sorted_keys
+
+
+def test_memoized_lookups_follow_ring_changes():
+    strings = [str(i) for i in range(200)]
+    ring = NodeRing(['aaa', 'bbb', 'ccc'], memo_size=100)
+    for s in strings:
+        ring.get_node(s)
+    assert len(ring._memo) == 100
+
+    version = ring.version
+    ring.remove_node('aaa')
+    assert ring.version > version
+    assert 'aaa' not in [node for _, node in ring._memo.values()]
+    reference = NodeRing(['bbb', 'ccc'], virtual_count=ring.virtual_count, memo_size=0)
+    assert [ring.get_node(s) for s in strings] == [reference.get_node(s) for s in strings]
+
+    ring.add_node('aaa')
+    ring.set_weight('bbb', 2)
+    reference = NodeRing(['aaa', 'bbb', 'ccc'], weights={'bbb': 2}, memo_size=0)
+    assert [ring.get_node(s) for s in strings] == [reference.get_node(s) for s in strings]
+    assert [ring.get_nodes(s, 2) for s in strings] == [reference.get_nodes(s, 2) for s in strings]
+
+
+@pytest.mark.parametrize('memo_size', [0, 1024])
+def test_lookups_concurrent_with_modifications(memo_size):
+    import threading
+    ring = NodeRing(['aaa', 'bbb', 'ccc'], memo_size=memo_size)
+    errors = []
+    done = []
+
+    def modify():
+        for i in range(200):
+            ring.remove_node('aaa')
+            ring.add_node('aaa', weight=1 + i % 3)
+            ring.set_weight('bbb', 1 + i % 2)
+        done.append(True)
+
+    def lookup():
+        try:
+            while not done:
+                for s in string.ascii_letters:
+                    assert ring.get_node(s) in ('aaa', 'bbb', 'ccc')
+                    ring.get_nodes(s, 2)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=lookup) for _ in range(4)] + [threading.Thread(target=modify)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    reference = NodeRing(['aaa', 'bbb', 'ccc'], weights={'aaa': 2, 'bbb': 2}, memo_size=0)
+    assert [ring.get_node(s) for s in string.ascii_letters] == [reference.get_node(s) for s in string.ascii_letters]
+
+
+def test_lookup_concurrent_with_node_removal_not_remembered():
+    ring = NodeRing(['aaa', 'bbb'])
+    key = next(s for s in string.ascii_letters if NodeRing(['aaa', 'bbb'], memo_size=0).get_node(s) == 'aaa')
+    lookup = ring._lookup
+
+    def lookup_during_removal(state, hashed_key):
+        node = lookup(state, hashed_key)
+        ring.remove_node('aaa')
+        return node
+
+    ring._lookup = lookup_during_removal
+    assert ring.get_node(key) == 'aaa'
+    del ring._lookup
+
+    assert 'aaa' not in ring
+    assert ring.get_node(key) == 'bbb'
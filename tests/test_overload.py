@@ -0,0 +1,61 @@
+import threading
+import time
+
+from qclient.overload import AIMDLimiter, RetryBudget
+
+
+def test_limiter_rejects_requests_over_limit():
+    limiter = AIMDLimiter(initial_limit=2)
+    assert limiter.acquire('node')
+    assert limiter.acquire('node')
+    assert not limiter.acquire('node')
+    assert limiter.acquire('other_node')
+    assert limiter.state('node') == {'concurrency_limit': 2, 'in_flight': 2}
+
+
+def test_limiter_waits_for_free_slot():
+    limiter = AIMDLimiter(initial_limit=1, max_wait=1.0)
+    assert limiter.acquire('node')
+    timer = threading.Timer(0.05, limiter.release, args=('node',))
+    timer.start()
+
+    t0 = time.time()
+    assert limiter.acquire('node')
+    assert time.time() - t0 < 0.9
+
+
+def test_limiter_increases_additively_and_decreases_multiplicatively():
+    limiter = AIMDLimiter(initial_limit=4, min_limit=1, max_limit=6)
+    for _ in range(4):
+        limiter.acquire('node')
+        limiter.release('node')
+
+    assert limiter.state('node')['concurrency_limit'] == 4
+
+    for _ in range(100):
+        limiter.acquire('node')
+        limiter.release('node')
+
+    assert limiter.state('node')['concurrency_limit'] == 6
+
+    limiter.acquire('node')
+    limiter.release('node', overloaded=True)
+    assert limiter.state('node')['concurrency_limit'] == 3
+
+    for _ in range(5):
+        limiter.acquire('node')
+        limiter.release('node', overloaded=True)
+
+    assert limiter.state('node')['concurrency_limit'] == 1
+
+
+def test_retry_budget():
+    budget = RetryBudget(ratio=0.5, min_retries_per_second=0.0, max_tokens=2.0)
+    assert budget.try_withdraw()
+    assert budget.try_withdraw()
+    assert not budget.try_withdraw()
+
+    budget.deposit()
+    assert not budget.try_withdraw()
+    budget.deposit()
+    assert budget.try_withdraw()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import csv
+import io
+import json
+import sys
+
+import pytest
+
+from qclient.partition import merge_results, partition_key, partition_query, split_content
+
+
+def csv_rows(part):
+    return list(csv.reader(io.BytesIO(part) if sys.version_info[0] == 2 else io.StringIO(part)))
+
+
+def test_split_json_round_robin():
+    rows = [{'foo': i} for i in range(10)]
+    parts = [json.loads(p) for p in split_content(json.dumps(rows), 3, content_type='application/json')]
+
+    assert [len(p) for p in parts] == [4, 3, 3]
+    assert sorted(r['foo'] for p in parts for r in p) == list(range(10))
+
+
+def test_split_csv_by_column_keeps_equal_values_together():
+    content = "foo,bar\r\n" + "".join("{0},{1}\r\n".format(i % 4, i) for i in range(100))
+    parts = split_content(content, 3, partition_column='foo')
+
+    seen = {}
+    for index, part in enumerate(parts):
+        rows = csv_rows(part)
+        assert rows[0] == ['foo', 'bar']
+        for foo, _ in rows[1:]:
+            assert seen.setdefault(foo, index) == index
+
+    assert sorted(seen) == ['0', '1', '2', '3']
+
+
+def test_split_non_ascii_csv():
+    content = u'foo,bar\r\n' + u''.join(u'{0},{1}\r\n'.format(name, i) for i, name in enumerate([u'åäö', u'abc'] * 5))
+    parts = split_content(content.encode('utf-8'), 2, partition_column='foo')
+
+    rows = [row for part in parts for row in csv_rows(part)[1:]]
+    assert sorted(row[1] for row in rows) == sorted(str(i) for i in range(10))
+    assert all(len(csv_rows(part)) in (1, 6, 11) for part in parts)
+
+
+def test_partition_key():
+    assert partition_key('abc', 1, 4) == 'abc_p1of4'
+
+
+def test_partition_query_moves_slicing_to_client():
+    assert partition_query({'order_by': ['foo'], 'offset': 5, 'limit': 10}) == {'order_by': ['foo'], 'limit': 15}
+    assert partition_query({'select': [['sum', 'bar']], 'group_by': ['foo'], 'order_by': ['foo'], 'limit': 1}) == \
+        {'select': [['sum', 'bar']], 'group_by': ['foo']}
+
+
+def test_partition_query_rejects_unmergeable_queries():
+    with pytest.raises(ValueError):
+        partition_query({'select': [['mean', 'bar']], 'group_by': ['foo']})
+
+    with pytest.raises(ValueError):
+        partition_query({'from': {'select': ['foo']}})
+
+
+def test_merge_ordered_and_sliced():
+    rows, unsliced_len = merge_results({'order_by': ['-foo'], 'offset': 1, 'limit': 2},
+                                       [[{'foo': 5}, {'foo': 1}], [{'foo': 4}, {'foo': 3}]],
+                                       [7, 2])
+
+    assert rows == [{'foo': 4}, {'foo': 3}]
+    assert unsliced_len == 9
+
+
+def test_merge_aggregates():
+    q = {'select': ['foo', ['sum', 'bar'], ['max', 'baz']], 'group_by': ['foo'], 'order_by': ['foo']}
+    rows, unsliced_len = merge_results(q,
+                                       [[{'foo': 'b', 'bar': 1, 'baz': 3}, {'foo': 'a', 'bar': 2, 'baz': 1}],
+                                        [{'foo': 'a', 'bar': 5, 'baz': 7}]],
+                                       [2, 1])
+
+    assert rows == [{'foo': 'a', 'bar': 7, 'baz': 7}, {'foo': 'b', 'bar': 1, 'baz': 3}]
+    assert unsliced_len == 2
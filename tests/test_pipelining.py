@@ -0,0 +1,137 @@
+import json
+import threading
+
+import pytest
+
+from qclient import QClient, PreparedQuery, Param
+from qclient.recording import Recorder, read_recording
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlparse
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlparse
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.connections.add(self.client_address)
+        self.server.accept_types.append(self.headers['Accept'])
+        url = urlparse(self.path)
+        key = url.path.rsplit('/', 1)[-1]
+        if self.headers['Accept'] != 'application/json':
+            body = b''
+            self.send_response(406)
+        elif key == 'missing':
+            body = b''
+            self.send_response(404)
+        else:
+            body = json.dumps({'key': key, 'q': json.loads(parse_qs(url.query)['q'][0])}).encode('utf-8')
+            self.send_response(200)
+            self.send_header('X-QCache-unsliced-length', '1')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _HTTP11Handler(_Handler):
+    protocol_version = 'HTTP/1.1'
+
+
+class _HTTP10Handler(_Handler):
+    protocol_version = 'HTTP/1.0'
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture(params=[_HTTP11Handler, _HTTP10Handler], ids=['HTTP/1.1', 'HTTP/1.0'])
+def server(request):
+    server = _Server(('127.0.0.1', 0), request.param)
+    server.connections = set()
+    server.accept_types = []
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_get_many_returns_results_in_order(server):
+    node = 'http://127.0.0.1:{port}'.format(port=server.server_address[1])
+    client = QClient([node], trust_env=False)
+    prepared = PreparedQuery({'limit': Param('limit')})
+    queries = [('key{i}'.format(i=i), {'offset': i}) for i in range(50)]
+    queries += [('missing', {}), ('bound', prepared.bind(limit=3))]
+
+    results = client.get_many(queries)
+
+    assert [json.loads(result.content.decode('utf-8')) for result in results[:50]] == \
+        [{'key': key, 'q': q} for key, q in queries[:50]]
+    assert results[50] is None
+    assert json.loads(results[51].content.decode('utf-8')) == {'key': 'bound', 'q': {'limit': 3}}
+    assert client.statistics[node]['pipelined_gets'] == 52
+    assert client.statistics[node]['pipeline_errors'] == 0
+    if server.RequestHandlerClass.protocol_version == 'HTTP/1.1':
+        # All queries sent over the same connection
+        assert len(server.connections) == 1
+
+
+def test_get_many_without_pipelining(server):
+    node = 'http://127.0.0.1:{port}'.format(port=server.server_address[1])
+    client = QClient([node], trust_env=False)
+
+    results = client.get_many([('key1', {}), ('key2', {})], pipeline=False)
+
+    assert [json.loads(result.content.decode('utf-8'))['key'] for result in results] == ['key1', 'key2']
+    assert client.statistics[node]['pipelined_gets'] == 0
+
+
+def test_fallback_to_supported_accept_type(server):
+    node = 'http://127.0.0.1:{port}'.format(port=server.server_address[1])
+    client = QClient([node], trust_env=False)
+    accept = ['application/x-unsupported', 'application/json']
+
+    assert client.get('key1', {}, accept=accept) is not None
+    assert client.get_many([('key2', {}), ('key3', {})], accept=accept)[1] is not None
+
+    # The rejected type is remembered and not asked for again
+    assert server.accept_types == ['application/x-unsupported', 'application/json',
+                                   'application/json', 'application/json']
+
+
+def test_pipelined_queries_recorded(server, tmpdir):
+    node = 'http://127.0.0.1:{port}'.format(port=server.server_address[1])
+    path = str(tmpdir.join('recording.jsonl'))
+    client = QClient([node], trust_env=False, recorder=Recorder(path))
+
+    client.get_many([('key1', {'limit': 1}), ('key2', {}), ('missing', {})])
+    client.recorder.close()
+
+    entries = sorted(read_recording(path), key=lambda entry: entry['key'])
+    assert client.statistics[node]['pipelined_gets'] == 3
+    assert [(entry['key'], entry['q'], entry['status']) for entry in entries] == \
+        [('key1', {'limit': 1}, 200), ('key2', {}, 200), ('missing', {}, 404)]
+    assert len(set(entry['latency'] for entry in entries)) == 1
+
+
+def test_pipelined_queries_counted_in_key_statistics(server):
+    node = 'http://127.0.0.1:{port}'.format(port=server.server_address[1])
+    client = QClient([node], trust_env=False)
+
+    client.get_many([('key1', {}), ('key1', {'limit': 1}), ('missing', {})])
+
+    statistics = dict((s['key'], s) for s in client.get_key_statistics())
+    assert client.statistics[node]['pipelined_gets'] == 3
+    assert statistics['key1']['queries'] == 2
+    assert statistics['key1']['misses'] == 0
+    assert statistics['missing']['queries'] == 1
+    assert statistics['missing']['misses'] == 1
@@ -0,0 +1,43 @@
+import json
+
+try:
+    from urllib.parse import parse_qs
+except ImportError:
+    from urlparse import parse_qs
+
+from qclient import Param, PreparedQuery
+
+
+def test_bound_query_equals_serialized_query():
+    prepared = PreparedQuery({'select': ['foo'],
+                              'where': ['&', ['==', 'bar', Param('bar')], ['in', 'baz', Param('baz')]],
+                              'limit': Param('limit')})
+
+    bound = prepared.bind(bar="a'b", baz=[1, 2, 3], limit=10)
+    assert json.loads(bound.json) == {'select': ['foo'],
+                                      'where': ['&', ['==', 'bar', "a'b"], ['in', 'baz', [1, 2, 3]]],
+                                      'limit': 10}
+    assert json.loads(parse_qs(bound.query_string)['q'][0]) == json.loads(bound.json)
+
+
+def test_params_bound_by_name_whatever_the_serialization_order():
+    # Dicts are walked and serialized in different orders on some Python versions
+    prepared = PreparedQuery(dict(('col{0}'.format(i), Param('p{0}'.format(i))) for i in range(30)))
+
+    bound = prepared.bind(**dict(('p{0}'.format(i), i) for i in range(30)))
+    assert json.loads(bound.json) == dict(('col{0}'.format(i), i) for i in range(30))
+
+
+def test_query_without_params():
+    prepared = PreparedQuery({'select': ['foo']})
+    assert json.loads(prepared.bind().json) == {'select': ['foo']}
+
+
+def test_bound_queries_cached():
+    prepared = PreparedQuery({'where': ['==', 'bar', Param('bar')]}, cache_size=2)
+    first = prepared.bind(bar=1)
+    assert prepared.bind(bar=1) is first
+    assert prepared.bind(bar=2) is not first
+
+    prepared.bind(bar=3)
+    assert prepared.bind(bar=1) is not first
@@ -1,5 +1,6 @@
 import json
 import os
+import pickle
 import random
 import string
 import time
@@ -8,7 +9,8 @@ import signal
 
 import requests
 
-from qclient import QClient, NoCacheAvailable, NodeRing, TooManyConsecutiveErrors, UnexpectedServerResponse
+from qclient import QClient, QueryResult, DeadlineExceeded, NoCacheAvailable, NodeRing, TooManyConsecutiveErrors, \
+    UnexpectedServerResponse
 
 # Version to test against
 QCACHE_VERSION = '0.9.3'
@@ -280,6 +282,42 @@ def test_delete(qcache_factory):
     assert client.get(key, q={}) is None
 
 
+def test_delete_everywhere(qcache_factory):
+    qcache_factory.spawn_caches('2222', '2223')
+    nodes = ['http://localhost:2222', 'http://localhost:2223']
+    client = QClient(nodes)
+    content = data_source('foo')
+    key = '12345'
+
+    # Store a copy of the data on each node
+    for node in nodes:
+        QClient([node]).post(key, content, content_type='application/json')
+
+    outcomes = client.delete(key, everywhere=True)
+    assert sorted(outcomes) == nodes
+    for node in nodes:
+        assert QClient([node]).get(key, q={}) is None
+
+    outcomes = client.delete_many(['abc', 'def'], everywhere=True)
+    assert sorted(outcomes) == ['abc', 'def']
+    assert client.statistics['http://localhost:2222']['deletes'] == 3
+
+
+def test_replicated_post(qcache_factory):
+    qcache_factory.spawn_caches('2222', '2223')
+    nodes = ['http://localhost:2222', 'http://localhost:2223']
+    client = QClient(nodes, replication_factor=2, write_quorum=2)
+    key = '12345'
+
+    client.post(key, data_source('foo'), content_type='application/json')
+    for node in nodes:
+        assert QClient([node]).get(key, q={}) is not None
+
+    client.delete(key)
+    for node in nodes:
+        assert QClient([node]).get(key, q={}) is None
+
+
 def test_https(qcache_factory):
     qcache_factory.spawn_caches('2222', certfile='host.pem')
     nodes = ['https://localhost:2222']
@@ -348,6 +386,84 @@ def test_query_with_custom_query_header(qcache_factory):
     assert result_data == [{'foo': 'cba', 'bar': 123}, {'foo': 'abc', 'bar': 321}]
 
 
+def test_query_partitioned_dataset(qcache_factory):
+    qcache_factory.spawn_caches('2222', '2223')
+    client = QClient(['http://localhost:2222', 'http://localhost:2223'])
+    content = json.dumps([{'foo': 'abc'[i % 3], 'bar': i} for i in range(30)])
+
+    result = client.query_partitioned('test_key', q=dict(select=['foo', ['sum', 'bar']], group_by=['foo'], order_by=['foo']),
+                                      partition_count=4, load_fn=lambda: content, content_type='application/json',
+                                      partition_column='foo')
+
+    result_data = json.loads(result.content.decode('utf8'))
+    assert result_data == [{'foo': 'a', 'bar': 135}, {'foo': 'b', 'bar': 145}, {'foo': 'c', 'bar': 155}]
+
+    result = client.get_partitioned('test_key', q=dict(order_by=['-bar'], offset=1, limit=2), partition_count=4)
+    assert [r['bar'] for r in json.loads(result.content.decode('utf8'))] == [28, 27]
+    assert result.unsliced_result_len == 30
+
+
+def test_deadline_exceeded_before_request():
+    client = QClient(['http://localhost:2222'])
+    with pytest.raises(DeadlineExceeded):
+        client.get('test_key', q={}, timeout=0.0)
+
+    assert not client.failing_nodes
+
+
+def test_connection_pool_recreated_after_fork():
+    client = QClient(['http://localhost:2222'], trust_env=False)
+    session = client.session
+
+    # Pretend that the client was created in a parent process
+    client._pid = -1
+    client._check_fork()
+
+    assert client.session is not session
+    assert client.session.trust_env is False
+    assert client._pid == os.getpid()
+
+
+class FakeResponse(object):
+    def __init__(self, content, headers):
+        self.content = content
+        self.headers = headers
+
+
+def test_query_result_statistics_parsed_on_access():
+    result = QueryResult(FakeResponse(b'[1, 2]', {'X-QCache-unsliced-length': '2',
+                                                  'X-QCache-stats': 'query_duration=0.5, unsliced_length=2'}))
+
+    assert result._statistics is None
+    assert result.statistics == {'get_query_duration': 0.5, 'get_unsliced_length': 2.0}
+    result.add_stats({'get_duration': 1.0})
+    assert result.statistics['get_duration'] == 1.0
+    assert bytes(result.buffer) == b'[1, 2]'
+    assert not hasattr(result, '__dict__')
+
+
+def test_query_result_pickled():
+    result = QueryResult(FakeResponse(b'[1, 2]', {'X-QCache-unsliced-length': '2', 'X-QCache-stats': 'query_duration=0.5'}))
+
+    for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+        copy = pickle.loads(pickle.dumps(result, protocol))
+        assert (copy.content, copy.unsliced_result_len, copy.statistics) == (b'[1, 2]', 2, {'get_query_duration': 0.5})
+
+
+def test_query_deadline_exceeded_while_loading_data(qcache_factory):
+    qcache_factory.spawn_caches('2222')
+    client = QClient(['http://localhost:2222'])
+
+    def slow_data_source():
+        time.sleep(0.5)
+        return data_source('foo')
+
+    with pytest.raises(DeadlineExceeded):
+        client.query('test_key', q={}, load_fn=slow_data_source, content_type='application/json', timeout=0.3)
+
+    assert not client.failing_nodes
+
+
 def id_generator(size=6, chars=string.ascii_uppercase + string.digits):
     return ''.join(random.choice(chars) for _ in range(size))
 
@@ -0,0 +1,56 @@
+from qclient import QueryResult
+from qclient.recording import Recorder, compare, read_recording, replay
+
+
+class FakeClient(object):
+    def __init__(self):
+        self.queries = []
+
+    def get(self, key, q, accept='application/json', query_headers=None):
+        self.queries.append((key, q, accept, query_headers))
+        if key == 'missing':
+            return None
+        return QueryResult.from_content(b'[]', 0)
+
+
+def test_record_and_read(tmpdir):
+    path = str(tmpdir.join('recording.jsonl'))
+    recorder = Recorder(path)
+    recorder.record_get(2.0, 'key', {'limit': 1}, 'text/csv', {'X-Foo': 'bar'}, 0.01,
+                        result=QueryResult.from_content(b'a\n1\n', 1, statistics={'get_query_duration': 0.001}))
+    recorder.record_get(1.0, 'missing', {}, 'application/json', None, 0.02)
+    recorder.record_post(3.0, 'key', 'text/csv', 100, 0.5, error=ValueError())
+    recorder.close()
+
+    entries = read_recording(path)
+
+    assert [entry['time'] for entry in entries] == [1.0, 2.0, 3.0]
+    assert entries[0] == {'time': 1.0, 'op': 'get', 'key': 'missing', 'q': {}, 'accept': 'application/json',
+                          'status': 404, 'request_size': 2, 'latency': 0.02}
+    assert entries[1]['headers'] == {'X-Foo': 'bar'}
+    assert entries[1]['response_size'] == 4
+    assert entries[1]['stats'] == {'get_query_duration': 0.001}
+    assert entries[2]['status'] == 'ValueError'
+
+
+def test_sampling(tmpdir):
+    recorder = Recorder(str(tmpdir.join('recording.jsonl')), sample_rate=0.0)
+    assert not any(recorder.sample() for _ in range(100))
+    assert Recorder(str(tmpdir.join('other.jsonl')), sample_rate=1.0).sample()
+
+
+def test_replay_queries_and_compare():
+    entries = [{'time': 1.0, 'op': 'post', 'key': 'key', 'status': 201, 'latency': 0.1},
+               {'time': 1.0, 'op': 'get', 'key': 'key', 'q': {'limit': 1}, 'status': 200, 'latency': 0.1},
+               {'time': 1.01, 'op': 'get', 'key': 'missing', 'q': {}, 'accept': 'text/csv', 'status': 200,
+                'latency': 0.2}]
+    client = FakeClient()
+
+    replayed = replay(client, entries, rate=1.0, threads=2)
+
+    assert sorted(client.queries) == [('key', {'limit': 1}, 'application/json', None),
+                                      ('missing', {}, 'text/csv', None)]
+    comparison = compare(replayed)
+    assert comparison['count'] == 2
+    assert comparison['changed_outcomes'] == {(200, 404): 1}
+    assert [p for p, _, _ in comparison['percentiles']] == [50, 90, 99, 99.9]
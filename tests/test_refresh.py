@@ -0,0 +1,65 @@
+import time
+from collections import defaultdict
+
+from qclient.node_ring import NodeRing
+from qclient.refresh import RefreshAhead
+
+
+class FakeClient(object):
+    def __init__(self):
+        self.node_ring = NodeRing(['node'])
+        self.statistics = defaultdict(lambda: defaultdict(int))
+        self.datasets = {}
+
+    def get(self, key, q):
+        return self.datasets.get(key)
+
+    def post(self, key, content, content_type, post_headers):
+        if content is None:
+            raise Exception('Failed')
+        self.datasets[key] = content
+
+
+def wait_for(condition, timeout=2.0):
+    t0 = time.time()
+    while not condition():
+        assert time.time() - t0 < timeout
+        time.sleep(0.01)
+
+
+def test_dataset_refreshed_periodically_and_on_eviction():
+    client = FakeClient()
+    refresh = RefreshAhead(client)
+    loads = []
+
+    def load_fn(value):
+        loads.append(value)
+        return value
+
+    refresh.register('key', load_fn, refresh_interval=0.2, load_fn_kwargs={'value': 'data'}, check_interval=0.02)
+    try:
+        wait_for(lambda: client.datasets.get('key') == 'data')
+        assert len(loads) == 1
+
+        # Evicted datasets are reloaded on the next check
+        del client.datasets['key']
+        wait_for(lambda: 'key' in client.datasets)
+        assert len(loads) == 2
+
+        wait_for(lambda: len(loads) == 3)
+        assert client.statistics['node']['refreshes'] == 3
+        assert client.statistics['node']['refresh_duration'] > 0.0
+    finally:
+        refresh.stop()
+
+
+def test_refresh_failures_recorded():
+    client = FakeClient()
+    refresh = RefreshAhead(client)
+    refresh.register('key', lambda: None, refresh_interval=0.02)
+    try:
+        wait_for(lambda: client.statistics['node']['refresh_failures'] >= 2)
+        refresh.unregister('key')
+        assert 'key' not in client.datasets
+    finally:
+        refresh.stop()
@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import defaultdict
+
+from qclient.node_ring import NodeRing
+from qclient.rehoming import Rehomer
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, content=b''):
+        self.status_code = status_code
+        self.content = content
+
+
+class FakeClient(object):
+    def __init__(self):
+        self.statistics = defaultdict(lambda: defaultdict(int))
+        self.datasets = defaultdict(dict)
+        self.session = self
+        self.copy_allowed = threading.Event()
+        self.requested = []
+
+    def get(self, url, **kwargs):
+        self.requested.append(url)
+        self.copy_allowed.wait()
+        node, key = url.split('/', 1)
+        content = self.datasets[node].get(key)
+        return FakeResponse(200, content) if content else FakeResponse(404)
+
+    def post(self, url, data, **kwargs):
+        node, key = url.split('/', 1)
+        self.datasets[node][key] = data
+        return FakeResponse(201)
+
+    @staticmethod
+    def _key_url(node, key):
+        return node + '/' + key
+
+    def _request(self, node, operation, method, url, size=None, **kwargs):
+        return method(url, **kwargs)
+
+
+def test_displaced_keys_copied_back_to_resurrected_node():
+    nodes = ['aaa', 'bbb']
+    ring = NodeRing(nodes)
+    keys = [str(i) for i in range(20)]
+    displaced_keys = [k for k in keys if ring.get_node(k) == 'bbb']
+
+    client = FakeClient()
+    rehomer = Rehomer(client, nodes)
+    for key in keys:
+        client.datasets['aaa'][key] = b'data' + key.encode('utf-8')
+        rehomer.track(key, 'aaa', 'text/csv', None)
+
+    rehomer.node_resurrected('bbb')
+
+    # Routed to the temporary owner until copied
+    assert all(rehomer.route(key) == 'aaa' for key in displaced_keys)
+    assert all(rehomer.route(key) is None for key in keys if key not in displaced_keys)
+
+    client.copy_allowed.set()
+    for thread in threading.enumerate():
+        if thread.name == 'qclient-rehome':
+            thread.join()
+
+    assert all(rehomer.route(key) is None for key in keys)
+    assert sorted(client.datasets['bbb']) == sorted(displaced_keys)
+    assert client.statistics['bbb']['rehomed'] == len(displaced_keys)
+
+
+def test_upload_cancels_pending_copy():
+    nodes = ['aaa', 'bbb']
+    ring = NodeRing(nodes)
+    displaced_keys = [k for k in (str(i) for i in range(20)) if ring.get_node(k) == 'bbb'][:2]
+
+    client = FakeClient()
+    rehomer = Rehomer(client, nodes)
+    for key in displaced_keys:
+        client.datasets['aaa'][key] = b'old'
+        rehomer.track(key, 'aaa', 'text/csv', None)
+
+    rehomer.node_resurrected('bbb')
+    while not client.requested:
+        time.sleep(0.01)
+    in_progress = client.requested[0].split('/', 1)[1]
+    pending = [key for key in displaced_keys if key != in_progress][0]
+
+    # Not copied yet, the copy is skipped
+    rehomer.cancel(pending)
+    assert rehomer.route(pending) is None
+    client.datasets['bbb'][pending] = b'new'
+
+    # Being copied, wait for the copy to finish before uploading
+    cancel = threading.Thread(target=rehomer.cancel, args=(in_progress,))
+    cancel.start()
+    time.sleep(0.05)
+    assert cancel.is_alive()
+    client.copy_allowed.set()
+    cancel.join()
+    client.datasets['bbb'][in_progress] = b'new'
+
+    for thread in threading.enumerate():
+        if thread.name == 'qclient-rehome':
+            thread.join()
+
+    assert client.datasets['bbb'] == {pending: b'new', in_progress: b'new'}
+    assert client.statistics['bbb']['rehomed'] == 1
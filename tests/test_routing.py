@@ -0,0 +1,54 @@
+from qclient.node_ring import NodeRing
+from qclient.routing import BoundedLoadRouting, HashRouting, LeastLoadedRouting
+
+
+def test_hash_routing_selects_owner():
+    ring = NodeRing(['aaa', 'bbb', 'ccc'])
+    assert HashRouting().select(ring, 'foo', lambda node: 0) == [ring.get_node('foo')]
+    ring.remove_node(ring.get_node('foo'))
+    ring.remove_node(ring.get_node('foo'))
+    ring.remove_node(ring.get_node('foo'))
+    assert HashRouting().select(ring, 'foo', lambda node: 0) == []
+
+
+def test_least_loaded_routing_avoids_slow_node():
+    ring = NodeRing(['aaa', 'bbb', 'ccc'])
+    policy = LeastLoadedRouting(candidate_count=2)
+    for key in (str(i) for i in range(100)):
+        owner, successor = ring.get_nodes(key, 2)
+        nodes = policy.select(ring, key, lambda node: 10.0 if node == owner else 1.0)
+        assert nodes == [successor, owner]
+
+        # Prefer the owner when there is no difference
+        assert policy.select(ring, key, lambda node: 0.0) == [owner, successor]
+
+
+def test_bounded_load_routing_caps_load_per_node():
+    ring = NodeRing(['aaa', 'bbb', 'ccc'])
+    policy = BoundedLoadRouting(epsilon=0.25)
+    for key in (str(i) for i in range(300)):
+        policy.place(ring, key, 100)
+
+    loads = policy.loads()
+    assert sum(loads.values()) == 300 * 100
+    assert max(loads.values()) <= 1.25 * 10000 + 100
+
+
+def test_bounded_load_routing_sticky_assignments():
+    ring = NodeRing(['aaa', 'bbb', 'ccc'])
+    policy = BoundedLoadRouting(epsilon=0.1)
+    owner = ring.get_node('hot')
+
+    # Fill up the owner of the key so that the key overflows to a successor
+    big_key = next(k for k in (str(i) for i in range(1000)) if ring.get_node(k) == owner)
+    assert policy.place(ring, big_key, 1000) == owner
+    node = policy.place(ring, 'hot', 100)
+    assert node != owner
+    assert policy.select(ring, 'hot', lambda n: 0)[0] == node
+
+    # Re-uploads stay on the same node
+    assert policy.place(ring, 'hot', 100) == node
+
+    policy.forget('hot')
+    assert policy.select(ring, 'hot', lambda n: 0)[0] == owner
+    assert policy.loads() == {owner: 1000}
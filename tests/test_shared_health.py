@@ -0,0 +1,40 @@
+from qclient import QClient
+from qclient.shared_health import SharedNodeHealth
+
+NODES = ['http://localhost:2222', 'http://localhost:2223']
+
+
+def test_state_shared_between_instances(tmpdir):
+    path = str(tmpdir.join('health'))
+    first = SharedNodeHealth(path, NODES)
+    second = SharedNodeHealth(path, list(reversed(NODES)))
+    version = second.version()
+
+    first.mark_down(NODES[0])
+    assert second.down_nodes() == set([NODES[0]])
+    assert second.version() > version
+
+    second.mark_up(NODES[0])
+    assert first.down_nodes() == set()
+
+
+def test_dropped_node_probed_by_one_process_only(tmpdir):
+    path = str(tmpdir.join('health'))
+    first = SharedNodeHealth(path, NODES, probe_interval=60)
+    second = SharedNodeHealth(path, NODES, probe_interval=60)
+
+    assert first.claim_probe(NODES[0])
+    assert not second.claim_probe(NODES[0])
+    assert second.claim_probe(NODES[1])
+
+
+def test_client_drops_nodes_marked_down_by_other_process(tmpdir):
+    path = str(tmpdir.join('health'))
+    client = QClient(NODES, shared_health=SharedNodeHealth(path, NODES))
+    SharedNodeHealth(path, NODES).mark_down(NODES[0])
+
+    client._check_dropped_nodes()
+
+    # Not probed since the other process just found it to be down
+    assert client.failing_nodes == set([NODES[0]])
+    assert client.node_ring.get_nodes('some_key', 2) == [NODES[1]]
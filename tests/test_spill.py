@@ -0,0 +1,67 @@
+import os
+import time
+
+from qclient.spill import SpillCache
+
+
+def read_all(content):
+    reader = content.open()
+    assert len(reader) == len(content)
+    chunks = []
+    while True:
+        chunk = reader.read(3)
+        if not chunk:
+            return b''.join(chunks)
+        chunks.append(chunk)
+
+
+def test_spilled_content_read_from_start_by_each_reader(tmpdir):
+    cache = SpillCache(str(tmpdir))
+    assert cache.put('key', {'a': 1}, u'foo,bar\n1,2\n')
+
+    content = cache.get('key', {'a': 1})
+    assert read_all(content) == b'foo,bar\n1,2\n'
+    assert read_all(content) == b'foo,bar\n1,2\n'
+
+
+def test_entries_keyed_by_key_and_load_fn_kwargs(tmpdir):
+    cache = SpillCache(str(tmpdir))
+    cache.put('key', {'a': 1}, b'one')
+
+    assert cache.get('key', {'a': 2}) is None
+    assert cache.get('other_key', {'a': 1}) is None
+    assert read_all(cache.get('key', {'a': 1})) == b'one'
+
+
+def test_expired_entries_removed(tmpdir):
+    cache = SpillCache(str(tmpdir), ttl=10)
+    cache.put('key', None, b'data')
+    path = os.path.join(str(tmpdir), os.listdir(str(tmpdir))[0])
+    os.utime(path, (time.time() - 20, time.time() - 20))
+
+    assert cache.get('key') is None
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test_least_recently_used_entries_evicted(tmpdir):
+    cache = SpillCache(str(tmpdir), max_bytes=10)
+    cache.put('a', None, b'aaaa')
+    cache.put('b', None, b'bbbb')
+    cache.get('a')
+    cache.put('c', None, b'cccc')
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.get('c') is not None
+    assert not cache.put('d', None, b'd' * 11)
+
+
+def test_entries_shared_between_instances(tmpdir):
+    SpillCache(str(tmpdir)).put('key', None, b'data')
+    assert read_all(SpillCache(str(tmpdir)).get('key')) == b'data'
+
+
+def test_empty_content(tmpdir):
+    cache = SpillCache(str(tmpdir))
+    cache.put('key', None, b'')
+    assert read_all(cache.get('key')) == b''
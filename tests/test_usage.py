@@ -0,0 +1,66 @@
+from qclient import QClient, QueryResult
+from qclient.usage import KeyUsage
+
+
+def test_memory_bounded_and_heavy_hitters_kept():
+    usage = KeyUsage(capacity=10)
+    for i in range(10000):
+        usage.record_query('key{i}'.format(i=i), 0.001, found=True)
+        if i % 10 == 0:
+            usage.record_load('heavy', 0.01)
+
+    assert len(usage._usage) == 10
+    assert len(usage._heap) == 10
+    top = usage.top(1)[0]
+    assert top['key'] == 'heavy'
+    assert top['reloads'] == 1000
+    assert top['error'] == 0.0
+
+
+def test_evicted_cost_inherited_as_error():
+    usage = KeyUsage(capacity=2)
+    usage.record_query('a', 1.0, found=True)
+    usage.record_query('b', 2.0, found=False)
+    usage.record_query('c', 0.5, found=True)
+
+    statistics = dict((s['key'], s) for s in usage.top(10))
+    assert sorted(statistics) == ['b', 'c']
+    assert statistics['c']['error'] == 1.0
+    assert statistics['c']['cost'] == 1.5
+    assert statistics['c']['queries'] == 1
+    assert statistics['b']['miss_rate'] == 1.0
+
+
+def test_query_reloads_tracked():
+    client = QClient(['http://127.0.0.1:1'], trust_env=False)
+    stored = set()
+
+    def execute_get(key, q, accept, post_query, query_headers, deadline):
+        return QueryResult.from_content(b'[]', 0) if key in stored else None
+
+    def execute_post(key, content, content_type, post_headers, deadline):
+        stored.add(key)
+        return {}
+
+    client._execute_get = execute_get
+    client._execute_post = execute_post
+    for key in ('a', 'a', 'b'):
+        client.query(key, {}, lambda: b'[{"x": 1}]', content_type='application/json')
+    stored.clear()
+    client.query('a', {}, lambda: b'[{"x": 1}]', content_type='application/json')
+
+    statistics = dict((s['key'], s) for s in client.get_key_statistics(order_by='reloads'))
+    assert statistics['a']['queries'] == 5
+    assert statistics['a']['misses'] == 2
+    assert statistics['a']['miss_rate'] == 0.4
+    assert statistics['a']['reloads'] == 2
+    assert statistics['a']['uploads'] == 2
+    assert statistics['a']['upload_bytes'] == 20
+    assert statistics['b']['reloads'] == 1
+    assert client.get_key_statistics(top=1, order_by='reloads')[0]['key'] == 'a'
+
+
+def test_key_statistics_disabled():
+    client = QClient(['http://127.0.0.1:1'], trust_env=False, key_statistics_capacity=0)
+    assert client.key_usage is None
+    assert client.get_key_statistics() == []